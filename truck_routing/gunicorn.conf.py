@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration for serving truck_routing.asgi with uvicorn workers:
+
+    gunicorn truck_routing.asgi:application
+
+Gunicorn reads this file from the working directory. Settings come from
+the environment so a container can be sized without a rebuild.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Each worker is one event loop plus the thread Django runs ORM work on.
+# Route requests await OpenRouteService without holding either, so a worker
+# keeps up to OPENROUTE_POOL_SIZE of them in flight. Actions blocking on
+# ORS or slow queries run on BLOCKING_VIEW_THREADS threads of the worker
+# instead, so neither the loop nor the shared thread waits on them and one
+# worker per core is enough, with two so one busy worker can't hold up all
+# requests. Each worker holds up to BLOCKING_VIEW_THREADS + 1 database
+# connections, plus a batch's concurrency while one runs.
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count())))
+
+# A worker whose event loop is blocked for longer is restarted. Nothing is
+# meant to block it, blocking work runs on threads.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Restart workers after a number of requests, staggered so they don't all
+# restart at once, which bounds any slow growth in memory.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Route, BoundingBox, Feature, FeatureCollection, Metadata, Segment, Step, WayPoint, FeatureSummary
+from .models import Route, BoundingBox, Feature, FeatureCollection, Metadata, Segment, Step, FeatureSummary, RouteCacheEntry, RouteJob, MatrixCell
 
 class FeatureInline(admin.StackedInline):
     model = Feature
@@ -16,5 +16,7 @@ admin.site.register(FeatureCollection, FeatureCollectionAdmin)
 admin.site.register(Metadata)
 admin.site.register(Segment)
 admin.site.register(Step)
-admin.site.register(WayPoint)
 admin.site.register(FeatureSummary)
+admin.site.register(RouteCacheEntry)
+admin.site.register(RouteJob)
+admin.site.register(MatrixCell)
@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_blocking_executor():
+    # Threads of blocking actions, each with a database connection of its
+    # own, BLOCKING_VIEW_THREADS per process.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.BLOCKING_VIEW_THREADS,
+                                           thread_name_prefix='blocking-view')
+        return _executor
+
+
+def blocking(action):
+    """
+    Marks a plain action that blocks for long, on the routing backend or a
+    slow query, to run on a thread of its own under async dispatch rather
+    than the one a worker shares for all its ORM work.
+    """
+    action.blocking = True
+    return action
+
+
+def on_own_thread(handler):
+    # The handler as blocking actions run: with the thread's connection
+    # checked. Its queries count in the request, the context is copied over.
+    @functools.wraps(handler)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=get_blocking_executor())
+
+
+def dispatched_async(action):
+    return asyncio.iscoroutinefunction(action) or getattr(action, 'blocking', False)
+
+
+class AsyncViewSetMixin:
+    """
+    Lets a DRF viewset define actions as coroutines, or mark plain ones
+    @blocking. DRF only dispatches synchronously, so the router's view for
+    a mapping with such an action becomes an async Django view running
+    DRF's request cycle with the action awaited.
+
+    Authentication, permissions, throttling and exception handling can hit
+    the database and run through sync_to_async, as do the viewset's plain
+    actions. Under ASGI those share one thread per worker, while a
+    coroutine action awaiting the routing backend holds neither that thread
+    nor a connection, and a blocking action runs on a thread of its own.
+    """
+
+    # Set per instance by the async view.
+    async_dispatch = False
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        if not any(dispatched_async(getattr(cls, action, None)) for action in (actions or {}).values()):
+            return super().as_view(actions, **initkwargs)
+
+        view = super().as_view(actions, async_dispatch=True, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            # DRF's view only sets the instance up, dispatch returns a
+            # coroutine.
+            return await view(request, *args, **kwargs)
+
+        # Keeps csrf_exempt and what DRF and the router read off the view.
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_dispatch:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        # APIView.dispatch, awaiting coroutine handlers.
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            elif getattr(handler, 'blocking', False):
+                response = await on_own_thread(handler)(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = await sync_to_async(self.handle_exception)(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,26 @@
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_routing_backend():
+    """
+    The process wide backend selected by settings.ROUTING_BACKEND, "ors" to
+    call OpenRouteService or "local" for the in-process road graph.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if settings.ROUTING_BACKEND == 'local':
+                from .local import LocalBackend
+                _backend = LocalBackend.from_settings()
+            elif settings.ROUTING_BACKEND == 'ors':
+                from .ors import ORSBackend
+                _backend = ORSBackend()
+            else:
+                raise ImproperlyConfigured(f'Unknown ROUTING_BACKEND {settings.ROUTING_BACKEND!r}')
+        return _backend
@@ -0,0 +1,38 @@
+import asyncio
+
+
+class RoutingBackend:
+    """
+    Computes directions between two (lon, lat) points and returns them in
+    the GeoJSON shape ORS returns for GET /v2/directions/{profile}. Raises
+    routing.directions.DirectionsError when no route can be produced.
+
+    `vehicle` is a routing.vehicles.Vehicle or None for a car.
+    """
+
+    name = None
+    # Whether routes already respect the vehicle's limits, otherwise the
+    # planner checks them against the restriction index.
+    enforces_restrictions = False
+
+    def directions(self, start, end, profile, vehicle=None):
+        raise NotImplementedError
+
+    async def adirections(self, start, end, profile, vehicle=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.directions, start, end, profile, vehicle)
+
+    def directions_via(self, coordinates, profile, vehicle=None):
+        """
+        One route through every coordinate in order, with a segment per leg
+        and a way point per coordinate.
+        """
+        raise NotImplementedError
+
+    def matrix(self, locations, profile, vehicle=None, sources=None, destinations=None):
+        """
+        (durations, distances) from each source to each destination, indices
+        into `locations` (all of them by default), as rows per source in
+        seconds and metres, None where there is no route.
+        """
+        raise NotImplementedError
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from ..directions import DirectionsError
+from ..engine.graph import RoadGraph
+from ..engine.response import directions_response
+from ..engine.restrictions import edge_filter
+from ..engine.search import NoRoute, bidirectional_astar, one_to_many
+from .base import RoutingBackend
+
+
+class LocalBackend(RoutingBackend):
+    """
+    Routes on a road graph built by `manage.py build_road_graph`, held in
+    memory for the life of the process. The graph has no turn restrictions
+    or traffic, every profile is routed on the same edge durations. Trucks
+    are kept off edges whose height, weight, width, length or hazmat limits
+    they exceed.
+    """
+
+    name = 'local'
+    enforces_restrictions = True
+
+    def __init__(self, graph, snap_rings=10):
+        self.graph = graph
+        self.snap_rings = snap_rings
+
+    @classmethod
+    def from_settings(cls):
+        if not settings.ROAD_GRAPH_PATH:
+            raise ImproperlyConfigured('ROAD_GRAPH_PATH must be set to use the local routing backend')
+        return cls(RoadGraph.load(settings.ROAD_GRAPH_PATH))
+
+    def snap(self, lon_lat):
+        node = self.graph.nearest_node(lon_lat[0], lon_lat[1], max_rings=self.snap_rings)
+        if node is None:
+            # Same status ORS answers with for a point off the road network.
+            raise DirectionsError(f'Could not find a road near {lon_lat[0]},{lon_lat[1]}', status=404)
+        return node
+
+    def path(self, source, target, allowed):
+        try:
+            return bidirectional_astar(self.graph, source, target, allowed=allowed)
+        except NoRoute:
+            raise DirectionsError('Route could not be found between the given points', status=404)
+
+    def directions(self, start, end, profile, vehicle=None):
+        path = self.path(self.snap(start), self.snap(end), edge_filter(self.graph, vehicle))
+        if not path.edges:
+            raise DirectionsError('Start and end are the same point on the road network', status=404)
+        return directions_response(self.graph, [path], [start, end], profile)
+
+    def directions_via(self, coordinates, profile, vehicle=None):
+        nodes = [self.snap(coordinate) for coordinate in coordinates]
+        allowed = edge_filter(self.graph, vehicle)
+        paths = [self.path(source, target, allowed) for source, target in zip(nodes, nodes[1:])]
+        return directions_response(self.graph, paths, coordinates, profile)
+
+    def matrix(self, locations, profile, vehicle=None, sources=None, destinations=None):
+        nodes = [self.snap(location) for location in locations]
+        sources = range(len(nodes)) if sources is None else sources
+        targets = [nodes[index] for index in (range(len(nodes)) if destinations is None else destinations)]
+        allowed = edge_filter(self.graph, vehicle)
+        durations, distances = [], []
+        for source in sources:
+            reached = one_to_many(self.graph, nodes[source], targets, allowed)
+            durations.append([reached[node][0] if node in reached else None for node in targets])
+            distances.append([reached[node][1] if node in reached else None for node in targets])
+        return durations, distances
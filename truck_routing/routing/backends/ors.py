@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from ..directions import get_directions_client
+from .base import RoutingBackend
+
+
+def ors_options(vehicle):
+    return vehicle.ors_options() if vehicle is not None and vehicle.is_truck else None
+
+
+def merge_directions(responses):
+    """
+    Join directions responses for consecutive stretches of one trip, each
+    starting where the previous one ended, into a single response with all
+    their segments.
+    """
+    first = responses[0]
+    coordinates = []
+    segments = []
+    way_points = []
+    for response in responses:
+        feature = response['features'][0]
+        properties = feature['properties']
+        # The joining vertex is already there from the previous stretch.
+        offset = max(len(coordinates) - 1, 0)
+        skip = 1 if coordinates else 0
+        coordinates.extend(feature['geometry']['coordinates'][skip:])
+        way_points.extend(index + offset for index in properties['way_points'][skip:])
+        for segment in properties['segments']:
+            segments.append(dict(segment, steps=[
+                dict(step, way_points=[index + offset for index in step['way_points']])
+                for step in segment['steps']]))
+
+    bbox = [min(response['bbox'][0] for response in responses), min(response['bbox'][1] for response in responses),
+            max(response['bbox'][2] for response in responses), max(response['bbox'][3] for response in responses)]
+    summary = {'distance': round(sum(segment['distance'] for segment in segments), 1),
+               'duration': round(sum(segment['duration'] for segment in segments), 1)}
+    query = dict(first['metadata'].get('query', {}),
+                 coordinates=[coordinates[index] for index in way_points])
+
+    return {
+        'type': 'FeatureCollection',
+        'bbox': bbox,
+        'features': [{
+            'bbox': bbox,
+            'type': 'Feature',
+            'properties': {'segments': segments, 'summary': summary, 'way_points': way_points},
+            'geometry': {'coordinates': coordinates, 'type': 'LineString'},
+        }],
+        'metadata': dict(first['metadata'], query=query),
+    }
+
+
+def blocks(count, size):
+    return [range(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+class ORSBackend(RoutingBackend):
+    name = 'ors'
+
+    def directions(self, start, end, profile, vehicle=None):
+        return get_directions_client().directions(start, end, profile, options=ors_options(vehicle))
+
+    async def adirections(self, start, end, profile, vehicle=None):
+        return await get_directions_client().adirections(start, end, profile, options=ors_options(vehicle))
+
+    def directions_via(self, coordinates, profile, vehicle=None):
+        # Longer trips than the plan allows in one request are fetched in
+        # stretches sharing their end points and joined.
+        step = settings.OPENROUTE_MAX_WAYPOINTS - 1
+        client = get_directions_client()
+        responses = [client.directions_via(coordinates[start:start + step + 1], profile, ors_options(vehicle))
+                     for start in range(0, len(coordinates) - 1, step)]
+        return responses[0] if len(responses) == 1 else merge_directions(responses)
+
+    def matrix(self, locations, profile, vehicle=None, sources=None, destinations=None):
+        """
+        The sources x destinations block is split into tiles of at most
+        OPENROUTE_MATRIX_MAX_ELEMENTS cells, each request only carrying the
+        locations of its tile, and the tiles are fetched concurrently.
+        """
+        sources = list(range(len(locations)) if sources is None else sources)
+        destinations = list(range(len(locations)) if destinations is None else destinations)
+        durations = [[None] * len(destinations) for _ in sources]
+        distances = [[None] * len(destinations) for _ in sources]
+        # Whole rows where they fit, a single new location against many
+        # cached ones then only takes a request or two.
+        columns = min(len(destinations), settings.OPENROUTE_MATRIX_MAX_ELEMENTS)
+        rows = max(1, settings.OPENROUTE_MATRIX_MAX_ELEMENTS // columns)
+        client = get_directions_client()
+
+        def fetch(tile):
+            tile_rows, tile_columns = tile
+            tile_locations = ([locations[sources[row]] for row in tile_rows]
+                              + [locations[destinations[column]] for column in tile_columns])
+            result = client.matrix(tile_locations, profile, sources=range(len(tile_rows)),
+                                   destinations=range(len(tile_rows), len(tile_locations)))
+            return tile, result
+
+        tiles = [(tile_rows, tile_columns) for tile_rows in blocks(len(sources), rows)
+                 for tile_columns in blocks(len(destinations), columns)]
+        with ThreadPoolExecutor(max_workers=max(1, min(4, len(tiles)))) as executor:
+            for (tile_rows, tile_columns), result in executor.map(fetch, tiles):
+                for i, row in enumerate(tile_rows):
+                    for j, column in enumerate(tile_columns):
+                        durations[row][column] = result['durations'][i][j]
+                        distances[row][column] = result['distances'][i][j]
+        return durations, distances
@@ -0,0 +1,100 @@
+import math
+import random
+import resource
+import time
+import tracemalloc
+
+from ..engine.graph import RoadGraph
+from ..engine.search import NoRoute, bidirectional_astar
+from .timing import summarize
+
+METERS_PER_DEGREE = 111320.0
+
+
+def grid_graph(width=300, height=300, spacing=200.0, origin=(-97.0, 35.0), seed=0):
+    """
+    Two way grid of streets, every fifth street an arterial at twice the
+    speed, with jittered node positions and speeds so paths aren't all ties.
+    The default is 90,000 nodes and ~360,000 edges, about 60 x 60 km.
+    """
+    rng = random.Random(seed)
+    lon, lat = [], []
+    for row in range(height):
+        for column in range(width):
+            y = row * spacing + rng.uniform(-0.2, 0.2) * spacing
+            x = column * spacing + rng.uniform(-0.2, 0.2) * spacing
+            node_lat = origin[1] + y / METERS_PER_DEGREE
+            lat.append(node_lat)
+            lon.append(origin[0] + x / (METERS_PER_DEGREE * math.cos(math.radians(node_lat))))
+
+    names = ['']
+    edges = []
+
+    def connect(source, target, name, speed):
+        length = math.hypot((lon[target] - lon[source]) * METERS_PER_DEGREE * math.cos(math.radians(lat[source])),
+                            (lat[target] - lat[source]) * METERS_PER_DEGREE)
+        duration = length / (speed * rng.uniform(0.85, 1.0))
+        edges.append((source, target, length, duration, name))
+        edges.append((target, source, length, duration, name))
+
+    for row in range(height):
+        names.append(f'{row} Street')
+        for column in range(width - 1):
+            node = row * width + column
+            connect(node, node + 1, len(names) - 1, 25.0 if row % 5 == 0 else 12.0)
+    for column in range(width):
+        names.append(f'{column} Avenue')
+        for row in range(height - 1):
+            node = row * width + column
+            connect(node, node + width, len(names) - 1, 25.0 if column % 5 == 0 else 12.0)
+
+    return RoadGraph.from_edges(lon, lat, edges, names, meta={'source': f'grid {width}x{height}'})
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(graph, queries=200, seed=1, traced=20):
+    rng = random.Random(seed)
+    pairs = [(rng.randrange(graph.node_count), rng.randrange(graph.node_count)) for _ in range(queries)]
+
+    timings = []
+    settled = []
+    unreachable = 0
+    started = time.perf_counter()
+    for source, target in pairs:
+        query_started = time.perf_counter()
+        try:
+            path = bidirectional_astar(graph, source, target)
+        except NoRoute:
+            unreachable += 1
+            continue
+        finally:
+            timings.append(time.perf_counter() - query_started)
+        settled.append(path.settled)
+    elapsed = time.perf_counter() - started
+
+    # tracemalloc slows allocation down a lot, trace a few queries on their
+    # own instead of the timed ones.
+    tracemalloc.start()
+    for source, target in pairs[:traced]:
+        try:
+            bidirectional_astar(graph, source, target)
+        except NoRoute:
+            pass
+    _, search_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return dict(
+        summarize(timings),
+        nodes=graph.node_count,
+        edges=graph.edge_count,
+        unreachable=unreachable,
+        queries_per_second=len(timings) / elapsed if elapsed else 0.0,
+        mean_settled=sum(settled) / len(settled) if settled else 0,
+        graph_bytes=graph.memory_footprint()['total'],
+        search_peak_bytes=search_peak,
+        peak_rss_bytes=peak_rss_bytes(),
+    )
@@ -0,0 +1,86 @@
+import json
+import math
+import random
+
+
+def load_directions(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def synthetic_directions(steps=3000, points_per_step=8, start=(-122.4194, 37.7749),
+                         bearing=75.0, step_length=1600.0, seed=0):
+    """
+    Build a directions response with the same shape ORS returns for
+    GET /v2/directions/{profile}, for benchmarking without network access.
+
+    The defaults produce a ~3,000 mile, 3,000 step route heading east from
+    San Francisco.
+    """
+    rng = random.Random(seed)
+
+    lon, lat = start
+    coordinates = [[lon, lat]]
+    step_objs = []
+    total_distance = 0.0
+    total_duration = 0.0
+
+    for step_index in range(steps):
+        heading = bearing + rng.uniform(-30, 30)
+        first = len(coordinates) - 1
+
+        for _ in range(points_per_step):
+            hop = step_length / points_per_step
+            lat += hop * math.cos(math.radians(heading)) / 111320.0
+            lon += hop * math.sin(math.radians(heading)) / (111320.0 * math.cos(math.radians(lat)))
+            coordinates.append([round(lon, 6), round(lat, 6)])
+
+        duration = step_length / rng.uniform(13.0, 29.0)
+        total_distance += step_length
+        total_duration += duration
+        step_objs.append({
+            'distance': round(step_length, 1),
+            'duration': round(duration, 1),
+            'type': 11 if step_index == 0 else rng.choice((0, 1, 4, 5, 6, 12, 13)),
+            'instruction': f'Continue onto Road {step_index}',
+            'name': f'Road {step_index}',
+            'way_points': [first, len(coordinates) - 1],
+        })
+
+    last = len(coordinates) - 1
+    step_objs.append({
+        'distance': 0.0,
+        'duration': 0.0,
+        'type': 10,
+        'instruction': 'Arrive at your destination',
+        'name': '-',
+        'way_points': [last, last],
+    })
+
+    lons = [c[0] for c in coordinates]
+    lats = [c[1] for c in coordinates]
+    bbox = [min(lons), min(lats), max(lons), max(lats)]
+    summary = {'distance': round(total_distance, 1), 'duration': round(total_duration, 1)}
+
+    return {
+        'type': 'FeatureCollection',
+        'bbox': bbox,
+        'features': [{
+            'bbox': bbox,
+            'type': 'Feature',
+            'properties': {
+                'segments': [dict(summary, steps=step_objs)],
+                'summary': summary,
+                'way_points': [0, last],
+            },
+            'geometry': {'coordinates': coordinates, 'type': 'LineString'},
+        }],
+        'metadata': {
+            'attribution': 'openrouteservice.org | OpenStreetMap contributors',
+            'service': 'routing',
+            'timestamp': 1733400000000,
+            'query': {'coordinates': [coordinates[0], coordinates[-1]],
+                      'profile': 'driving-car', 'format': 'json'},
+            'engine': {'version': 'synthetic'},
+        },
+    }
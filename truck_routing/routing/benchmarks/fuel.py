@@ -0,0 +1,80 @@
+import random
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import connection
+
+from ..corridor import build_corridors
+from ..fuel import corridor_stops, plan_route_fuel
+from ..ingest import persist_directions
+from ..models import TruckStop
+from .fixtures import synthetic_directions
+from .timing import summarize, timed
+
+# Continental US
+NATIONAL_EXTENT = (-124.7, 24.5, -66.9, 49.4)
+
+
+def synthetic_truck_stops(count, geometry=None, seed=0):
+    """
+    `count` truck stops spread over the continental US, half of them
+    clustered near `geometry` the way stops cluster along interstates.
+    """
+    rng = random.Random(seed)
+    coords = geometry.coords if geometry is not None else ()
+    min_lon, min_lat, max_lon, max_lat = NATIONAL_EXTENT
+
+    stops = []
+    for index in range(count):
+        if coords and index % 2:
+            lon, lat = rng.choice(coords)
+            lon += rng.uniform(-0.2, 0.2)
+            lat += rng.uniform(-0.2, 0.2)
+        else:
+            lon, lat = rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)
+
+        stops.append(TruckStop(
+            opis_id=900000 + index,
+            name=f'Bench Stop {index}',
+            address=f'{index} Interstate Rd',
+            city='Benchville',
+            state=rng.randint(1, 50),
+            fuel_retail_price=rng.randint(320, 480),
+            coordinate=Point(lon, lat, srid=4326),
+        ))
+    return stops
+
+
+def run(stops=8000, steps=3000, rounds=50, tank_range=500, mpg=10, corridor=5):
+    """
+    Plan fuel for a synthetic ~3,000 mile route against `stops` truck stops,
+    and time reading the stops along it searched for and stored. Call
+    inside a transaction that is rolled back afterwards.
+    """
+    feature_collection = persist_directions(synthetic_directions(steps=steps))
+    feature = feature_collection.feature_set.select_related('summary').get()
+
+    TruckStop.objects.bulk_create(synthetic_truck_stops(stops, feature.geometry), batch_size=5000)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE routing_truckstop')
+
+    # The stops came after the route, store its corridor again as ingest
+    # would have.
+    _, build_timings = timed(build_corridors, [feature.pk], miles=max(corridor, settings.TRUCK_STOP_CORRIDOR_MILES))
+    feature.refresh_from_db(fields=['corridor_miles'])
+
+    # Warm up caches before measuring.
+    plan_route_fuel(feature, tank_range, mpg, corridor)
+    plan, timings = timed(plan_route_fuel, feature, tank_range, mpg, corridor, rounds=rounds)
+    _, searched = timed(corridor_stops, feature, corridor, stored=False, rounds=rounds)
+    _, stored = timed(corridor_stops, feature, corridor, rounds=rounds)
+
+    return dict(summarize(timings),
+                build_ms=build_timings[0] * 1000,
+                searched_p50_ms=summarize(searched)['p50_ms'],
+                stored_p50_ms=summarize(stored)['p50_ms'],
+                stops=stops,
+                route_miles=plan['distance'],
+                candidate_stops=plan['candidate_stops'],
+                fuel_stops=len(plan['stops']),
+                total_cost=plan['total_cost'])
@@ -0,0 +1,80 @@
+import json
+import time
+
+from django.core.serializers import serialize
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..geojson import stream_feature_collection
+from ..ingest import persist_directions
+from ..models import FeatureCollection
+from ..simplify import zoom_tolerance
+from .fixtures import synthetic_directions
+
+
+def render_legacy(feature_collection):
+    # The original retrieve: serialize, parse again for DRF, encode again.
+    features = feature_collection.feature_set.prefetch_related('segment_set').all()
+    for feature in features:
+        for segment in feature.segment_set.prefetch_related('step_set').all():
+            list(segment.step_set.all())
+
+    geojson = json.loads(serialize('geojson', features, geometry_field='geometry',
+                                   fields=('segment_set', 'summary', 'way_point_indices')))
+    yield json.dumps(geojson)
+
+
+def render_streaming(feature_collection):
+    return stream_feature_collection(feature_collection)
+
+
+def render_overview(feature_collection):
+    # A whole route on a phone screen.
+    return stream_feature_collection(feature_collection, tolerance=zoom_tolerance(8))
+
+
+def render_polyline(feature_collection):
+    return stream_feature_collection(feature_collection, tolerance=zoom_tolerance(8),
+                                     geometry_format='encodedpolyline')
+
+
+RENDERERS = {
+    'legacy': render_legacy,
+    'streaming': render_streaming,
+    'overview': render_overview,
+    'polyline': render_polyline,
+}
+
+
+def measure(render, feature_collection_id, rounds=3):
+    best = None
+    for _ in range(rounds):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            feature_collection = (FeatureCollection.objects
+                                  .select_related('bbox', 'metadata').get(pk=feature_collection_id))
+            chunks = render(feature_collection)
+            first = next(chunks)
+            first_byte = time.perf_counter() - started
+            size = len(first.encode()) + sum(len(chunk.encode()) for chunk in chunks)
+            total = time.perf_counter() - started
+
+        result = {'queries': len(captured), 'bytes': size,
+                  'first_chunk_ms': first_byte * 1000, 'total_ms': total * 1000}
+        if best is None or result['total_ms'] < best['total_ms']:
+            best = result
+    return best
+
+
+def run(sizes=(100, 1000, 3000), rounds=3, renderers=('legacy', 'streaming')):
+    """
+    Render synthetic routes of each size in `sizes` (steps). Call inside a
+    transaction that is rolled back afterwards.
+    """
+    results = []
+    for steps in sizes:
+        feature_collection = persist_directions(synthetic_directions(steps=steps))
+        for name in renderers:
+            results.append(dict(measure(RENDERERS[name], feature_collection.pk, rounds),
+                                renderer=name, steps=steps))
+    return results
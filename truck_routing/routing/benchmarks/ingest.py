@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.gis.geos import Polygon, LineString
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ..ingest import persist_directions
+from ..models import FeatureCollection, BoundingBox, Feature, FeatureSummary, Metadata, Segment, Step
+
+
+def persist_directions_per_row(geojson):
+    # Saves every row on its own, as RouteSerializer.create originally did.
+    properties = geojson['features'][0]['properties']
+
+    bounding_box = BoundingBox(coordinates=Polygon.from_bbox(geojson['bbox']))
+    bounding_box.save()
+
+    metadata_obj = Metadata(**geojson['metadata'])
+    metadata_obj.save()
+
+    feature_collection = FeatureCollection(bbox=bounding_box, metadata=metadata_obj)
+    feature_collection.save()
+
+    feature_summary = FeatureSummary(**properties['summary'])
+    feature_summary.save()
+
+    feature = Feature(feature_collection=feature_collection, summary=feature_summary,
+                      geometry=LineString(geojson['features'][0]['geometry']['coordinates']),
+                      way_point_indices=properties['way_points'], bbox=bounding_box)
+    feature.save()
+
+    for segment in properties['segments']:
+        segment_obj = Segment(distance=segment['distance'], duration=segment['duration'], feature=feature)
+        segment_obj.save()
+
+        for step in segment['steps']:
+            step_obj = Step(distance=step['distance'], duration=step['duration'], type=step['type'],
+                            instruction=step['instruction'], name=step['name'],
+                            way_point_start=step['way_points'][0], way_point_end=step['way_points'][-1],
+                            segment=segment_obj)
+            step_obj.save()
+
+    return feature_collection
+
+
+STRATEGIES = {
+    'per-row': persist_directions_per_row,
+    'bulk': persist_directions,
+}
+
+
+def measure(persist, geojson, rounds=3):
+    """
+    Run `persist` against `geojson` `rounds` times, rolling every run back,
+    and return the query count and wall times.
+    """
+    timings = []
+    queries = 0
+
+    for _ in range(rounds):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                persist(geojson)
+                timings.append(time.perf_counter() - started)
+            queries = len(captured)
+            transaction.set_rollback(True)
+
+    return {
+        'queries': queries,
+        'best_seconds': min(timings),
+        'mean_seconds': sum(timings) / len(timings),
+    }
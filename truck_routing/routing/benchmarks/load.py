@@ -0,0 +1,245 @@
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import django
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_databases, setup_test_environment, \
+    teardown_databases, teardown_test_environment
+
+from .. import directions
+from ..models import FeatureCollection, TruckStop
+from .fuel import NATIONAL_EXTENT, synthetic_truck_stops
+from .ors_stub import ORSStub
+from .timing import percentile, summarize
+
+# Steps per synthetic route: short urban trips through ~3,000 mile hauls.
+ROUTE_SIZES = {'urban': 20, 'regional': 300, 'long-haul': 3000}
+
+# Relative weight of each operation in the mix.
+DEFAULT_MIX = {'create': 1, 'retrieve': 4, 'nearest': 2, 'bbox': 1}
+
+API = '/api/routing'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Unknown operation {name!r}, expected one of {", ".join(DEFAULT_MIX)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def random_point(rng):
+    min_lon, min_lat, max_lon, max_lat = NATIONAL_EXTENT
+    return round(rng.uniform(min_lon, max_lon), 5), round(rng.uniform(min_lat, max_lat), 5)
+
+
+class LoadTest:
+    """
+    Drives the API in process through Django's test client from
+    `concurrency` threads, each with its own database connection, against
+    a local ORS stub. Operations are picked at random by `mix` weight:
+
+    - create: POST /routes/ for one of `lanes` lanes, repeats hit the route
+      cache like dispatchers re-planning the same lanes do
+    - retrieve: GET /feature-collections/{id}/ of a route created before
+    - nearest, bbox: truck stop queries around random points
+    """
+
+    def __init__(self, requests=1000, concurrency=8, mix=None, lanes=200, seed=0):
+        self.requests = requests
+        self.concurrency = concurrency
+        self.mix = mix or DEFAULT_MIX
+        self.seed = seed
+        rng = random.Random(seed)
+        self.lanes = [(random_point(rng), random_point(rng)) for _ in range(lanes)]
+        self.feature_collections = []
+        self._lock = threading.Lock()
+        self._issued = 0
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def next_request(self):
+        with self._lock:
+            if self._issued >= self.requests:
+                return False
+            self._issued += 1
+            return True
+
+    def request(self, client, rng, operation):
+        if operation == 'create':
+            start, end = rng.choice(self.lanes)
+            return client.post(f'{API}/routes/', {'start_location': f'{start[0]},{start[1]}',
+                                                  'end_location': f'{end[0]},{end[1]}'})
+        if operation == 'retrieve':
+            with self._lock:
+                feature_collection = rng.choice(self.feature_collections)
+            response = client.get(f'{API}/feature-collections/{feature_collection}/', HTTP_ACCEPT_ENCODING='gzip')
+            # Drain streamed documents so the whole render is timed.
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            return response
+        lon, lat = random_point(rng)
+        if operation == 'nearest':
+            return client.get(f'{API}/truck-stops/nearest/', {'lon': lon, 'lat': lat, 'limit': 20})
+        return client.get(f'{API}/truck-stops/bbox/', {'bbox': f'{lon},{lat},{lon + 2},{lat + 2}', 'limit': 50})
+
+    def worker(self, index):
+        client = Client()
+        rng = random.Random(self.seed * 1000 + index)
+        operations, weights = zip(*self.mix.items())
+        try:
+            while self.next_request():
+                operation = rng.choices(operations, weights)[0]
+                if operation == 'retrieve' and not self.feature_collections:
+                    operation = 'create'
+
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = self.request(client, rng, operation)
+                    elapsed = time.perf_counter() - started
+
+                with self._lock:
+                    self.timings[operation].append(elapsed)
+                    self.queries[operation].append(len(captured))
+                    self.statuses[operation][response.status_code] += 1
+                    if operation == 'create' and response.status_code == 201:
+                        self.feature_collections.append(response.json()['feature_collection'])
+        finally:
+            connection.close()
+
+    def run(self):
+        # Some routes to retrieve from the start.
+        warm = LoadTest(requests=min(20, len(self.lanes)), concurrency=1, mix={'create': 1},
+                        lanes=len(self.lanes), seed=self.seed)
+        warm.worker(0)
+        self.feature_collections = list(warm.feature_collections)
+
+        threads = [threading.Thread(target=self.worker, args=(index,), name=f'load-{index}')
+                   for index in range(self.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        operations = {}
+        for operation, timings in self.timings.items():
+            queries = self.queries[operation]
+            operations[operation] = dict(
+                summarize(timings),
+                queries_p50=percentile(queries, 50),
+                queries_max=max(queries),
+                statuses={str(status): count for status, count in sorted(self.statuses[operation].items())},
+            )
+
+        all_timings = [timing for timings in self.timings.values() for timing in timings]
+        errors = sum(count for statuses in self.statuses.values()
+                     for status, count in statuses.items() if status >= 400)
+        return {
+            'requests': len(all_timings),
+            'errors': errors,
+            'wall_seconds': wall,
+            'throughput_rps': len(all_timings) / wall if wall else 0.0,
+            'overall': summarize(all_timings),
+            'operations': operations,
+        }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'database': connection.vendor,
+    }
+
+
+def run(requests=1000, concurrency=8, mix=None, lanes=200, stops=8000, sizes=tuple(ROUTE_SIZES.values()),
+        latency=0.0, seed=0, keepdb=False):
+    """
+    Run a load test in a throwaway test database against an in-process ORS
+    stub serving synthetic routes of `sizes` steps, returning the config,
+    environment and results as one JSON-able dict.
+    """
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=keepdb)
+    overrides = {name: getattr(settings, name) for name in (
+        'ROUTING_BACKEND', 'OPENROUTE_BASE_URL', 'OPENROUTE_RATE_LIMIT', 'OPENROUTE_RATE_BURST', 'ROUTE_JOBS_ASYNC')}
+    stub = ORSStub(latency=latency, steps=list(sizes), seed=seed).start()
+    try:
+        # The stub answers as fast as it can, the client's rate limit would
+        # measure nothing but itself.
+        settings.ROUTING_BACKEND = 'ors'
+        settings.OPENROUTE_BASE_URL = stub.url
+        settings.OPENROUTE_RATE_LIMIT = 1e9
+        settings.OPENROUTE_RATE_BURST = 1e9
+        # Routes are planned on the request thread so creates are timed end to end.
+        settings.ROUTE_JOBS_ASYNC = False
+        directions._client = None
+
+        if not TruckStop.objects.exists():
+            TruckStop.objects.bulk_create(synthetic_truck_stops(stops, seed=seed), batch_size=5000)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE routing_truckstop')
+
+        rss_before = peak_rss_mb()
+        test = LoadTest(requests=requests, concurrency=concurrency, mix=mix, lanes=lanes, seed=seed)
+        results = test.run()
+        results.update(peak_rss_mb=peak_rss_mb(), peak_rss_before_mb=rss_before, ors_requests=stub.requests,
+                       feature_collections=FeatureCollection.objects.count())
+    finally:
+        stub.stop()
+        for name, value in overrides.items():
+            setattr(settings, name, value)
+        directions._client = None
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+    return {
+        'config': {'requests': requests, 'concurrency': concurrency, 'mix': mix or DEFAULT_MIX, 'lanes': lanes,
+                   'stops': stops, 'sizes': list(sizes), 'latency': latency, 'seed': seed},
+        'environment': environment(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Per operation p50/p95/p99 and query count changes between two run()
+    results, and the ones that got worse by more than `threshold`.
+    """
+    rows = []
+    regressions = []
+    for operation, now in sorted(current['results']['operations'].items()):
+        before = baseline['results']['operations'].get(operation)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_p50'):
+            change = (now[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            row = {'operation': operation, 'metric': metric, 'before': before[metric], 'after': now[metric],
+                   'change': change}
+            rows.append(row)
+            if change > threshold:
+                regressions.append(row)
+    return rows, regressions
@@ -0,0 +1,56 @@
+import math
+import random
+
+from ..geo import haversine_miles
+from ..optimize import solve
+
+METERS_PER_MILE = 1609.344
+
+
+def synthetic_matrix(stops, seed=0, radius_miles=60, center=(-97.0, 35.0)):
+    """
+    Duration matrix for a depot and `stops` drops scattered around it, road
+    distance taken as 1.2 to 1.5 times the straight line and a little
+    asymmetric, like one way streets and ramps make real matrices.
+    """
+    rng = random.Random(seed)
+    points = [center]
+    for _ in range(stops):
+        angle = rng.uniform(0, 2 * math.pi)
+        distance = radius_miles * math.sqrt(rng.random()) / 69.0
+        points.append((center[0] + distance * math.cos(angle) / math.cos(math.radians(center[1])),
+                       center[1] + distance * math.sin(angle)))
+
+    # Metres per second.
+    speed = 22.0
+    return [[0.0 if a == b else haversine_miles(points[a], points[b]) * METERS_PER_MILE / speed
+             * rng.uniform(1.2, 1.5) for b in range(len(points))] for a in range(len(points))]
+
+
+def run(stops, budgets, reference_budget=10.0, seed=0):
+    """
+    Tour duration per time budget, as the gap to the best tour found with
+    `reference_budget` seconds.
+    """
+    matrix = synthetic_matrix(stops, seed=seed)
+    reference = solve(matrix, time_budget=reference_budget, seed=seed)
+
+    results = []
+    for budget in budgets:
+        solution = solve(matrix, time_budget=budget, seed=seed)
+        results.append({
+            'budget_seconds': budget,
+            'solve_seconds': solution.seconds,
+            'duration': solution.cost,
+            'gap_percent': (solution.cost / reference.cost - 1) * 100,
+            'kicks': solution.iterations,
+        })
+
+    return {
+        'stops': stops,
+        'nearest_neighbour_duration': reference.initial_cost,
+        'nearest_neighbour_gap_percent': (reference.initial_cost / reference.cost - 1) * 100,
+        'reference_duration': reference.cost,
+        'reference_seconds': reference.seconds,
+        'results': results,
+    }
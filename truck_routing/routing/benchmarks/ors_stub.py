@@ -0,0 +1,170 @@
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from ..backends.ors import merge_directions
+from ..geo import haversine_miles
+from .fixtures import load_directions, synthetic_directions
+
+METERS_PER_MILE = 1609.344
+# Straight line metres per second for synthetic matrices.
+STUB_SPEED = 20.0
+
+
+def load_responses(paths):
+    # Accepts JSON files and directories of JSON files.
+    responses = []
+    for path in map(Path, paths):
+        files = sorted(path.glob('*.json')) if path.is_dir() else [path]
+        responses.extend(load_directions(file) for file in files)
+    return responses
+
+
+def lane(coordinates):
+    return tuple(round(float(value), 5) for point in (coordinates[0], coordinates[-1]) for value in point)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if not url.path.startswith('/v2/directions/') or 'start' not in query or 'end' not in query:
+            return self.reply(404, {'error': {'code': 2099, 'message': 'Not found'}})
+
+        coordinates = [[float(v) for v in query['start'].split(',')],
+                       [float(v) for v in query['end'].split(',')]]
+        self.reply(*self.server.directions(coordinates))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.path.startswith('/v2/matrix/') and 'locations' in body:
+            return self.reply(*self.server.matrix(body))
+        if not self.path.startswith('/v2/directions/') or 'coordinates' not in body:
+            return self.reply(404, {'error': {'code': 2099, 'message': 'Not found'}})
+
+        self.reply(*self.server.directions(body['coordinates']))
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/geo+json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ORSStub(ThreadingHTTPServer):
+    """
+    Local stand-in for the OpenRouteService directions and matrix APIs that
+    replays recorded responses.
+
+    A recorded response whose query matches the requested start/end is
+    returned if there is one, otherwise one is picked deterministically per
+    lane. Without recordings a synthetic route of `steps` steps is built.
+    `steps` can also be a sequence of sizes, one of them picked per lane,
+    to serve a mix of short and long routes. `latency` seconds are added
+    to every reply and `error_rate` of requests fail with a 503 to exercise
+    retries and the circuit breaker. `peak_in_flight` is the most requests
+    it was answering at once. Routes
+    through more than two coordinates are built leg by leg and matrices
+    are straight line distances at STUB_SPEED.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), responses=(), latency=0.0, error_rate=0.0,
+                 steps=200, seed=0):
+        super().__init__(address, StubHandler)
+        self.responses = list(responses)
+        self.by_lane = {lane(response['metadata']['query']['coordinates']): response
+                        for response in self.responses
+                        if response.get('metadata', {}).get('query', {}).get('coordinates')}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.steps = steps
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def begin(self):
+        # Count the request and apply latency, returns an error reply or None.
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            fail = self.random.random() < self.error_rate
+
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if fail:
+            return 503, {'error': {'code': 2099, 'message': 'Service unavailable (stub)'}}
+        return None
+
+    def matrix(self, body):
+        error = self.begin()
+        if error:
+            return error
+
+        locations = body['locations']
+        sources = body.get('sources', range(len(locations)))
+        destinations = body.get('destinations', range(len(locations)))
+        distances = [[haversine_miles(locations[source], locations[destination]) * METERS_PER_MILE
+                      for destination in destinations] for source in sources]
+        return 200, {'durations': [[distance / STUB_SPEED for distance in row] for row in distances],
+                     'distances': distances, 'metadata': {'service': 'matrix'}}
+
+    def directions(self, coordinates):
+        error = self.begin()
+        if error:
+            return error
+        if len(coordinates) > 2:
+            return 200, merge_directions([self.leg(pair) for pair in zip(coordinates, coordinates[1:])])
+        return 200, self.leg(coordinates)
+
+    def leg(self, coordinates):
+        key = lane(coordinates)
+        if key in self.by_lane:
+            return self.by_lane[key]
+        seed = zlib.crc32(repr(key).encode())
+        if self.responses:
+            return self.responses[seed % len(self.responses)]
+        steps = self.steps if isinstance(self.steps, int) else self.steps[seed % len(self.steps)]
+        return synthetic_directions(steps=steps, start=tuple(coordinates[0]), seed=seed)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,112 @@
+import json
+
+from django.contrib.gis.db.models.functions import GeometryDistance
+from django.contrib.gis.geos import Point, Polygon
+from django.db import connection, transaction
+
+from ..models import FeatureCollection, FeatureTruckStop, Route, Step, TruckStop
+
+ORIGIN = Point(-90.05, 35.15, srid=4326)
+AREA = Polygon.from_bbox((-91, 34, -89, 36))
+AREA.srid = 4326
+
+
+def hot_queries():
+    """
+    (name, queryset, table, leading indexed columns) for the queries the
+    API runs most. The plan of each must scan an index on that table
+    starting with those columns.
+    """
+    return [
+        ('truck stops by state, cheapest first',
+         TruckStop.objects.filter(state=5).order_by('fuel_retail_price')[:20],
+         'routing_truckstop', ['state', 'fuel_retail_price']),
+        ('truck stop by OPIS id',
+         TruckStop.objects.filter(opis_id=123456),
+         'routing_truckstop', ['opis_id']),
+        ('nearest truck stops',
+         TruckStop.objects.order_by(GeometryDistance('coordinate', ORIGIN))[:20],
+         'routing_truckstop', ['coordinate']),
+        ('truck stops in a bbox',
+         TruckStop.objects.filter(coordinate__contained=AREA).order_by('fuel_retail_price', 'id')[:50],
+         'routing_truckstop', ['coordinate']),
+        ('routes from a point',
+         Route.objects.filter(start_location__dwithin=(ORIGIN, 0.001)),
+         'routing_route', ['start_location']),
+        ('routes to a point',
+         Route.objects.filter(end_location__dwithin=(ORIGIN, 0.001)),
+         'routing_route', ['end_location']),
+        ('route list page',
+         Route.objects.filter(id__lt=1000000).order_by('-id')[:50],
+         'routing_route', ['id']),
+        ('routes created since',
+         Route.objects.filter(created_at__gte='2026-01-01').order_by('created_at')[:50],
+         'routing_route', ['created_at']),
+        ('feature collections planned since',
+         FeatureCollection.objects.filter(metadata__timestamp__gte=1767225600000),
+         'routing_metadata', ['timestamp']),
+        ('steps of a segment in order',
+         Step.objects.filter(segment_id=1).order_by('way_point_start', 'id'),
+         'routing_step', ['segment_id', 'way_point_start', 'id']),
+        ('truck stops along a route',
+         FeatureTruckStop.objects.filter(feature_id=1, detour__lte=5).order_by('distance_along'),
+         'routing_featuretruckstop', ['feature_id', 'distance_along']),
+    ]
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def indexes_on(table):
+    # Index name -> columns for `table`, primary keys and unique constraints
+    # are indexes too.
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return {name: constraint['columns'] for name, constraint in constraints.items()
+            if constraint['index'] or constraint['unique']}
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    # psycopg2 decodes json columns, other drivers may not.
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']
+
+
+def run(seqscan=False):
+    """
+    EXPLAIN each hot query and check it scans the index it should.
+
+    Unless `seqscan`, sequential scans are disabled for the check: on a
+    small or empty database the planner rightly prefers them, what's
+    checked is that an index can serve the query at all.
+    """
+    results = []
+    with transaction.atomic():
+        if not seqscan:
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for name, queryset, table, columns in hot_queries():
+            indexes = indexes_on(table)
+            expected = sorted(index for index, indexed in indexes.items() if indexed[:len(columns)] == columns)
+            plan = explain(queryset)
+            # Bitmap index scans don't name the table, index names are
+            # unique in the schema anyway.
+            used = sorted({node['Index Name'] for node in plan_nodes(plan) if 'Index Name' in node})
+            results.append({
+                'query': name,
+                'table': table,
+                'columns': columns,
+                'expected': expected,
+                'used': used,
+                'ok': bool(set(expected) & set(used)),
+                'cost': plan['Total Cost'],
+            })
+        transaction.set_rollback(True)
+    return results
@@ -0,0 +1,213 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from django.db import connection, connections
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+from .load import API, environment, random_point
+from .ors_stub import ORSStub
+from .timing import summarize
+
+
+def runserver_command(port, workers):
+    # What docker-compose ran before, one process with a thread per request.
+    return [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+
+
+def wsgi_command(port, workers):
+    # Blocking workers, a request each.
+    return [sys.executable, '-m', 'gunicorn', 'truck_routing.wsgi:application', '--worker-class', 'sync',
+            '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+
+
+def asgi_command(port, workers):
+    # The production setup, gunicorn.conf.py with uvicorn workers.
+    return [sys.executable, '-m', 'gunicorn', 'truck_routing.asgi:application',
+            '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+
+
+SERVERS = {'runserver': runserver_command, 'wsgi': wsgi_command, 'asgi': asgi_command}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_environment(stub, workers):
+    # The test database and the stub, for a server in another process.
+    database = connection.settings_dict
+    return dict(
+        os.environ,
+        SQL_ENGINE=database['ENGINE'],
+        SQL_DATABASE=database['NAME'],
+        SQL_USER=database['USER'] or '',
+        SQL_PASSWORD=database['PASSWORD'] or '',
+        SQL_HOST=database['HOST'] or '',
+        SQL_PORT=str(database['PORT'] or ''),
+        DEBUG='false',
+        ALLOWED_HOSTS='127.0.0.1',
+        ROUTING_BACKEND='ors',
+        OPENROUTE_BASE_URL=stub.url,
+        # The stub answers as fast as it's told to, the client's rate limit
+        # would measure nothing but itself.
+        OPENROUTE_RATE_LIMIT='1e9',
+        OPENROUTE_RATE_BURST='1000000000',
+        ROUTE_JOBS_ASYNC='false',
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_ACCESS_LOG='/dev/null',
+    )
+
+
+class Server:
+    """
+    A server for the API started in a subprocess from the project
+    directory, stopped on exit.
+    """
+
+    def __init__(self, name, workers, environ, ready_timeout=60):
+        self.port = free_port()
+        self.command = SERVERS[name](self.port, workers)
+        self.environ = environ
+        self.ready_timeout = ready_timeout
+        self.process = None
+        self.log = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(self.command, cwd=settings.BASE_DIR, env=self.environ,
+                                        stdout=subprocess.DEVNULL, stderr=self.log)
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                output = self.output()
+                self.stop()
+                raise RuntimeError(f'{" ".join(self.command)} exited: {output}')
+            try:
+                if requests.get(f'{self.url}{API}/metrics', timeout=1).ok:
+                    return self
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+        output = self.output()
+        self.stop()
+        raise RuntimeError(f'{" ".join(self.command)} not ready in {self.ready_timeout} s: {output}')
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+
+    def output(self, limit=2000):
+        self.log.seek(0)
+        return self.log.read().decode(errors='replace')[-limit:]
+
+
+def drive(url, requests_count, concurrency, seed):
+    """
+    POST `requests_count` routes for distinct lanes, so none comes from the
+    route cache, from `concurrency` client threads. Returns the timings and
+    statuses.
+    """
+    rng = random.Random(seed)
+    lanes = [(random_point(rng), random_point(rng)) for _ in range(requests_count)]
+    timings = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                if not lanes:
+                    return
+                start, end = lanes.pop()
+            started = time.perf_counter()
+            try:
+                status = session.post(f'{url}{API}/routes/', timeout=300, data={
+                    'start_location': f'{start[0]},{start[1]}', 'end_location': f'{end[0]},{end[1]}'}).status_code
+            except requests.RequestException:
+                status = 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                timings.append(elapsed)
+                statuses[status] += 1
+
+    threads = [threading.Thread(target=worker, name=f'serving-{index}') for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, statuses, time.perf_counter() - started
+
+
+def run(servers=('wsgi', 'asgi'), requests=400, concurrency=64, workers=2, latency=0.5, steps=200, seed=0,
+        keepdb=False):
+    """
+    Create routes through each of `servers` in turn, run in a subprocess
+    with `workers` workers against an ORS stub answering after `latency`
+    seconds, in a throwaway test database. The stub counts how many route
+    requests were waiting on it at once, which is how many the server kept
+    in flight.
+    """
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=keepdb)
+    stub = ORSStub(latency=latency, steps=steps, seed=seed).start()
+    results = {}
+    try:
+        environ = server_environment(stub, workers)
+        for index, name in enumerate(servers):
+            with Server(name, workers, environ) as server:
+                # A few routes first so every worker has connected and warmed up.
+                drive(server.url, workers * 4, workers, seed=seed + 1000 + index)
+                stub.requests = 0
+                stub.peak_in_flight = 0
+
+                timings, statuses, wall = drive(server.url, requests, concurrency, seed=seed + index)
+                results[name] = dict(
+                    summarize(timings),
+                    command=' '.join(server.command[1:]),
+                    peak_in_flight=stub.peak_in_flight,
+                    ors_requests=stub.requests,
+                    wall_seconds=wall,
+                    throughput_rps=len(timings) / wall if wall else 0.0,
+                    statuses={str(status): count for status, count in sorted(statuses.items(), key=str)},
+                    errors=sum(count for status, count in statuses.items() if status == 'error' or status >= 400),
+                )
+    finally:
+        stub.stop()
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+    return {
+        'config': {'servers': list(servers), 'requests': requests, 'concurrency': concurrency, 'workers': workers,
+                   'latency': latency, 'steps': steps, 'seed': seed, 'cpus': os.cpu_count()},
+        'environment': environment(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
@@ -0,0 +1,31 @@
+import time
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(timings):
+    # Wall times in seconds -> milliseconds summary.
+    return {
+        'count': len(timings),
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'max_ms': max(timings, default=0.0) * 1000,
+        'mean_ms': sum(timings) / len(timings) * 1000 if timings else 0.0,
+    }
+
+
+def timed(function, *args, rounds=1, **kwargs):
+    timings = []
+    result = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings.append(time.perf_counter() - started)
+    return result, timings
@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .lru import LRUCache
+from .models import FeatureCollection, RouteCacheEntry
+
+
+def snap(value, grid):
+    # Snap a coordinate to the grid so near identical requests share a lane.
+    return round(round(value / grid) * grid, 6)
+
+
+def lane_key(start, end, profile, grid):
+    start_lon, start_lat = start
+    end_lon, end_lat = end
+    return (f'{profile}:{snap(start_lon, grid)},{snap(start_lat, grid)}'
+            f':{snap(end_lon, grid)},{snap(end_lat, grid)}')
+
+
+class RouteCache:
+    """
+    Two tier cache of stored FeatureCollections keyed on the requested lane.
+
+    The in-process tier is an LRU holding FeatureCollection ids, the shared
+    tier is the RouteCacheEntry table so all workers benefit from a fetch.
+    Both tiers expire entries after `ttl` seconds.
+
+    Hits on the local tier mark the shared entry as used once it was last
+    marked more than `touch_fraction` of the ttl ago, so the table's LRU
+    order follows them too without a write per hit. The table is trimmed on
+    a random `evict_probability` of sets, once it has grown `evict_slack`
+    past `db_max_entries`.
+    """
+
+    def __init__(self, grid, ttl, max_entries, db_max_entries, touch_fraction=0.1, evict_probability=0.01,
+                 evict_slack=0.1, clock=time.monotonic):
+        self.grid = grid
+        self.ttl = ttl
+        self.db_max_entries = db_max_entries
+        self.touch_after = ttl * touch_fraction
+        self.evict_probability = evict_probability
+        self.evict_slack = evict_slack
+        self.clock = clock
+        # key -> [FeatureCollection id, clock() when the shared entry was
+        # last marked as used]
+        self.local = LRUCache(max_entries=max_entries, ttl=ttl, clock=clock)
+        self._lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'db_hits': 0, 'misses': 0, 'evictions': 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            grid=settings.ROUTE_CACHE_GRID,
+            ttl=settings.ROUTE_CACHE_TTL,
+            max_entries=settings.ROUTE_CACHE_MAX_ENTRIES,
+            db_max_entries=settings.ROUTE_CACHE_DB_MAX_ENTRIES,
+            touch_fraction=settings.ROUTE_CACHE_TOUCH_FRACTION,
+            evict_probability=settings.ROUTE_CACHE_EVICT_PROBABILITY,
+        )
+
+    def key(self, start, end, profile):
+        return lane_key(start, end, profile, self.grid)
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def get(self, start, end, profile):
+        key = self.key(start, end, profile)
+
+        cached = self.local.get(key)
+        if cached is not None:
+            feature_collection_id, touched_at = cached
+            feature_collection = FeatureCollection.objects.filter(
+                pk=feature_collection_id).first()
+            if feature_collection is not None:
+                self._count('local_hits')
+                if self.clock() - touched_at >= self.touch_after:
+                    RouteCacheEntry.objects.filter(key=key).update(
+                        hits=F('hits') + 1, last_hit_at=timezone.now())
+                    # In place, so the entry keeps its expiry.
+                    cached[1] = self.clock()
+                return feature_collection
+            # The collection was deleted underneath us.
+            self.local.delete(key)
+
+        expires_before = timezone.now() - timedelta(seconds=self.ttl)
+        entry = (RouteCacheEntry.objects
+                 .select_related('feature_collection')
+                 .filter(key=key, created_at__gt=expires_before)
+                 .first())
+
+        if entry is None:
+            self._count('misses')
+            return None
+
+        RouteCacheEntry.objects.filter(pk=entry.pk).update(
+            hits=F('hits') + 1, last_hit_at=timezone.now())
+        # Expires locally when the shared entry does.
+        remaining = self.ttl - (timezone.now() - entry.created_at).total_seconds()
+        self.local.set(key, [entry.feature_collection_id, self.clock()], ttl=max(remaining, 1e-3))
+        self._count('db_hits')
+        return entry.feature_collection
+
+    def set(self, start, end, profile, feature_collection):
+        key = self.key(start, end, profile)
+
+        RouteCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'profile': profile,
+                'feature_collection': feature_collection,
+                'created_at': timezone.now(),
+                'last_hit_at': timezone.now(),
+                'hits': 0,
+            })
+        self.local.set(key, [feature_collection.pk, self.clock()])
+        if random.random() < self.evict_probability:
+            self.evict()
+
+    def evict(self):
+        expires_before = timezone.now() - timedelta(seconds=self.ttl)
+        evicted, _ = RouteCacheEntry.objects.filter(
+            created_at__lte=expires_before).delete()
+
+        # Least recently used entries past the size budget, once the table
+        # has grown past the slack so a trim deletes more than a row or two.
+        if RouteCacheEntry.objects.count() > self.db_max_entries * (1 + self.evict_slack):
+            cutoff = (RouteCacheEntry.objects
+                      .order_by('-last_hit_at')
+                      .values_list('last_hit_at', flat=True)[self.db_max_entries:]
+                      .first())
+            if cutoff is not None:
+                deleted, _ = RouteCacheEntry.objects.filter(
+                    last_hit_at__lte=cutoff).delete()
+                evicted += deleted
+
+        if evicted:
+            self._count('evictions', evicted)
+
+    def clear(self):
+        self.local.clear()
+        RouteCacheEntry.objects.all().delete()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['local_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_ratio'] = ((stats['local_hits'] + stats['db_hits']) / lookups
+                              if lookups else 0.0)
+        stats['local_entries'] = len(self.local)
+        return stats
+
+
+route_cache = RouteCache.from_settings()
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from .fuel import CORRIDOR_PIECE_VERTICES, METERS_PER_DEGREE, METERS_PER_MILE
+
+# FeatureTruckStops of the features given, as fuel.CORRIDOR_SQL finds them
+# with the planar radius worked out per feature from its extent.
+BUILD_SQL = '''
+WITH line AS (
+    SELECT feature.id, feature.geometry AS geom, summary.distance,
+           %(meters)s / (%(meters_per_degree)s * cos(radians(
+               LEAST(GREATEST(abs(ST_YMin(feature.geometry)), abs(ST_YMax(feature.geometry))), 89.0)))) AS degrees
+    FROM routing_feature feature
+    JOIN routing_featuresummary summary ON summary.id = feature.summary_id
+    WHERE feature.id = ANY(%(features)s)
+), pieces AS (
+    SELECT line.id, line.degrees, ST_Subdivide(line.geom, %(piece_vertices)s) AS geom FROM line
+), candidates AS (
+    SELECT DISTINCT pieces.id AS feature_id, stop.id AS truck_stop_id
+    FROM pieces
+    JOIN routing_truckstop stop
+      ON ST_DWithin(stop.coordinate, pieces.geom, pieces.degrees)
+     AND ST_DWithin(stop.coordinate::geography, pieces.geom::geography, %(meters)s)
+)
+INSERT INTO routing_featuretruckstop (feature_id, truck_stop_id, distance_along, detour)
+SELECT line.id, stop.id,
+       ST_LineLocatePoint(line.geom, stop.coordinate) * line.distance / %(meters_per_mile)s,
+       ST_Distance(stop.coordinate::geography, line.geom::geography) / %(meters_per_mile)s
+FROM candidates
+JOIN line ON line.id = candidates.feature_id
+JOIN routing_truckstop stop ON stop.id = candidates.truck_stop_id
+'''
+
+# Truck stops given, with the planar radius of the corridor around each
+# worked out from its latitude, so the spatial index on the feature geometry
+# narrows the features near it down.
+STOP_CTE = '''
+WITH stop AS (
+    SELECT id, coordinate,
+           %(meters)s / (%(meters_per_degree)s * cos(radians(
+               LEAST(abs(ST_Y(coordinate)) + %(meters)s / %(meters_per_degree)s, 89.0)))) AS degrees
+    FROM routing_truckstop
+    WHERE id = ANY(%(stops)s)
+)
+'''
+
+# FeatureTruckStops of the stops given, from every built feature within its
+# own corridor of them.
+REFRESH_SQL = STOP_CTE + '''
+INSERT INTO routing_featuretruckstop (feature_id, truck_stop_id, distance_along, detour)
+SELECT feature.id, stop.id,
+       ST_LineLocatePoint(feature.geometry, stop.coordinate) * summary.distance / %(meters_per_mile)s,
+       ST_Distance(stop.coordinate::geography, feature.geometry::geography) / %(meters_per_mile)s
+FROM stop
+JOIN routing_feature feature
+  ON ST_DWithin(feature.geometry, stop.coordinate, stop.degrees)
+JOIN routing_featuresummary summary ON summary.id = feature.summary_id
+WHERE feature.corridor_miles IS NOT NULL
+  AND ST_DWithin(stop.coordinate::geography, feature.geometry::geography,
+                 feature.corridor_miles * %(meters_per_mile)s)
+'''
+
+# Features near the stops given whose corridor was never built.
+UNBUILT_SQL = STOP_CTE + '''
+SELECT DISTINCT feature.id
+FROM stop
+JOIN routing_feature feature
+  ON ST_DWithin(feature.geometry, stop.coordinate, stop.degrees)
+WHERE feature.corridor_miles IS NULL
+  AND ST_DWithin(stop.coordinate::geography, feature.geometry::geography, %(meters)s)
+ORDER BY feature.id
+'''
+
+
+def sql_params(miles, **params):
+    return dict(params, meters=miles * METERS_PER_MILE, meters_per_degree=METERS_PER_DEGREE,
+                meters_per_mile=METERS_PER_MILE, piece_vertices=CORRIDOR_PIECE_VERTICES)
+
+
+@transaction.atomic
+def build_corridors(feature_ids, miles=None):
+    """
+    Store the truck stops within `miles` (TRUCK_STOP_CORRIDOR_MILES) of each
+    feature's route, replacing what was stored for them. Returns the number
+    of FeatureTruckStops stored.
+    """
+    miles = settings.TRUCK_STOP_CORRIDOR_MILES if miles is None else miles
+    feature_ids = list(feature_ids)
+    with connection.cursor() as cursor:
+        # Builds of the same feature, after ingest and from a stop refresh,
+        # take turns rather than both inserting its stops.
+        cursor.execute('SELECT id FROM routing_feature WHERE id = ANY(%s) ORDER BY id FOR UPDATE', [feature_ids])
+        cursor.execute('DELETE FROM routing_featuretruckstop WHERE feature_id = ANY(%s)', [feature_ids])
+        cursor.execute(BUILD_SQL, sql_params(miles, features=feature_ids))
+        stored = cursor.rowcount
+        cursor.execute('UPDATE routing_feature SET corridor_miles = %s WHERE id = ANY(%s)', [miles, feature_ids])
+    return stored
+
+
+@transaction.atomic
+def refresh_truck_stops(truck_stop_ids):
+    """
+    Recompute the FeatureTruckStops of truck stops that were added or
+    moved, returns the number stored. Prices aren't stored with them, price
+    changes need no refresh.
+
+    Features are searched within TRUCK_STOP_CORRIDOR_MILES of each stop,
+    build those stored with a wider corridor again after lowering it.
+    Features found there whose corridor was never built, their build after
+    ingest having failed, are built along the way.
+    """
+    truck_stop_ids = list(truck_stop_ids)
+    if not truck_stop_ids:
+        return 0
+    params = sql_params(settings.TRUCK_STOP_CORRIDOR_MILES, stops=truck_stop_ids)
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM routing_featuretruckstop WHERE truck_stop_id = ANY(%s)', [truck_stop_ids])
+        cursor.execute(REFRESH_SQL, params)
+        stored = cursor.rowcount
+        cursor.execute(UNBUILT_SQL, params)
+        unbuilt = [row[0] for row in cursor.fetchall()]
+    if unbuilt:
+        stored += build_corridors(unbuilt)
+    return stored
+
+
+def features_to_build(after, batch_size, rebuild=False):
+    # Ids past `after` of features whose corridor was never built, or of all
+    # features to `rebuild`.
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM routing_feature WHERE id > %s '
+                       + ('' if rebuild else 'AND corridor_miles IS NULL ') + 'ORDER BY id LIMIT %s',
+                       [after, batch_size])
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,346 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .geo import format_lon_lat
+from .metrics import observe_upstream
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DirectionsError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(DirectionsError):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter, `rate` tokens per second up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Take a token and return how long to wait before it may be used.
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class RetryBudget:
+    """
+    Caps retries to `ratio` of requests (with a burst of `capacity`) so
+    retries can't multiply the load on an upstream that is already failing.
+    """
+
+    def __init__(self, ratio=0.2, capacity=10):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.balance = float(capacity)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds, then lets a single trial call through.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # Only one trial call at a time while half open, but another one
+            # once `reset_timeout` has passed in case the last was lost.
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self.opened_at = self.clock()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def release(self):
+        # A call that ended without an outcome, such as a cancelled one,
+        # lets the next call be the trial straight away.
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = self.clock() - self.reset_timeout
+
+
+class DirectionsClient:
+    """
+    OpenRouteService client shared by every request in the process.
+
+    Connections are pooled and kept alive, every call has a connect/read
+    timeout, failed calls are retried with full jitter exponential backoff
+    within a retry budget, calls are rate limited to the ORS quota and a
+    circuit breaker stops calling ORS while it is down.
+    """
+
+    def __init__(self, base_url, api_key=None, connect_timeout=3.05, read_timeout=30,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, rate=40 / 60, burst=5,
+                 pool_size=20, failure_threshold=5, reset_timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.limiter = TokenBucket(rate, burst)
+        self.budget = RetryBudget()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = api_key
+        self.session.headers['Accept'] = 'application/json, application/geo+json'
+
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='directions')
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        return cls(**dict(dict(
+            base_url=settings.OPENROUTE_BASE_URL,
+            api_key=settings.OPENROUTE_API_KEY,
+            connect_timeout=settings.OPENROUTE_CONNECT_TIMEOUT,
+            read_timeout=settings.OPENROUTE_READ_TIMEOUT,
+            max_retries=settings.OPENROUTE_MAX_RETRIES,
+            rate=settings.OPENROUTE_RATE_LIMIT / 60,
+            burst=settings.OPENROUTE_RATE_BURST,
+            pool_size=settings.OPENROUTE_POOL_SIZE,
+        ), **overrides))
+
+    def backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _send(self, method, path, params=None, json=None):
+        # "directions", "matrix" or "geocode", the profile would only add
+        # cardinality.
+        endpoint = next(part for part in path.split('/') if part and part != 'v2')
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', params=params, json=json,
+                                            timeout=self.timeout)
+            status = response.status_code
+            return response
+        finally:
+            observe_upstream(endpoint, status, time.perf_counter() - started)
+
+    def _outcome(self, response=None, error=None):
+        """
+        Classify one attempt: returns (result, retryable error).
+        """
+        if error is not None:
+            self.breaker.record_failure()
+            return None, DirectionsError(f'Routing service request failed: {error}')
+
+        if response.status_code in RETRY_STATUSES:
+            # Rate limited means ORS is up, don't trip the breaker for it.
+            if response.status_code == 429:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            return None, DirectionsError(
+                f'Routing service returned {response.status_code}', status=response.status_code)
+
+        self.breaker.record_success()
+        if response.status_code >= 400:
+            raise DirectionsError(f'Routing service returned {response.status_code}: {response.text[:200]}',
+                                  status=response.status_code)
+        return response.json(), None
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError('Routing service circuit is open', status=503)
+
+    def _may_retry(self, attempt):
+        return attempt < self.max_retries and self.budget.withdraw()
+
+    def request(self, method, path, params=None, json=None):
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self._check_breaker()
+            self.limiter.acquire()
+
+            response = None
+            try:
+                response = self._send(method, path, params, json)
+                result, error = self._outcome(response)
+            except requests.RequestException as e:
+                result, error = self._outcome(error=e)
+            except BaseException:
+                self.breaker.release()
+                raise
+
+            if error is None:
+                return result
+            if not self._may_retry(attempt):
+                raise error
+
+            time.sleep(self.backoff(attempt, response))
+            attempt += 1
+
+    async def arequest(self, method, path, params=None, json=None):
+        loop = asyncio.get_running_loop()
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self._check_breaker()
+            await self.limiter.acquire_async()
+
+            response = None
+            try:
+                # With the caller's context, where the request's metrics are.
+                response = await loop.run_in_executor(
+                    self._executor, contextvars.copy_context().run, self._send, method, path, params, json)
+                result, error = self._outcome(response)
+            except requests.RequestException as e:
+                result, error = self._outcome(error=e)
+            except BaseException:
+                self.breaker.release()
+                raise
+
+            if error is None:
+                return result
+            if not self._may_retry(attempt):
+                raise error
+
+            await asyncio.sleep(self.backoff(attempt, response))
+            attempt += 1
+
+    def directions_params(self, start, end):
+        return {'start': format_lon_lat(start), 'end': format_lon_lat(end)}
+
+    def directions_body(self, coordinates, options=None):
+        body = {'coordinates': [list(coordinate) for coordinate in coordinates]}
+        if options:
+            body['options'] = options
+        return body
+
+    def directions(self, start, end, profile='driving-car', options=None):
+        """
+        GeoJSON directions. With `options` (vehicle restrictions and the
+        like) the request is a POST, which returns the same document.
+        """
+        if options:
+            return self.directions_via([start, end], profile, options)
+        return self.request('GET', f'/v2/directions/{profile}', params=self.directions_params(start, end))
+
+    async def adirections(self, start, end, profile='driving-car', options=None):
+        if options:
+            return await self.arequest('POST', f'/v2/directions/{profile}/geojson',
+                                       json=self.directions_body([start, end], options))
+        return await self.arequest('GET', f'/v2/directions/{profile}', params=self.directions_params(start, end))
+
+    def directions_via(self, coordinates, profile='driving-car', options=None):
+        # One route through all coordinates in order, a segment per leg.
+        return self.request('POST', f'/v2/directions/{profile}/geojson',
+                            json=self.directions_body(coordinates, options))
+
+    def matrix(self, locations, profile='driving-car', sources=None, destinations=None):
+        """
+        Durations (seconds) and distances (metres) from every source to
+        every destination, indices into `locations`, all of them by default.
+        """
+        body = {'locations': [list(location) for location in locations], 'metrics': ['duration', 'distance']}
+        if sources is not None:
+            body['sources'] = list(sources)
+        if destinations is not None:
+            body['destinations'] = list(destinations)
+        return self.request('POST', f'/v2/matrix/{profile}', json=body)
+
+    def geocode(self, address, city, state, country='USA'):
+        # GeoJSON of the best match for a structured address.
+        return self.request('GET', '/geocode/search/structured', params={
+            'address': address,
+            'locality': city,
+            'region': state,
+            'country': country,
+            'size': 1,
+        })
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_directions_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DirectionsClient.from_settings()
+        return _client
@@ -0,0 +1,191 @@
+import json
+import math
+import struct
+import time
+from array import array
+from bisect import bisect_left
+
+MAGIC = b'TRGRAPH2'
+
+# Grid cell size in degrees for snapping coordinates to nodes.
+GRID_SIZE = 0.01
+
+
+def grid_cell(lon, lat, size=GRID_SIZE):
+    return math.floor(lon / size), math.floor(lat / size)
+
+
+def cell_key(x, y):
+    # Pack a (x, y) cell into one sortable int.
+    return (x + (1 << 20)) << 21 | (y + (1 << 20))
+
+
+def write_arrays(path, magic, header, arrays):
+    """
+    Write `arrays` ((name, array) pairs) after a JSON header. Arrays are
+    dumped raw, so files only load on machines with the same byte order.
+    """
+    header = dict(header, arrays=[[name, values.typecode, len(values)] for name, values in arrays])
+    header = json.dumps(header).encode()
+    with open(path, 'wb') as f:
+        f.write(magic)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for _, values in arrays:
+            values.tofile(f)
+
+
+def read_arrays(path, magic):
+    # Returns (header, {name: array}) for a file written by write_arrays.
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f'{path} is not a {magic.decode()} file')
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length))
+
+        arrays = {}
+        for name, typecode, length in header['arrays']:
+            values = array(typecode)
+            values.fromfile(f, length)
+            arrays[name] = values
+    return header, arrays
+
+
+# Edge flags.
+HAZMAT_FORBIDDEN = 1
+
+# Per edge truck limits when the way has none.
+NO_RESTRICTIONS = (0.0, 0.0, 0.0, 0.0, 0)
+
+
+class RoadGraph:
+    """
+    Directed road graph held in flat arrays.
+
+    Edges are stored in compressed sparse row form twice, by source for
+    forward searches and by target for backward searches. Nodes are also
+    bucketed into a grid of GRID_SIZE degree cells, sorted by cell, to snap
+    coordinates to the nearest node.
+
+    Truck limits are kept per edge: height, weight, width and length (metres
+    and tonnes, 0 for no limit) and HAZMAT_FORBIDDEN in edge_flags.
+    """
+
+    ARRAYS = (
+        ('lon', 'd'), ('lat', 'd'),
+        ('out_offsets', 'I'), ('out_targets', 'I'), ('out_edges', 'I'),
+        ('in_offsets', 'I'), ('in_sources', 'I'), ('in_edges', 'I'),
+        ('edge_length', 'f'), ('edge_duration', 'f'), ('edge_name', 'I'),
+        ('edge_max_height', 'f'), ('edge_max_weight', 'f'), ('edge_max_width', 'f'), ('edge_max_length', 'f'),
+        ('edge_flags', 'B'),
+        ('cell_keys', 'q'), ('cell_offsets', 'I'), ('cell_nodes', 'I'),
+    )
+
+    def __init__(self, arrays, names, max_speed, meta=None):
+        for name, _ in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.names = names
+        # Metres per second, bounds the A* heuristic.
+        self.max_speed = max_speed
+        self.meta = meta or {}
+
+    @property
+    def node_count(self):
+        return len(self.lon)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_length)
+
+    @classmethod
+    def from_edges(cls, lon, lat, edges, names, meta=None):
+        """
+        Build a graph from node coordinates and (source, target, length,
+        duration, name index[, restrictions]) edge tuples, restrictions
+        being a (max height, max weight, max width, max length, flags)
+        tuple.
+        """
+        node_count = len(lon)
+        edge_count = len(edges)
+
+        arrays = {'lon': array('d', lon), 'lat': array('d', lat)}
+        arrays['edge_length'] = array('f', (edge[2] for edge in edges))
+        arrays['edge_duration'] = array('f', (edge[3] for edge in edges))
+        arrays['edge_name'] = array('I', (edge[4] for edge in edges))
+        restrictions = [edge[5] if len(edge) > 5 else NO_RESTRICTIONS for edge in edges]
+        for position, name in enumerate(('edge_max_height', 'edge_max_weight', 'edge_max_width', 'edge_max_length')):
+            arrays[name] = array('f', (limits[position] for limits in restrictions))
+        arrays['edge_flags'] = array('B', (limits[4] for limits in restrictions))
+
+        for prefix, key, other in (('out', 0, 1), ('in', 1, 0)):
+            order = sorted(range(edge_count), key=lambda index: edges[index][key])
+            offsets = array('I', bytes(4 * (node_count + 1)))
+            for edge in edges:
+                offsets[edge[key] + 1] += 1
+            for node in range(node_count):
+                offsets[node + 1] += offsets[node]
+            arrays[f'{prefix}_offsets'] = offsets
+            arrays['out_targets' if prefix == 'out' else 'in_sources'] = array(
+                'I', (edges[index][other] for index in order))
+            arrays[f'{prefix}_edges'] = array('I', order)
+
+        cells = sorted(range(node_count), key=lambda node: cell_key(*grid_cell(lon[node], lat[node])))
+        cell_keys = array('q')
+        cell_offsets = array('I')
+        for position, node in enumerate(cells):
+            key = cell_key(*grid_cell(lon[node], lat[node]))
+            if not cell_keys or cell_keys[-1] != key:
+                cell_keys.append(key)
+                cell_offsets.append(position)
+        cell_offsets.append(node_count)
+        arrays.update(cell_keys=cell_keys, cell_offsets=cell_offsets, cell_nodes=array('I', cells))
+
+        max_speed = max((edges[index][2] / edges[index][3] for index in range(edge_count)
+                         if edges[index][3] > 0), default=1.0)
+        meta = dict(meta or {}, created=int(time.time()))
+        return cls(arrays, names, max_speed, meta)
+
+    def save(self, path):
+        write_arrays(path, MAGIC, {'names': self.names, 'max_speed': self.max_speed, 'meta': self.meta},
+                     [(name, getattr(self, name)) for name, _ in self.ARRAYS])
+
+    @classmethod
+    def load(cls, path):
+        header, arrays = read_arrays(path, MAGIC)
+        return cls(arrays, header['names'], header['max_speed'], header['meta'])
+
+    def memory_footprint(self):
+        # Bytes held by each array plus the street name table.
+        footprint = {name: getattr(self, name).buffer_info()[1] * getattr(self, name).itemsize
+                     for name, _ in self.ARRAYS}
+        footprint['names'] = sum(len(name.encode()) for name in self.names)
+        footprint['total'] = sum(footprint.values())
+        return footprint
+
+    def nodes_near(self, lon, lat, rings=1):
+        x, y = grid_cell(lon, lat)
+        for cell_x in range(x - rings, x + rings + 1):
+            for cell_y in range(y - rings, y + rings + 1):
+                key = cell_key(cell_x, cell_y)
+                position = bisect_left(self.cell_keys, key)
+                if position < len(self.cell_keys) and self.cell_keys[position] == key:
+                    yield from self.cell_nodes[self.cell_offsets[position]:self.cell_offsets[position + 1]]
+
+    def nearest_node(self, lon, lat, max_rings=10):
+        """
+        Closest node to a coordinate, or None if there is none within
+        `max_rings` grid cells.
+        """
+        scale = math.cos(math.radians(lat))
+        best = None
+        for rings in range(1, max_rings + 1):
+            best, best_distance = None, None
+            for node in self.nodes_near(lon, lat, rings):
+                distance = math.hypot((self.lon[node] - lon) * scale, self.lat[node] - lat)
+                if best_distance is None or distance < best_distance:
+                    best, best_distance = node, distance
+            # Anything outside the searched cells is at least `rings` cells
+            # away, so a node closer than that can't be beaten.
+            if best is not None and best_distance <= rings * GRID_SIZE * scale:
+                return best
+        return best
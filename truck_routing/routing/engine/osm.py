@@ -0,0 +1,187 @@
+import bz2
+import gzip
+import math
+import re
+import xml.etree.ElementTree as ElementTree
+from array import array
+
+from .graph import HAZMAT_FORBIDDEN, NO_RESTRICTIONS, RoadGraph
+
+EARTH_RADIUS_METERS = 6371008.8
+
+# Default speeds in km/h per OSM highway type, used when a way has no usable
+# maxspeed tag. Only these highway types are routable.
+HIGHWAY_SPEEDS = {
+    'motorway': 105, 'motorway_link': 60,
+    'trunk': 90, 'trunk_link': 50,
+    'primary': 80, 'primary_link': 45,
+    'secondary': 70, 'secondary_link': 40,
+    'tertiary': 60, 'tertiary_link': 35,
+    'unclassified': 50, 'residential': 40,
+    'living_street': 10, 'service': 20,
+}
+
+MAXSPEED = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(mph)?\s*$')
+
+# 4.2, 4.2 m, 13.5 ft, 13'6", 13' 6"
+LENGTH = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(m|ft|\')?\s*(?:(\d+(?:\.\d+)?)\s*(?:"|in))?\s*$')
+# 36, 36 t, 80000 lbs, 40 st (short tons)
+WEIGHT = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(t|lbs|st|kg)?\s*$')
+WEIGHT_UNITS = {None: 1.0, 't': 1.0, 'kg': 0.001, 'lbs': 0.00045359237, 'st': 0.90718474}
+
+RESTRICTION_TAGS = ('maxheight', 'maxweight', 'maxwidth', 'maxlength', 'hazmat')
+
+
+def open_extract(path):
+    path = str(path)
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def haversine_meters(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(h))
+
+
+def way_speed(tags):
+    # km/h
+    match = MAXSPEED.match(tags.get('maxspeed', ''))
+    if match and float(match.group(1)) > 0:
+        speed = float(match.group(1))
+        return speed * 1.609344 if match.group(2) else speed
+    return HIGHWAY_SPEEDS[tags['highway']]
+
+
+def parse_length(value):
+    # Metres, or None for values like "default" or "none".
+    match = LENGTH.match(value or '')
+    if not match:
+        return None
+    number, unit, inches = match.groups()
+    if unit in ('ft', "'"):
+        return (float(number) * 12 + float(inches or 0)) * 0.0254
+    if inches:
+        return None
+    return float(number)
+
+
+def parse_weight(value):
+    # Tonnes, or None.
+    match = WEIGHT.match(value or '')
+    if not match:
+        return None
+    return float(match.group(1)) * WEIGHT_UNITS[match.group(2)]
+
+
+def way_restrictions(tags):
+    """
+    (max height, max weight, max width, max length, flags) for a way, in
+    metres and tonnes with 0 for no limit.
+    """
+    if not any(key in tags for key in RESTRICTION_TAGS):
+        return NO_RESTRICTIONS
+    return (
+        parse_length(tags.get('maxheight')) or 0.0,
+        parse_weight(tags.get('maxweight')) or 0.0,
+        parse_length(tags.get('maxwidth')) or 0.0,
+        parse_length(tags.get('maxlength')) or 0.0,
+        HAZMAT_FORBIDDEN if tags.get('hazmat') == 'no' else 0,
+    )
+
+
+def way_direction(tags):
+    """
+    1 forward only, -1 backward only, 0 both ways.
+    """
+    oneway = tags.get('oneway', '')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == 'no':
+        return 0
+    if tags['highway'] in ('motorway', 'motorway_link') or tags.get('junction') == 'roundabout':
+        return 1
+    return 0
+
+
+def iter_elements(path, tag):
+    with open_extract(path) as f:
+        context = ElementTree.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        for event, element in context:
+            if event == 'end' and element.tag in ('node', 'way', 'relation'):
+                if element.tag == tag:
+                    yield element
+                # Drop parsed elements so the tree never grows.
+                root.clear()
+
+
+def read_ways(path):
+    for way in iter_elements(path, 'way'):
+        tags = {tag.get('k'): tag.get('v') for tag in way.iter('tag')}
+        if tags.get('highway') not in HIGHWAY_SPEEDS or tags.get('access') in ('no', 'private'):
+            continue
+        refs = array('q', (int(nd.get('ref')) for nd in way.iter('nd')))
+        if len(refs) > 1:
+            yield refs, tags
+
+
+def build_from_osm(path, on_progress=None):
+    """
+    Build a RoadGraph from an OSM XML extract (.osm, .osm.gz or .osm.bz2).
+
+    Reads the file twice, first for routable ways and the node ids they use,
+    then for the coordinates of just those nodes, so memory stays
+    proportional to the road network rather than the extract.
+    """
+    ways = []
+    used = set()
+    for refs, tags in read_ways(path):
+        ways.append((refs, {key: tags[key] for key in ('highway', 'name', 'ref', 'maxspeed', 'oneway', 'junction')
+                            + RESTRICTION_TAGS if key in tags}))
+        used.update(refs)
+    if on_progress:
+        on_progress(f'{len(ways)} routable ways, {len(used)} nodes')
+
+    index = {}
+    lon = array('d')
+    lat = array('d')
+    for node in iter_elements(path, 'node'):
+        node_id = int(node.get('id'))
+        if node_id in used:
+            index[node_id] = len(lon)
+            lon.append(float(node.get('lon')))
+            lat.append(float(node.get('lat')))
+    del used
+
+    names = ['']
+    name_index = {'': 0}
+    edges = []
+    for refs, tags in ways:
+        name = tags.get('name') or tags.get('ref') or ''
+        if name not in name_index:
+            name_index[name] = len(names)
+            names.append(name)
+
+        speed = way_speed(tags) / 3.6
+        direction = way_direction(tags)
+        restrictions = way_restrictions(tags)
+        nodes = [index[ref] for ref in refs if ref in index]
+        for source, target in zip(nodes, nodes[1:]):
+            length = haversine_meters(lon[source], lat[source], lon[target], lat[target])
+            duration = length / speed
+            if direction >= 0:
+                edges.append((source, target, length, duration, name_index[name], restrictions))
+            if direction <= 0:
+                edges.append((target, source, length, duration, name_index[name], restrictions))
+
+    if on_progress:
+        on_progress(f'{len(edges)} edges')
+
+    return RoadGraph.from_edges(lon, lat, edges, names, meta={'source': str(path)})
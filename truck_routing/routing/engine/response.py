@@ -0,0 +1,134 @@
+import math
+import time
+
+# ORS instruction types.
+TURN_LEFT = 0
+TURN_RIGHT = 1
+SHARP_LEFT = 2
+SHARP_RIGHT = 3
+SLIGHT_LEFT = 4
+SLIGHT_RIGHT = 5
+STRAIGHT = 6
+GOAL = 10
+DEPART = 11
+
+TURN_WORDS = {
+    TURN_LEFT: 'Turn left', TURN_RIGHT: 'Turn right',
+    SHARP_LEFT: 'Turn sharp left', SHARP_RIGHT: 'Turn sharp right',
+    SLIGHT_LEFT: 'Keep left', SLIGHT_RIGHT: 'Keep right',
+    STRAIGHT: 'Continue straight',
+}
+
+
+def bearing(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    x = math.sin(lon2 - lon1) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
+    return math.degrees(math.atan2(x, y)) % 360
+
+
+def turn_type(before, after):
+    # Signed change of heading, positive to the right.
+    angle = (after - before + 540) % 360 - 180
+    if abs(angle) < 15:
+        return STRAIGHT
+    if abs(angle) < 45:
+        return SLIGHT_RIGHT if angle > 0 else SLIGHT_LEFT
+    if abs(angle) < 135:
+        return TURN_RIGHT if angle > 0 else TURN_LEFT
+    return SHARP_RIGHT if angle > 0 else SHARP_LEFT
+
+
+def instruction(step_type, name):
+    if step_type == DEPART:
+        return f'Head out on {name}' if name != '-' else 'Head out'
+    if step_type == GOAL:
+        return 'Arrive at your destination'
+    words = TURN_WORDS[step_type]
+    return f'{words} onto {name}' if name != '-' else words
+
+
+def segment_steps(graph, path, offset):
+    """
+    Steps for one leg, consecutive edges with the same street name making up
+    one step. `offset` is the index of the leg's first vertex in the route.
+    """
+    lon, lat = graph.lon, graph.lat
+    steps = []
+    current = None
+    for position, edge in enumerate(path.edges):
+        name = graph.names[graph.edge_name[edge]] or '-'
+        if current is None or name != current['name']:
+            source, target = path.nodes[position], path.nodes[position + 1]
+            if current is None:
+                step_type = DEPART
+            else:
+                previous = path.nodes[position - 1]
+                step_type = turn_type(bearing(lon[previous], lat[previous], lon[source], lat[source]),
+                                      bearing(lon[source], lat[source], lon[target], lat[target]))
+            current = {'distance': 0.0, 'duration': 0.0, 'type': step_type,
+                       'instruction': instruction(step_type, name), 'name': name,
+                       'way_points': [offset + position, offset + position]}
+            steps.append(current)
+
+        current['distance'] += graph.edge_length[edge]
+        current['duration'] += graph.edge_duration[edge]
+        current['way_points'][1] = offset + position + 1
+
+    last = offset + len(path.nodes) - 1
+    steps.append({'distance': 0.0, 'duration': 0.0, 'type': GOAL, 'instruction': instruction(GOAL, '-'),
+                  'name': '-', 'way_points': [last, last]})
+    for step in steps:
+        step['distance'] = round(step['distance'], 1)
+        step['duration'] = round(step['duration'], 1)
+    return steps
+
+
+def directions_response(graph, paths, coordinates, profile):
+    """
+    Render ShortestPaths between consecutive `coordinates` as the GeoJSON
+    ORS returns for directions, one segment per leg, so it can be persisted
+    the same way.
+    """
+    lon, lat = graph.lon, graph.lat
+    vertices = []
+    way_points = [0]
+    segments = []
+    for path in paths:
+        # Each leg starts on the vertex the previous one ended on.
+        offset = max(len(vertices) - 1, 0)
+        vertices.extend(path.nodes[1:] if vertices else path.nodes)
+        way_points.append(len(vertices) - 1)
+        segments.append({'distance': round(sum(graph.edge_length[edge] for edge in path.edges), 1),
+                         'duration': round(path.duration, 1),
+                         'steps': segment_steps(graph, path, offset)})
+
+    route = [[round(lon[node], 6), round(lat[node], 6)] for node in vertices]
+    lons = [c[0] for c in route]
+    lats = [c[1] for c in route]
+    bbox = [min(lons), min(lats), max(lons), max(lats)]
+    summary = {'distance': round(sum(segment['distance'] for segment in segments), 1),
+               'duration': round(sum(segment['duration'] for segment in segments), 1)}
+
+    return {
+        'type': 'FeatureCollection',
+        'bbox': bbox,
+        'features': [{
+            'bbox': bbox,
+            'type': 'Feature',
+            'properties': {
+                'segments': segments,
+                'summary': summary,
+                'way_points': way_points,
+            },
+            'geometry': {'coordinates': route, 'type': 'LineString'},
+        }],
+        'metadata': {
+            'attribution': 'OpenStreetMap contributors',
+            'service': 'routing',
+            'timestamp': int(time.time() * 1000),
+            'query': {'coordinates': [list(coordinate) for coordinate in coordinates], 'profile': profile,
+                      'format': 'json'},
+            'engine': {'version': 'local', 'graph_date': graph.meta.get('created')},
+        },
+    }
@@ -0,0 +1,225 @@
+import math
+from array import array
+from bisect import bisect_left
+
+from .graph import HAZMAT_FORBIDDEN, cell_key, read_arrays, write_arrays
+
+MAGIC = b'TRLIMIT1'
+
+# Coarser than the node grid: restricted segments are sparse and a route
+# crossing fewer cells costs less to check than scanning a few more entries.
+GRID_SIZE = 0.05
+
+METERS_PER_DEGREE = 111320.0
+
+LIMITS = (('height', 'max_height'), ('weight', 'max_weight'), ('width', 'max_width'), ('length', 'max_length'))
+
+
+def blocked(vehicle, max_height, max_weight, max_width, max_length, flags):
+    """
+    Whether `vehicle` (anything with height, weight, width, length and
+    hazmat attributes, None for unknown) is kept off a road with these limits.
+    """
+    return bool(
+        (max_height and vehicle.height and vehicle.height > max_height)
+        or (max_weight and vehicle.weight and vehicle.weight > max_weight)
+        or (max_width and vehicle.width and vehicle.width > max_width)
+        or (max_length and vehicle.length and vehicle.length > max_length)
+        or (flags & HAZMAT_FORBIDDEN and vehicle.hazmat)
+    )
+
+
+def edge_filter(graph, vehicle):
+    """
+    `allowed` callback for bidirectional_astar keeping `vehicle` to edges it
+    may use, or None when nothing needs checking.
+    """
+    if vehicle is None or not vehicle.is_truck:
+        return None
+
+    height, weight = graph.edge_max_height, graph.edge_max_weight
+    width, length, flags = graph.edge_max_width, graph.edge_max_length, graph.edge_flags
+
+    def allowed(edge):
+        return not blocked(vehicle, height[edge], weight[edge], width[edge], length[edge], flags[edge])
+
+    return allowed
+
+
+def cells_around(lon1, lat1, lon2, lat2, margin):
+    # Cells of the segment's bounding box grown by `margin` degrees.
+    for x in range(math.floor((min(lon1, lon2) - margin) / GRID_SIZE),
+                   math.floor((max(lon1, lon2) + margin) / GRID_SIZE) + 1):
+        for y in range(math.floor((min(lat1, lat2) - margin) / GRID_SIZE),
+                       math.floor((max(lat1, lat2) + margin) / GRID_SIZE) + 1):
+            yield cell_key(x, y)
+
+
+def segment_distance(lon, lat, lon1, lat1, lon2, lat2):
+    # Metres from a point to a segment, on a local flat projection.
+    scale = math.cos(math.radians(lat)) * METERS_PER_DEGREE
+    x, y = (lon - lon1) * scale, (lat - lat1) * METERS_PER_DEGREE
+    dx, dy = (lon2 - lon1) * scale, (lat2 - lat1) * METERS_PER_DEGREE
+    squared = dx * dx + dy * dy
+    t = 0.0 if not squared else max(0.0, min(1.0, (x * dx + y * dy) / squared))
+    return math.hypot(x - t * dx, y - t * dy)
+
+
+def parallel(lon1, lat1, lon2, lat2, lon3, lat3, lon4, lat4, max_angle=30):
+    # Whether two segments run along each other, in either direction.
+    scale = math.cos(math.radians(lat1))
+    first = math.atan2(lat2 - lat1, (lon2 - lon1) * scale)
+    second = math.atan2(lat4 - lat3, (lon4 - lon3) * scale)
+    angle = abs(math.degrees(first - second)) % 180
+    return min(angle, 180 - angle) <= max_angle
+
+
+class RestrictionIndex:
+    """
+    The restricted roads of a RoadGraph bucketed into GRID_SIZE degree cells,
+    for checking a route geometry from any source against truck limits
+    without touching the database or the full graph.
+
+    Each entry is one road segment with its limits. Matching is by geometry
+    only, both directions of a two way road share an entry.
+    """
+
+    ARRAYS = (
+        ('lon1', 'd'), ('lat1', 'd'), ('lon2', 'd'), ('lat2', 'd'),
+        ('max_height', 'f'), ('max_weight', 'f'), ('max_width', 'f'), ('max_length', 'f'),
+        ('flags', 'B'),
+        ('cell_keys', 'q'), ('cell_offsets', 'I'), ('cell_entries', 'I'),
+    )
+
+    def __init__(self, arrays, tolerance, meta=None):
+        for name, _ in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        # Metres, how close a route has to run along a restricted segment.
+        self.tolerance = tolerance
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.flags)
+
+    @classmethod
+    def from_graph(cls, graph, tolerance=15.0):
+        arrays = {name: array(typecode) for name, typecode in cls.ARRAYS}
+        seen = set()
+        for node in range(graph.node_count):
+            for position in range(graph.out_offsets[node], graph.out_offsets[node + 1]):
+                edge = graph.out_edges[position]
+                limits = (graph.edge_max_height[edge], graph.edge_max_weight[edge], graph.edge_max_width[edge],
+                          graph.edge_max_length[edge], graph.edge_flags[edge])
+                if not any(limits):
+                    continue
+                target = graph.out_targets[position]
+                if (target, node) in seen:
+                    continue
+                seen.add((node, target))
+
+                for name, value in zip(('lon1', 'lat1', 'lon2', 'lat2'), (
+                        graph.lon[node], graph.lat[node], graph.lon[target], graph.lat[target])):
+                    arrays[name].append(value)
+                for name, value in zip(('max_height', 'max_weight', 'max_width', 'max_length', 'flags'), limits):
+                    arrays[name].append(value)
+
+        margin = tolerance / METERS_PER_DEGREE * 2
+        buckets = {}
+        for entry in range(len(arrays['flags'])):
+            for key in cells_around(arrays['lon1'][entry], arrays['lat1'][entry],
+                                    arrays['lon2'][entry], arrays['lat2'][entry], margin):
+                buckets.setdefault(key, []).append(entry)
+
+        for key in sorted(buckets):
+            arrays['cell_keys'].append(key)
+            arrays['cell_offsets'].append(len(arrays['cell_entries']))
+            arrays['cell_entries'].extend(buckets[key])
+        arrays['cell_offsets'].append(len(arrays['cell_entries']))
+
+        return cls(arrays, tolerance, meta={'source': graph.meta.get('source'), 'created': graph.meta.get('created')})
+
+    def save(self, path):
+        write_arrays(path, MAGIC, {'tolerance': self.tolerance, 'meta': self.meta},
+                     [(name, getattr(self, name)) for name, _ in self.ARRAYS])
+
+    @classmethod
+    def load(cls, path):
+        header, arrays = read_arrays(path, MAGIC)
+        return cls(arrays, header['tolerance'], header['meta'])
+
+    def entries_in(self, key):
+        position = bisect_left(self.cell_keys, key)
+        if position < len(self.cell_keys) and self.cell_keys[position] == key:
+            return self.cell_entries[self.cell_offsets[position]:self.cell_offsets[position + 1]]
+        return ()
+
+    def violations(self, coordinates, vehicle):
+        """
+        Restricted segments a route ([lon, lat] vertices) runs along that
+        `vehicle` exceeds, as dicts with the segment's midpoint and limits.
+
+        Only cells the route passes through are looked up and entries are
+        filtered on the vehicle first, so the cost is a bounds check per
+        vertex plus geometry checks for the few blocking candidates.
+        """
+        if vehicle is None or not vehicle.is_truck or not len(self) or len(coordinates) < 2:
+            return []
+
+        # Runs of route segments by the cell they pass through. Checking a
+        # vertex against the current cell's bounds is much cheaper than
+        # computing its cell, routes have many vertices per cell.
+        segments_by_cell = {}
+
+        def add(key, first, last):
+            segments_by_cell.setdefault(key, []).append((first, last))
+
+        first = 0
+        x, y = math.floor(coordinates[0][0] / GRID_SIZE), math.floor(coordinates[0][1] / GRID_SIZE)
+        west, south = x * GRID_SIZE, y * GRID_SIZE
+        east, north = west + GRID_SIZE, south + GRID_SIZE
+        for index in range(1, len(coordinates)):
+            lon, lat = coordinates[index][0], coordinates[index][1]
+            if west <= lon < east and south <= lat < north:
+                continue
+            # Segment index - 1 leaves the cell.
+            add(cell_key(x, y), first, index - 1)
+            next_x, next_y = math.floor(lon / GRID_SIZE), math.floor(lat / GRID_SIZE)
+            if abs(next_x - x) + abs(next_y - y) > 1:
+                previous = coordinates[index - 1]
+                for key in cells_around(previous[0], previous[1], lon, lat, 0):
+                    add(key, index - 1, index - 1)
+            first = index - 1
+            x, y = next_x, next_y
+            west, south = x * GRID_SIZE, y * GRID_SIZE
+            east, north = west + GRID_SIZE, south + GRID_SIZE
+        add(cell_key(x, y), first, max(first, len(coordinates) - 2))
+
+        found = {}
+        for key, runs in segments_by_cell.items():
+            for entry in self.entries_in(key):
+                if entry in found or not blocked(vehicle, self.max_height[entry], self.max_weight[entry],
+                                                 self.max_width[entry], self.max_length[entry], self.flags[entry]):
+                    continue
+                lon1, lat1, lon2, lat2 = self.lon1[entry], self.lat1[entry], self.lon2[entry], self.lat2[entry]
+                middle = ((lon1 + lon2) / 2, (lat1 + lat2) / 2)
+                for index in (index for first, last in runs for index in range(first, last + 1)):
+                    (path_lon1, path_lat1), (path_lon2, path_lat2) = (coordinates[index][:2],
+                                                                      coordinates[index + 1][:2])
+                    if (segment_distance(*middle, path_lon1, path_lat1, path_lon2, path_lat2) <= self.tolerance
+                            and parallel(lon1, lat1, lon2, lat2, path_lon1, path_lat1, path_lon2, path_lat2)):
+                        found[entry] = index
+                        break
+
+        violations = []
+        for entry, index in sorted(found.items(), key=lambda item: item[1]):
+            violation = {'coordinate': [round((self.lon1[entry] + self.lon2[entry]) / 2, 6),
+                                        round((self.lat1[entry] + self.lat2[entry]) / 2, 6)],
+                         'way_point': index}
+            for _, name in LIMITS:
+                limit = getattr(self, name)[entry]
+                if limit:
+                    violation[name] = round(limit, 2)
+            if self.flags[entry] & HAZMAT_FORBIDDEN:
+                violation['hazmat'] = False
+            violations.append(violation)
+        return violations
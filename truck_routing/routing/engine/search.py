@@ -0,0 +1,156 @@
+import math
+from heapq import heappop, heappush
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+class NoRoute(Exception):
+    pass
+
+
+class ShortestPath:
+    def __init__(self, nodes, edges, duration, settled):
+        self.nodes = nodes
+        self.edges = edges
+        self.duration = duration
+        # Nodes settled by both searches, the cost of the query.
+        self.settled = settled
+
+
+def bidirectional_astar(graph, source, target, allowed=None):
+    """
+    Fastest path between two nodes of a RoadGraph.
+
+    Forward and backward A* run in turns with the average of the two
+    straight-line-time potentials, which keeps both searches consistent so
+    the usual bidirectional stopping rule holds: stop once the smallest
+    forward and backward keys add up to the best path found so far.
+
+    `allowed`, if given, is called with an edge index and returns False for
+    edges the vehicle may not use.
+    """
+    if source == target:
+        return ShortestPath([source], [], 0.0, 0)
+
+    lon, lat = graph.lon, graph.lat
+    # Slightly over the real top speed so float32 rounding of the stored
+    # durations can't make the heuristic overestimate.
+    inverse_speed = 1.0 / (graph.max_speed * 1.01)
+    source_lon, source_lat = math.radians(lon[source]), math.radians(lat[source])
+    target_lon, target_lat = math.radians(lon[target]), math.radians(lat[target])
+
+    def seconds_between(node_lon, node_lat, other_lon, other_lat):
+        h = (math.sin((other_lat - node_lat) / 2) ** 2
+             + math.cos(node_lat) * math.cos(other_lat) * math.sin((other_lon - node_lon) / 2) ** 2)
+        return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(h))) * inverse_speed
+
+    potentials = {}
+
+    def potential(node):
+        value = potentials.get(node)
+        if value is None:
+            node_lon, node_lat = math.radians(lon[node]), math.radians(lat[node])
+            value = (seconds_between(node_lon, node_lat, target_lon, target_lat)
+                     - seconds_between(source_lon, source_lat, node_lon, node_lat)) / 2
+            potentials[node] = value
+        return value
+
+    # Per direction: best known cost, predecessor (node, edge) and the heap.
+    forward = {'cost': {source: 0.0}, 'parent': {source: None}, 'heap': [(potential(source), source)],
+               'settled': set(), 'offsets': graph.out_offsets, 'neighbours': graph.out_targets,
+               'edges': graph.out_edges, 'sign': 1}
+    backward = {'cost': {target: 0.0}, 'parent': {target: None}, 'heap': [(-potential(target), target)],
+                'settled': set(), 'offsets': graph.in_offsets, 'neighbours': graph.in_sources,
+                'edges': graph.in_edges, 'sign': -1}
+
+    durations = graph.edge_duration
+    best, meeting = math.inf, None
+
+    while forward['heap'] and backward['heap']:
+        if forward['heap'][0][0] + backward['heap'][0][0] >= best:
+            break
+
+        search, other = ((forward, backward) if len(forward['heap']) <= len(backward['heap'])
+                         else (backward, forward))
+        _, node = heappop(search['heap'])
+        if node in search['settled']:
+            continue
+        search['settled'].add(node)
+
+        cost = search['cost'][node]
+        offsets, neighbours, edges = search['offsets'], search['neighbours'], search['edges']
+        for position in range(offsets[node], offsets[node + 1]):
+            edge = edges[position]
+            if allowed is not None and not allowed(edge):
+                continue
+
+            neighbour = neighbours[position]
+            neighbour_cost = cost + durations[edge]
+            if neighbour_cost < search['cost'].get(neighbour, math.inf):
+                search['cost'][neighbour] = neighbour_cost
+                search['parent'][neighbour] = (node, edge)
+                heappush(search['heap'], (neighbour_cost + search['sign'] * potential(neighbour), neighbour))
+
+                other_cost = other['cost'].get(neighbour)
+                if other_cost is not None and neighbour_cost + other_cost < best:
+                    best, meeting = neighbour_cost + other_cost, neighbour
+
+    if meeting is None:
+        raise NoRoute(f'No route between nodes {source} and {target}')
+
+    nodes, path_edges = [meeting], []
+    step = forward['parent'][meeting]
+    while step is not None:
+        node, edge = step
+        nodes.append(node)
+        path_edges.append(edge)
+        step = forward['parent'][node]
+    nodes.reverse()
+    path_edges.reverse()
+
+    step = backward['parent'][meeting]
+    while step is not None:
+        node, edge = step
+        nodes.append(node)
+        path_edges.append(edge)
+        step = backward['parent'][node]
+
+    return ShortestPath(nodes, path_edges, best,
+                        len(forward['settled']) + len(backward['settled']))
+
+
+def one_to_many(graph, source, targets, allowed=None):
+    """
+    Fastest (duration, length) from `source` to each of `targets`, by a plain
+    Dijkstra search that stops once every target is settled. Unreachable
+    targets are missing from the result.
+    """
+    remaining = set(targets)
+    results = {}
+    cost = {source: (0.0, 0.0)}
+    heap = [(0.0, source)]
+    settled = set()
+    offsets, neighbours, edges = graph.out_offsets, graph.out_targets, graph.out_edges
+    durations, lengths = graph.edge_duration, graph.edge_length
+
+    while heap and remaining:
+        duration, node = heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        if node in remaining:
+            remaining.discard(node)
+            results[node] = cost[node]
+
+        length = cost[node][1]
+        for position in range(offsets[node], offsets[node + 1]):
+            edge = edges[position]
+            if allowed is not None and not allowed(edge):
+                continue
+            neighbour = neighbours[position]
+            neighbour_duration = duration + durations[edge]
+            if neighbour not in cost or neighbour_duration < cost[neighbour][0]:
+                cost[neighbour] = (neighbour_duration, length + lengths[edge])
+                heappush(heap, (neighbour_duration, neighbour))
+
+    return results
@@ -0,0 +1,30 @@
+from rest_framework.exceptions import APIException, ValidationError
+
+from .directions import DirectionsError
+
+
+class UpstreamUnavailable(APIException):
+    status_code = 503
+    default_detail = 'The routing service is unavailable, try again later.'
+    default_code = 'upstream_unavailable'
+
+
+class UpstreamError(APIException):
+    status_code = 502
+    default_detail = 'The routing service returned an invalid response.'
+    default_code = 'upstream_error'
+
+
+class IdempotencyKeyConflict(APIException):
+    status_code = 409
+    default_detail = 'The Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_conflict'
+
+
+def upstream_exception(error: DirectionsError):
+    # ORS rejects unroutable or invalid points with a 4xx, that's on the client.
+    if error.status is not None and 400 <= error.status < 500 and error.status != 429:
+        return ValidationError({'detail': str(error)})
+    if error.status is None or error.status in (429, 503):
+        return UpstreamUnavailable()
+    return UpstreamError()
@@ -0,0 +1,191 @@
+import math
+from collections import deque
+
+from django.db import connection
+
+METERS_PER_MILE = 1609.344
+METERS_PER_DEGREE = 111320.0
+
+# Split the route into pieces of at most this many vertices for the corridor
+# join so each ST_DWithin check only touches a small, well indexed bbox.
+CORRIDOR_PIECE_VERTICES = 64
+
+CORRIDOR_SQL = '''
+WITH line AS (
+    SELECT geometry AS geom FROM routing_feature WHERE id = %(feature)s
+), pieces AS (
+    SELECT ST_Subdivide(line.geom, %(piece_vertices)s) AS geom FROM line
+), candidates AS (
+    SELECT DISTINCT stop.id
+    FROM pieces
+    JOIN routing_truckstop stop
+      ON ST_DWithin(stop.coordinate, pieces.geom, %(degrees)s)
+     AND ST_DWithin(stop.coordinate::geography, pieces.geom::geography, %(meters)s)
+)
+SELECT stop.id, stop.opis_id, stop.name, stop.address, stop.city, stop.state,
+       stop.fuel_retail_price, ST_X(stop.coordinate), ST_Y(stop.coordinate),
+       ST_LineLocatePoint(line.geom, stop.coordinate) * %(route_miles)s AS distance_along,
+       ST_Distance(stop.coordinate::geography, line.geom::geography) / %(meters_per_mile)s AS detour
+FROM candidates
+JOIN routing_truckstop stop ON stop.id = candidates.id
+CROSS JOIN line
+ORDER BY distance_along, stop.id
+'''
+
+# The same from the FeatureTruckStops stored for the feature, one index scan.
+STORED_CORRIDOR_SQL = '''
+SELECT stop.id, stop.opis_id, stop.name, stop.address, stop.city, stop.state,
+       stop.fuel_retail_price, ST_X(stop.coordinate), ST_Y(stop.coordinate),
+       corridor.distance_along, corridor.detour
+FROM routing_featuretruckstop corridor
+JOIN routing_truckstop stop ON stop.id = corridor.truck_stop_id
+WHERE corridor.feature_id = %(feature)s AND corridor.detour <= %(miles)s
+ORDER BY corridor.distance_along, stop.id
+'''
+
+
+class FuelPlanError(ValueError):
+    pass
+
+
+def corridor_degrees(geometry, meters):
+    # Planar search radius that is never narrower than `meters` anywhere
+    # within the route's extent; the geography check makes it exact.
+    _, min_lat, _, max_lat = geometry.extent
+    widest_lat = min(max(abs(min_lat), abs(max_lat)), 89.0)
+    return meters / (METERS_PER_DEGREE * math.cos(math.radians(widest_lat)))
+
+
+def corridor_stops(feature, corridor_miles, stored=True):
+    """
+    Truck stops within `corridor_miles` of the feature's route, ordered by
+    distance along the route, with how far off the route they are.
+
+    Read from the FeatureTruckStops stored for the feature when they cover
+    the corridor (and `stored`), searched for otherwise.
+    """
+    if stored and feature.corridor_miles is not None and corridor_miles <= feature.corridor_miles:
+        sql = STORED_CORRIDOR_SQL
+        params = {'feature': feature.pk, 'miles': corridor_miles}
+    else:
+        meters = corridor_miles * METERS_PER_MILE
+        sql = CORRIDOR_SQL
+        params = {
+            'feature': feature.pk,
+            'piece_vertices': CORRIDOR_PIECE_VERTICES,
+            'degrees': corridor_degrees(feature.geometry, meters),
+            'meters': meters,
+            'route_miles': feature.summary.distance / METERS_PER_MILE,
+            'meters_per_mile': METERS_PER_MILE,
+        }
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return [{
+        'id': row[0],
+        'opis_id': row[1],
+        'name': row[2],
+        'address': row[3],
+        'city': row[4],
+        'state': row[5],
+        'fuel_retail_price': row[6],
+        'coordinate': [row[7], row[8]],
+        'distance_along': row[9],
+        'detour': row[10],
+    } for row in rows]
+
+
+def plan_fuel_stops(stops, route_miles, tank_range, start_range=None):
+    """
+    Cheapest refuelling plan along a route, in linear time.
+
+    `stops` is a sequence of (distance_along, price) sorted by distance
+    along the route. Returns (stop index, miles of fuel to buy) pairs.
+
+    Greedy: from each stop, drive to the first cheaper stop in range buying
+    only enough fuel to get there, otherwise fill up and drive to the
+    cheapest stop in range. The origin is treated as free fuel the truck
+    already carries and the destination as cheaper than any stop.
+    """
+    start_range = tank_range if start_range is None else start_range
+
+    positions = [0.0] + [stop[0] for stop in stops] + [route_miles]
+    prices = [0] + [stop[1] for stop in stops] + [-1]
+    capacities = [start_range] + [tank_range] * len(stops) + [0]
+    last = len(positions) - 1
+
+    # Next strictly cheaper node for every node.
+    next_cheaper = [None] * len(positions)
+    stack = []
+    for index in range(last, -1, -1):
+        while stack and prices[stack[-1]] >= prices[index]:
+            stack.pop()
+        next_cheaper[index] = stack[-1] if stack else None
+        stack.append(index)
+
+    # Nodes reachable from the current node, cheapest first. Both ends of the
+    # window only move forward so the whole walk is O(n).
+    window = deque()
+    pushed = 0
+
+    plan = []
+    current, fuel = 0, start_range
+    while current < last:
+        reach = positions[current] + capacities[current]
+        while pushed < last and positions[pushed + 1] <= reach:
+            pushed += 1
+            while window and prices[window[-1]] >= prices[pushed]:
+                window.pop()
+            window.append(pushed)
+        while window and window[0] <= current:
+            window.popleft()
+
+        if not window:
+            raise FuelPlanError(
+                f'No truck stop within range {positions[current]:.1f} miles along the route.')
+
+        cheaper = next_cheaper[current]
+        if cheaper is not None and positions[cheaper] <= reach:
+            following = cheaper
+            purchase = max(0.0, positions[following] - positions[current] - fuel)
+        else:
+            following = window[0]
+            purchase = max(0.0, capacities[current] - fuel)
+
+        if purchase > 0:
+            plan.append((current - 1, purchase))
+
+        fuel += purchase - (positions[following] - positions[current])
+        current = following
+
+    return plan
+
+
+def plan_route_fuel(feature, tank_range, mpg, corridor, start_range=None):
+    route_miles = feature.summary.distance / METERS_PER_MILE
+    stops = corridor_stops(feature, corridor)
+
+    plan = plan_fuel_stops([(stop['distance_along'], stop['fuel_retail_price']) for stop in stops],
+                           route_miles, tank_range, start_range=start_range)
+
+    fuel_stops = []
+    total_cents = 0.0
+    for index, miles in plan:
+        stop = stops[index]
+        gallons = miles / mpg
+        cost = gallons * stop['fuel_retail_price']
+        total_cents += cost
+        fuel_stops.append(dict(stop, gallons=round(gallons, 3), cost=round(cost / 100, 2),
+                               distance_along=round(stop['distance_along'], 2), detour=round(stop['detour'], 2)))
+
+    return {
+        'distance': round(route_miles, 2),
+        'tank_range': tank_range,
+        'mpg': mpg,
+        'candidate_stops': len(stops),
+        'total_gallons': round(sum(stop['gallons'] for stop in fuel_stops), 3),
+        'total_cost': round(total_cents / 100, 2),
+        'stops': fuel_stops,
+    }
@@ -0,0 +1,26 @@
+import math
+
+from django.contrib.gis.geos import Point
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def parse_lon_lat(value):
+    # Locations come in as "lng,lat" strings, the same format ORS expects.
+    lon, lat = str(value).split(',')
+    return float(lon), float(lat)
+
+
+def to_point(lon_lat) -> Point:
+    return Point(lon_lat[0], lon_lat[1], srid=4326)
+
+
+def format_lon_lat(lon_lat) -> str:
+    return f'{lon_lat[0]},{lon_lat[1]}'
+
+
+def haversine_miles(a, b):
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
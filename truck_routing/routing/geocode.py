@@ -0,0 +1,106 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+
+from .directions import RETRY_STATUSES, DirectionsClient, DirectionsError
+from .models import GeocodeCacheEntry
+
+
+def address_query(address, city, state):
+    return ' | '.join(' '.join(part.upper().split()) for part in (address, city, state))
+
+
+def address_key(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_geocode_client():
+    # A client of its own, the geocoder has a quota apart from directions.
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DirectionsClient.from_settings(rate=settings.OPENROUTE_GEOCODE_RATE_LIMIT / 60,
+                                                     burst=settings.OPENROUTE_GEOCODE_RATE_BURST)
+        return _client
+
+
+def geocode_address(address, city, state, client=None):
+    """
+    Look an address up with the ORS geocoder, returns a Point or None.
+    Raises DirectionsError when the geocoder fails.
+    """
+    client = client or get_geocode_client()
+    features = client.geocode(address, city, state).get('features')
+    if not features:
+        return None
+
+    lon, lat = features[0]['geometry']['coordinates'][:2]
+    return Point(lon, lat, srid=4326)
+
+
+class GeocodeCache:
+    """
+    Persistent geocode lookups for a batch of addresses, only addresses not
+    in the GeocodeCacheEntry table hit the geocoder.
+
+    Lookups go through the rate limited ORS client, which backs off and
+    retries on 429 and 5xx within its retry budget. Those that still fail
+    are counted as `throttled` and not cached, unlike addresses the
+    geocoder has no match for.
+    """
+
+    def __init__(self, geocoder=geocode_address):
+        self.geocoder = geocoder
+        self.hits = 0
+        self.misses = 0
+        self.throttled = 0
+
+    def lookup_many(self, addresses, geocode=True):
+        """
+        Map (address, city, state) tuples to Points (or None if the address
+        could not be geocoded or `geocode` is off and it isn't cached).
+        """
+        queries = {address: address_query(*address) for address in addresses}
+        keys = {query: address_key(query) for query in queries.values()}
+
+        cached = dict(GeocodeCacheEntry.objects
+                      .filter(key__in=keys.values())
+                      .values_list('key', 'coordinate'))
+
+        results = {}
+        new_entries = []
+        for address, query in queries.items():
+            key = keys[query]
+            if key in cached:
+                self.hits += 1
+                results[address] = cached[key]
+                continue
+
+            if not geocode:
+                results[address] = None
+                continue
+
+            self.misses += 1
+            try:
+                coordinate = self.geocoder(*address)
+            except DirectionsError as e:
+                if e.status in (401, 403):
+                    raise
+                if e.status is None or e.status in RETRY_STATUSES:
+                    # Rate limited or down (the open circuit is a 503), try
+                    # again on the next import.
+                    self.throttled += 1
+                results[address] = None
+                continue
+
+            results[address] = cached[key] = coordinate
+            new_entries.append(GeocodeCacheEntry(key=key, query=query, coordinate=coordinate))
+
+        GeocodeCacheEntry.objects.bulk_create(new_entries, ignore_conflicts=True)
+        return results
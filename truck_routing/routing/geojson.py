@@ -0,0 +1,123 @@
+import json
+from collections import defaultdict
+
+from django.contrib.gis.db.models.functions import AsGeoJSON, GeoFunc
+from django.db.models import Case, TextField, Value, When
+
+from .models import Feature, Segment, SimplifiedGeometry, Step
+from .simplify import remap
+
+STEP_FIELDS = ('segment_id', 'distance', 'duration', 'type', 'instruction', 'name',
+               'way_point_start', 'way_point_end')
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+class AsEncodedPolyline(GeoFunc):
+    output_field = TextField()
+
+
+# Feature geometry in the document, encoded by PostGIS: a GeoJSON
+# LineString or the Google encoded polyline string ORS returns for
+# geometry_format=encodedpolyline.
+GEOMETRY_FORMATS = {
+    'geojson': (AsGeoJSON, lambda value: value),
+    'encodedpolyline': (AsEncodedPolyline, dumps),
+}
+
+
+def stream_feature_collection(feature_collection, chunk_size=500, tolerance=None, geometry_format='geojson'):
+    """
+    Render a stored FeatureCollection as the GeoJSON ORS returned for it,
+    yielding the document in chunks.
+
+    Runs three queries whatever the size of the route: features (with the
+    geometry encoded by PostGIS), segments and steps. Steps are streamed
+    from a server side cursor so the whole tree is never held in memory.
+    Pass a collection fetched with select_related('bbox', 'metadata').
+
+    With a `tolerance` (degrees) each feature's coarsest simplified geometry
+    within it is rendered instead, with way points mapped onto its
+    vertices, at the cost of one more query.
+    """
+    encode, render_geometry = GEOMETRY_FORMATS[geometry_format]
+
+    simplified = {}
+    if tolerance is not None:
+        for feature_id, geometry_json, kept in (SimplifiedGeometry.objects
+                                                .filter(feature__feature_collection=feature_collection,
+                                                        tolerance__lte=tolerance)
+                                                .order_by('feature_id', '-tolerance')
+                                                .distinct('feature_id')
+                                                .annotate(geometry_json=encode('geometry'))
+                                                .values_list('feature_id', 'geometry_json', 'vertex_indices')):
+            simplified[feature_id] = (geometry_json, kept)
+
+    # Full geometries are only encoded for features without a simplified one.
+    features = list(Feature.objects
+                    .filter(feature_collection=feature_collection)
+                    .select_related('summary', 'bbox')
+                    .defer('geometry')
+                    .annotate(geometry_json=Case(When(pk__in=list(simplified), then=Value(None)),
+                                                 default=encode('geometry'), output_field=TextField()))
+                    .order_by('id'))
+
+    segments = defaultdict(list)
+    for segment in (Segment.objects
+                    .filter(feature__feature_collection=feature_collection)
+                    .order_by('feature_id', 'id')
+                    .values_list('id', 'feature_id', 'distance', 'duration')):
+        segments[segment[1]].append(segment)
+
+    steps = (Step.objects
+             .filter(segment__feature__feature_collection=feature_collection)
+             .order_by('segment__feature_id', 'segment_id', 'way_point_start', 'id')
+             .values_list(*STEP_FIELDS)
+             .iterator(chunk_size=2000))
+    pending = next(steps, None)
+
+    yield f'{{"type":"FeatureCollection","bbox":{dumps(feature_collection.bbox.coordinates.extent)},"features":['
+
+    for feature_index, feature in enumerate(features):
+        geometry_json, kept = simplified.get(feature.pk, (feature.geometry_json, None))
+        way_points = feature.way_point_indices
+        if kept is not None:
+            way_points = [remap(index, kept) for index in way_points]
+
+        summary = {'distance': feature.summary.distance, 'duration': feature.summary.duration}
+        yield (f'{"," if feature_index else ""}{{"type":"Feature",'
+               f'"bbox":{dumps(feature.bbox.coordinates.extent)},'
+               f'"properties":{{"summary":{dumps(summary)},'
+               f'"way_points":{dumps(way_points)},"segments":[')
+
+        for segment_index, (segment_id, _, distance, duration) in enumerate(segments[feature.pk]):
+            yield f'{"," if segment_index else ""}{{"distance":{dumps(distance)},"duration":{dumps(duration)},"steps":['
+
+            chunk = []
+            separator = ''
+            while pending is not None and pending[0] == segment_id:
+                _, distance, duration, type, instruction, name, start, end = pending
+                if kept is not None:
+                    start, end = remap(start, kept), remap(end, kept)
+                chunk.append(dumps({'distance': distance, 'duration': duration, 'type': type,
+                                    'instruction': instruction, 'name': name, 'way_points': [start, end]}))
+                if len(chunk) >= chunk_size:
+                    yield separator + ','.join(chunk)
+                    chunk = []
+                    separator = ','
+                pending = next(steps, None)
+
+            yield (separator + ','.join(chunk) if chunk else '') + ']}'
+
+        yield f']}},"geometry":{render_geometry(geometry_json)}}}'
+
+    metadata = feature_collection.metadata
+    yield '],"metadata":' + dumps({
+        'attribution': metadata.attribution,
+        'service': metadata.service,
+        'timestamp': metadata.timestamp,
+        'query': metadata.query,
+        'engine': metadata.engine,
+    }) + '}'
@@ -0,0 +1,87 @@
+import logging
+
+from django.contrib.gis.geos import Polygon, LineString
+from django.db import transaction
+
+from .corridor import build_corridors
+from .models import FeatureCollection, BoundingBox, Feature, FeatureSummary, Metadata, Segment, SimplifiedGeometry, Step
+from .metrics import phase
+from .simplify import levels_of_detail, linestring
+
+logger = logging.getLogger(__name__)
+
+
+@transaction.atomic
+def persist_directions(geojson):
+    """
+    Store an ORS directions GeoJSON response and return its FeatureCollection.
+
+    Every table is written with a single bulk insert and the whole graph is
+    written in one transaction, so a failure never leaves a partial route.
+    """
+    bbox_poly = Polygon.from_bbox(geojson['bbox'])
+    bounding_box = BoundingBox.objects.create(coordinates=bbox_poly)
+
+    metadata_obj = Metadata.objects.create(**geojson['metadata'])
+
+    feature_collection = FeatureCollection.objects.create(
+        bbox=bounding_box, metadata=metadata_obj)
+
+    for feature_data in geojson['features']:
+        persist_feature(feature_collection, bounding_box, feature_data)
+
+    return feature_collection
+
+
+def persist_feature(feature_collection, bounding_box, feature_data):
+    properties = feature_data['properties']
+
+    feature_summary = FeatureSummary.objects.create(**properties['summary'])
+
+    # Route vertices live only in the LineString, steps and way points
+    # reference them by index.
+    geometry = LineString(feature_data['geometry']['coordinates'], srid=4326)
+
+    feature = Feature.objects.create(feature_collection=feature_collection, summary=feature_summary,
+                                     geometry=geometry, way_point_indices=properties['way_points'],
+                                     bbox=bounding_box)
+
+    # Overview maps are served these instead of every vertex.
+    coordinates = feature_data['geometry']['coordinates']
+    with phase('simplify'):
+        simplified = [SimplifiedGeometry(feature=feature, zoom=zoom, tolerance=tolerance,
+                                         geometry=linestring([coordinates[index] for index in kept]),
+                                         vertex_indices=kept)
+                      for zoom, tolerance, kept in levels_of_detail(coordinates, properties['way_points'])]
+    SimplifiedGeometry.objects.bulk_create(simplified)
+
+    segments = properties['segments']
+    segment_objs = Segment.objects.bulk_create(
+        [Segment(distance=segment['distance'], duration=segment['duration'], feature=feature)
+         for segment in segments])
+
+    Step.objects.bulk_create(
+        [Step(distance=step['distance'], duration=step['duration'], type=step['type'],
+              instruction=step['instruction'], name=step['name'],
+              way_point_start=step['way_points'][0], way_point_end=step['way_points'][-1],
+              segment=segment_obj)
+         for segment, segment_obj in zip(segments, segment_objs)
+         for step in segment['steps']])
+
+    # Stops along the route, read by fuel planning instead of a spatial query.
+    transaction.on_commit(lambda: build_corridor(feature.pk))
+
+    return feature
+
+
+def build_corridor(feature_id):
+    # Once the route is committed, the ingest transaction doesn't hold its
+    # locks through the corridor join. Until built, fuel planning searches
+    # for the stops.
+    try:
+        with phase('corridor'):
+            build_corridors([feature_id])
+    except Exception:
+        # Built by the next refresh_truck_stops near it, or
+        # `manage.py build_corridors`.
+        logger.exception('Building the truck stop corridor of feature %s failed', feature_id)
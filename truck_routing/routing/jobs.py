@@ -0,0 +1,228 @@
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .directions import DirectionsError
+from .geo import parse_lon_lat
+from .models import RouteJob
+from .planner import create_route
+from .vehicles import Vehicle
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def enqueue_route(data, idempotency_key=None):
+    """
+    Queue creating a route from validated RouteSerializer data, returns
+    (job, created). A key seen before returns its job instead of queueing
+    again, and raises IdempotencyConflict if the data differs.
+    """
+    if not idempotency_key:
+        return RouteJob.objects.create(request=data), True
+
+    try:
+        with transaction.atomic():
+            return RouteJob.objects.create(request=data, idempotency_key=idempotency_key), True
+    except IntegrityError:
+        job = RouteJob.objects.get(idempotency_key=idempotency_key)
+        if job.request != data:
+            raise IdempotencyConflict(idempotency_key)
+        return job, False
+
+
+def claim_job(worker):
+    """
+    Mark the oldest queued job as running for `worker` and return it, or
+    None if the queue is empty. Jobs locked by other workers are skipped
+    rather than waited on.
+    """
+    with transaction.atomic():
+        job = (RouteJob.objects.select_for_update(skip_locked=True)
+               .filter(status=RouteJob.QUEUED).order_by('id').first())
+        if job is None:
+            return None
+        job.status = RouteJob.RUNNING
+        job.worker = worker
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'worker', 'attempts', 'started_at'])
+    return job
+
+
+def finish_job(job, status, route=None, error='', error_status=None):
+    # Only the worker still holding the job may finish it, it could have been
+    # requeued as stale in the meantime.
+    return RouteJob.objects.filter(pk=job.pk, status=RouteJob.RUNNING, worker=job.worker).update(
+        status=status, route=route, error=error, error_status=error_status, finished_at=timezone.now())
+
+
+def run_job(job):
+    data = job.request
+    try:
+        route = create_route(parse_lon_lat(data['start_location']), parse_lon_lat(data['end_location']),
+                             Vehicle.from_data(data))
+    except DirectionsError as e:
+        finish_job(job, RouteJob.FAILED, error=str(e), error_status=e.status)
+    except Exception:
+        logger.exception('Route job %s failed', job.pk)
+        finish_job(job, RouteJob.FAILED, error='Internal error while planning the route.')
+    else:
+        finish_job(job, RouteJob.SUCCEEDED, route=route)
+
+
+def requeue_stale_jobs(timeout, max_attempts):
+    """
+    Jobs left running longer than `timeout` seconds belong to a worker that
+    died. Queue them again, or fail them after `max_attempts`.
+    Returns (requeued, failed).
+    """
+    stale = RouteJob.objects.filter(status=RouteJob.RUNNING,
+                                    started_at__lt=timezone.now() - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=RouteJob.FAILED, error='Timed out.', finished_at=timezone.now())
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=RouteJob.QUEUED, worker='')
+    return requeued, failed
+
+
+class RouteJobWorker:
+    """
+    Runs queued route jobs on `concurrency` threads, each with its own
+    database connection, until `stop()` is called.
+    """
+
+    def __init__(self, concurrency, poll_interval, job_timeout, max_attempts, name=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.processed = 0
+        self.threads = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        options = dict(
+            concurrency=settings.ROUTE_JOB_CONCURRENCY,
+            poll_interval=settings.ROUTE_JOB_POLL_INTERVAL,
+            job_timeout=settings.ROUTE_JOB_TIMEOUT,
+            max_attempts=settings.ROUTE_JOB_MAX_ATTEMPTS,
+        )
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**options)
+
+    def stop(self):
+        self.stopping.set()
+
+    def _work(self, thread_name):
+        try:
+            while not self.stopping.is_set():
+                try:
+                    close_old_connections()
+                    job = claim_job(thread_name)
+                    if job is None:
+                        self.stopping.wait(self.poll_interval)
+                        continue
+                    run_job(job)
+                    with self._lock:
+                        self.processed += 1
+                except Exception:
+                    # The database going away and the like. A job claimed
+                    # but not finished is requeued once stale.
+                    logger.exception('Route job thread %s failed, carrying on', thread_name)
+                    connection.close()
+                    self.stopping.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+    def _start(self, index):
+        thread = threading.Thread(target=self._work, args=(f'{self.name}:{index}',),
+                                  name=f'route-job-{index}', daemon=True)
+        thread.start()
+        return thread
+
+    def restart_dead_threads(self):
+        # Threads that died anyway are started again, returns how many.
+        dead = [index for index, thread in enumerate(self.threads) if not thread.is_alive()]
+        for index in dead:
+            logger.error('Route job thread %s:%s died, restarting it', self.name, index)
+            self.threads[index] = self._start(index)
+        return len(dead)
+
+    def run(self):
+        self.threads = [self._start(index) for index in range(self.concurrency)]
+
+        try:
+            # Recover jobs from crashed workers while the threads run.
+            while not self.stopping.wait(min(self.job_timeout / 2, 60)):
+                self.restart_dead_threads()
+                try:
+                    close_old_connections()
+                    requeued, failed = requeue_stale_jobs(self.job_timeout, self.max_attempts)
+                except Exception:
+                    logger.exception('Requeueing stale route jobs failed')
+                    connection.close()
+                    continue
+                if requeued or failed:
+                    logger.warning('Requeued %s and failed %s stale route jobs', requeued, failed)
+        finally:
+            self.stopping.set()
+            for thread in self.threads:
+                thread.join()
+            connection.close()
+
+
+LATENCY_SQL = '''
+    SELECT count(*),
+           count(*) FILTER (WHERE status = %s),
+           percentile_cont(ARRAY[0.5, 0.95, 0.99]) WITHIN GROUP
+               (ORDER BY extract(epoch FROM started_at - created_at)::float8),
+           percentile_cont(ARRAY[0.5, 0.95, 0.99]) WITHIN GROUP
+               (ORDER BY extract(epoch FROM finished_at - started_at)::float8),
+           percentile_cont(ARRAY[0.5, 0.95, 0.99]) WITHIN GROUP
+               (ORDER BY extract(epoch FROM finished_at - created_at)::float8)
+    FROM routing_routejob
+    WHERE finished_at >= %s
+'''
+
+
+def queue_stats(window):
+    """
+    Queue depth now and job latencies (seconds) for jobs finished in the last
+    `window` seconds: wait is queued to started, run is started to finished.
+    """
+    now = timezone.now()
+    depth = dict(RouteJob.objects.filter(status__in=(RouteJob.QUEUED, RouteJob.RUNNING))
+                 .values_list('status').annotate(Count('id')).order_by())
+    oldest = RouteJob.objects.filter(status=RouteJob.QUEUED).aggregate(oldest=Min('created_at'))['oldest']
+
+    with connection.cursor() as cursor:
+        cursor.execute(LATENCY_SQL, [RouteJob.FAILED, now - timedelta(seconds=window)])
+        finished, failed, wait, run, total = cursor.fetchone()
+
+    def percentiles(values):
+        return dict(zip(('p50', 'p95', 'p99'), values or (None, None, None)))
+
+    return {
+        'queued': depth.get(RouteJob.QUEUED, 0),
+        'running': depth.get(RouteJob.RUNNING, 0),
+        'oldest_queued_seconds': (now - oldest).total_seconds() if oldest else None,
+        'window_seconds': window,
+        'finished': finished,
+        'failed': failed,
+        'wait_seconds': percentiles(wait),
+        'run_seconds': percentiles(run),
+        'total_seconds': percentiles(total),
+    }
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread safe in-process LRU cache with an optional TTL per entry.
+
+    Entries are evicted past `max_entries`, and past `max_bytes` when that is
+    set, measuring each value with `sizeof`.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, max_bytes=None, sizeof=len, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.clock = clock
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= self.clock():
+                self._remove(key)
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self.clock() + ttl if ttl else None
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self.size += size
+
+            while len(self._data) > self.max_entries or (
+                    self.max_bytes is not None and self.size > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.size -= evicted_size
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
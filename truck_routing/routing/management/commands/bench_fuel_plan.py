@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from routing.benchmarks import fuel
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the fuel stop planner on a synthetic 3,000 mile route. Nothing is kept in the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, default=8000, help='Size of the synthetic national stop list.')
+        parser.add_argument('--steps', type=int, default=3000)
+        parser.add_argument('--rounds', type=int, default=50)
+        parser.add_argument('--range', type=float, default=500)
+        parser.add_argument('--mpg', type=float, default=10)
+        parser.add_argument('--corridor', type=float, default=5)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            result = fuel.run(stops=options['stops'], steps=options['steps'], rounds=options['rounds'],
+                              tank_range=options['range'], mpg=options['mpg'],
+                              corridor=options['corridor'])
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(f'{result["route_miles"]:.0f} mile route, {result["stops"]} stops, '
+                          f'{result["candidate_stops"]} in corridor, {result["fuel_stops"]} fuel stops')
+        self.stdout.write(f'p50 {result["p50_ms"]:.1f} ms  p95 {result["p95_ms"]:.1f} ms  '
+                          f'max {result["max_ms"]:.1f} ms over {result["count"]} rounds')
+        self.stdout.write(f'Stops along the route: searched p50 {result["searched_p50_ms"]:.1f} ms, '
+                          f'stored p50 {result["stored_p50_ms"]:.1f} ms, '
+                          f'built in {result["build_ms"]:.1f} ms')
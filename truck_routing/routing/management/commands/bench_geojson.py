@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from routing.benchmarks import geojson
+
+
+class Command(BaseCommand):
+    help = ('Benchmark feature collection GeoJSON rendering: queries, payload size and latency per route size. '
+            'Fails if the streaming renderer query count grows with the route.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 3000],
+                            help='Route sizes in steps.')
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--renderer', choices=sorted(geojson.RENDERERS), action='append')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        renderers = options['renderer'] or ['legacy', 'streaming', 'overview', 'polyline']
+        with transaction.atomic():
+            results = geojson.run(options['sizes'], options['rounds'], renderers)
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        else:
+            for result in results:
+                self.stdout.write(f'{result["renderer"]:>9} {result["steps"]:>6} steps: '
+                                  f'{result["queries"]:>5} queries {result["bytes"] / 1024:>9.1f} KiB '
+                                  f'first chunk {result["first_chunk_ms"]:>8.1f} ms '
+                                  f'total {result["total_ms"]:>8.1f} ms')
+
+        streaming = {result['queries'] for result in results if result['renderer'] == 'streaming'}
+        if len(streaming) > 1:
+            raise CommandError(f'Streaming renderer query count depends on route size: {sorted(streaming)}')
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from routing.benchmarks.fixtures import load_directions, synthetic_directions
+from routing.benchmarks.ingest import STRATEGIES, measure
+
+
+class Command(BaseCommand):
+    help = 'Benchmark persisting a directions response: query count and wall time per strategy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--response', help='Path to a recorded ORS directions response (JSON).')
+        parser.add_argument('--steps', type=int, default=3000,
+                            help='Steps in the synthetic response when --response is not given.')
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--strategy', choices=sorted(STRATEGIES), action='append')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        if options['response']:
+            geojson = load_directions(options['response'])
+        else:
+            geojson = synthetic_directions(steps=options['steps'])
+
+        properties = geojson['features'][0]['properties']
+        steps = sum(len(segment['steps']) for segment in properties['segments'])
+        vertices = len(geojson['features'][0]['geometry']['coordinates'])
+
+        results = {}
+        for name in options['strategy'] or ['per-row', 'bulk']:
+            results[name] = measure(STRATEGIES[name], geojson, rounds=options['rounds'])
+
+        if options['json']:
+            self.stdout.write(json.dumps({'steps': steps, 'vertices': vertices, 'results': results}))
+            return
+
+        self.stdout.write(f'{steps} steps, {vertices} vertices, {options["rounds"]} rounds')
+        for name, result in results.items():
+            self.stdout.write(f'{name:>8}: {result["queries"]:>6} queries  '
+                              f'best {result["best_seconds"] * 1000:8.1f} ms  '
+                              f'mean {result["mean_seconds"] * 1000:8.1f} ms')
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from routing.benchmarks import load
+
+
+class Command(BaseCommand):
+    help = ('Load test the routing API against an in-process ORS stub in a throwaway test database: '
+            'latency percentiles, throughput, query counts and peak RSS per operation. '
+            'Fails if --compare finds a regression past --threshold.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--mix', type=load.parse_mix, default=None,
+                            help='Operation weights, e.g. "create=1,retrieve=4,nearest=2,bbox=1".')
+        parser.add_argument('--lanes', type=int, default=200, help='Distinct start/end pairs routes are created for.')
+        parser.add_argument('--stops', type=int, default=8000, help='Synthetic truck stops to seed.')
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(load.ROUTE_SIZES.values()),
+                            help='Steps per stubbed route, mixed per lane.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds the ORS stub adds to every reply.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+        parser.add_argument('--compare', help='Results JSON of an earlier run to compare against.')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Percent a metric may grow over --compare before the run fails.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        report = load.run(requests=options['requests'], concurrency=options['concurrency'], mix=options['mix'],
+                          lanes=options['lanes'], stops=options['stops'], sizes=options['sizes'],
+                          latency=options['latency'], seed=options['seed'], keepdb=options['keepdb'])
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        results = report['results']
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+        else:
+            for operation, result in sorted(results['operations'].items()):
+                self.stdout.write(f'{operation:>9}: {result["count"]:>6} requests '
+                                  f'p50 {result["p50_ms"]:>8.1f} ms p95 {result["p95_ms"]:>8.1f} ms '
+                                  f'p99 {result["p99_ms"]:>8.1f} ms queries p50 {result["queries_p50"]:>4} '
+                                  f'max {result["queries_max"]:>4} statuses {result["statuses"]}')
+            self.stdout.write(f'{results["requests"]} requests in {results["wall_seconds"]:.1f} s, '
+                              f'{results["throughput_rps"]:.1f} req/s, {results["errors"]} errors, '
+                              f'{results["ors_requests"]} ORS requests, peak RSS {results["peak_rss_mb"]:.0f} MiB')
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+            rows, regressions = load.compare(baseline, report, options['threshold'] / 100)
+            if not options['json']:
+                for row in rows:
+                    self.stdout.write(f'{row["operation"]:>9} {row["metric"]:>11}: {row["before"]:>9.1f} -> '
+                                      f'{row["after"]:>9.1f} ({row["change"]:+.0%})')
+            if regressions:
+                raise CommandError('Regressed past {}%: {}'.format(
+                    options['threshold'], ', '.join(f'{row["operation"]} {row["metric"]}' for row in regressions)))
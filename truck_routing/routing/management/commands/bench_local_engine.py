@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from routing.benchmarks import engine
+from routing.engine.graph import RoadGraph
+
+
+class Command(BaseCommand):
+    help = 'Benchmark local engine queries between random node pairs: latency, throughput and memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graph', help='Graph file from build_road_graph.')
+        parser.add_argument('--synthetic', type=int, default=300,
+                            help='Side of the synthetic grid graph when --graph is not given.')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        if options['graph']:
+            try:
+                graph = RoadGraph.load(options['graph'])
+            except (OSError, ValueError) as e:
+                raise CommandError(e)
+        else:
+            graph = engine.grid_graph(options['synthetic'], options['synthetic'])
+
+        result = engine.run(graph, queries=options['queries'], seed=options['seed'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(f'{result["nodes"]} nodes, {result["edges"]} edges, '
+                          f'graph {result["graph_bytes"] / 1024 / 1024:.1f} MiB')
+        self.stdout.write(f'p50 {result["p50_ms"]:.1f} ms  p95 {result["p95_ms"]:.1f} ms  '
+                          f'p99 {result["p99_ms"]:.1f} ms  {result["queries_per_second"]:.1f} queries/s')
+        self.stdout.write(f'{result["mean_settled"]:.0f} nodes settled per query, '
+                          f'{result["unreachable"]} unreachable, '
+                          f'search peak {result["search_peak_bytes"] / 1024 / 1024:.1f} MiB, '
+                          f'process peak RSS {result["peak_rss_bytes"] / 1024 / 1024:.0f} MiB')
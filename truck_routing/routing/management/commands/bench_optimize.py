@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from routing.benchmarks import optimize
+
+
+class Command(BaseCommand):
+    help = 'Benchmark multi-stop ordering: tour duration against solve time on synthetic matrices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, action='append', help='Stop counts, default 50 and 200.')
+        parser.add_argument('--budget', type=float, action='append',
+                            help='Time budgets in seconds, default 0.05 to 5.')
+        parser.add_argument('--reference-budget', type=float, default=10.0,
+                            help='Seconds for the reference tour the gaps are measured against.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        budgets = options['budget'] or [0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0]
+        results = [optimize.run(stops, budgets, reference_budget=options['reference_budget'], seed=options['seed'])
+                   for stops in options['stops'] or [50, 200]]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+
+        for result in results:
+            self.stdout.write(f'{result["stops"]} stops: nearest neighbour '
+                              f'+{result["nearest_neighbour_gap_percent"]:.1f}% over the '
+                              f'{result["reference_seconds"]:.0f}s reference tour')
+            for row in result['results']:
+                self.stdout.write(f'  budget {row["budget_seconds"]:5.2f}s  solved in {row["solve_seconds"]:5.2f}s  '
+                                  f'+{row["gap_percent"]:5.2f}%  {row["kicks"]} kicks')
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from routing.benchmarks import serving
+
+
+class Command(BaseCommand):
+    help = ('Create routes through runserver, gunicorn with blocking WSGI workers and gunicorn with uvicorn '
+            'workers against an ORS stub in a throwaway test database, and report how many route requests '
+            'each kept in flight at once, latency and throughput.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=list(serving.SERVERS), default=['wsgi', 'asgi'])
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=64, help='Client threads posting routes.')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes.')
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds the ORS stub takes per reply.')
+        parser.add_argument('--steps', type=int, default=200, help='Steps per stubbed route.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        report = serving.run(servers=options['servers'], requests=options['requests'],
+                             concurrency=options['concurrency'], workers=options['workers'],
+                             latency=options['latency'], steps=options['steps'], seed=options['seed'],
+                             keepdb=options['keepdb'])
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        for name, result in report['results'].items():
+            self.stdout.write(f'{name:>9}: peak {result["peak_in_flight"]:>4} in flight, '
+                              f'{result["throughput_rps"]:>7.1f} req/s, p50 {result["p50_ms"]:>8.1f} ms '
+                              f'p95 {result["p95_ms"]:>8.1f} ms p99 {result["p99_ms"]:>8.1f} ms, '
+                              f'{result["errors"]} errors, statuses {result["statuses"]}')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from routing.corridor import build_corridors, features_to_build
+
+
+class Command(BaseCommand):
+    help = ('Store the truck stops along routes stored before corridors were built at ingest, a batch of '
+            'features per transaction. With --rebuild, from every feature again at the current width.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--miles', type=float, help='Corridor width, defaults to TRUCK_STOP_CORRIDOR_MILES.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Features per transaction.')
+        parser.add_argument('--rebuild', action='store_true', help='Also build features already built.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        after = 0
+        features = stored = 0
+        while True:
+            batch = features_to_build(after, options['batch_size'], rebuild=options['rebuild'])
+            if not batch:
+                break
+            stored += build_corridors(batch, miles=options['miles'])
+            features += len(batch)
+            after = batch[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{features} features, {stored} truck stops')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f'Built corridors of {features} features, {stored} truck stops'))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from routing.engine.osm import build_from_osm
+from routing.engine.restrictions import RestrictionIndex
+
+
+class Command(BaseCommand):
+    help = 'Build the local routing engine road graph from an OSM XML extract (.osm, .osm.gz, .osm.bz2).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('extract', help='OSM XML extract.')
+        parser.add_argument('output', help='Graph file to write, point ROAD_GRAPH_PATH at it.')
+        parser.add_argument('--restrictions',
+                            help='Also write the truck restriction index here, for ROAD_RESTRICTIONS_PATH.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        graph = build_from_osm(options['extract'],
+                               on_progress=self.stdout.write if options['verbosity'] > 1 else None)
+        graph.save(options['output'])
+
+        footprint = graph.memory_footprint()
+        self.stdout.write(self.style.SUCCESS(
+            f'{graph.node_count} nodes, {graph.edge_count} edges, '
+            f'{footprint["total"] / 1024 / 1024:.1f} MiB in memory, '
+            f'built in {time.perf_counter() - started:.1f}s'))
+
+        if options['restrictions']:
+            index = RestrictionIndex.from_graph(graph)
+            index.save(options['restrictions'])
+            self.stdout.write(self.style.SUCCESS(f'{len(index)} restricted road segments indexed'))
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from routing.benchmarks import plans
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN the hot API queries and check each can be served by the index meant for it. '
+            'Fails if any plan does not use it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seqscan', action='store_true',
+                            help='Leave sequential scans enabled, to see the plans chosen on this data.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        results = plans.run(seqscan=options['seqscan'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        else:
+            for result in results:
+                status = 'ok' if result['ok'] else 'MISSING'
+                self.stdout.write(f'{status:>7} {result["query"]:<36} cost {result["cost"]:>10.1f} '
+                                  f'used {", ".join(result["used"]) or "no index"}')
+
+        missing = [result for result in results if not result['ok']]
+        if missing:
+            raise CommandError('No index scan for: ' + ', '.join(
+                f'{result["query"]} (expected one on {result["table"]}({", ".join(result["columns"])}))'
+                for result in missing))
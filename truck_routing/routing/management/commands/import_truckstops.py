@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from routing.opis import OpisImporter
+
+
+class Command(BaseCommand):
+    help = 'Import (upsert) the OPIS truck stop fuel price CSV into TruckStop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='OPIS price file (CSV).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-geocode', action='store_true',
+                            help='Only use cached geocodes, skip stops that would need a lookup.')
+
+    def handle(self, *args, **options):
+        importer = OpisImporter(batch_size=options['batch_size'], geocode=not options['no_geocode'])
+
+        def progress(stats):
+            self.stdout.write(f'{stats["rows"]} rows, {stats["rows_per_second"]:.0f} rows/s')
+
+        with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+            stats = importer.run(stream, progress=progress if options['verbosity'] > 1 else None)
+
+        cache = importer.geocode_cache
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["rows"]} rows in {stats["seconds"]:.2f}s ({stats["rows_per_second"]:.0f} rows/s): '
+            f'{stats["upserted"]} stops upserted, {stats["skipped"]} rows skipped, '
+            f'{stats["ungeocoded"]} stops without coordinates. '
+            f'Geocode cache {cache.hits} hits, {cache.misses} lookups.'))
+        if cache.throttled:
+            raise CommandError(
+                f'{cache.throttled} geocode lookups were rate limited or failed, their stops were not imported. '
+                f'Run the import again to look them up, geocodes found so far are cached.')
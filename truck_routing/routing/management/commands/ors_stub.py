@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from routing.benchmarks.ors_stub import ORSStub, load_responses
+
+
+class Command(BaseCommand):
+    help = ('Serve a stub OpenRouteService directions API that replays recorded responses. '
+            'Point OPENROUTE_BASE_URL at it to run the app without ORS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('responses', nargs='*', help='Recorded directions responses, JSON files or directories.')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503.')
+        parser.add_argument('--steps', type=int, nargs='+', default=[200],
+                            help='Steps per synthetic route without recordings, several sizes are mixed per lane.')
+
+    def handle(self, *args, **options):
+        stub = ORSStub((options['host'], options['port']), responses=load_responses(options['responses']),
+                       latency=options['latency'], error_rate=options['error_rate'],
+                       steps=options['steps'] if len(options['steps']) > 1 else options['steps'][0])
+
+        self.stdout.write(f'ORS stub listening on {stub.url} with {len(stub.responses)} recorded responses')
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.server_close()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from routing.partitions import ensure_step_partitions, is_partitioned, partition_steps
+
+
+class Command(BaseCommand):
+    help = ('Keep partitions of the step table created ahead of ingest, run it regularly. '
+            'With --convert, first turn the existing step table into a partitioned one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Partition the step table, briefly locking it for ingest.')
+        parser.add_argument('--rows', type=int, help='Step ids per partition, defaults to STEP_PARTITION_ROWS.')
+        parser.add_argument('--ahead', type=int, help='Empty partitions to keep, defaults to STEP_PARTITIONS_AHEAD.')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            if not options['convert']:
+                raise CommandError('The step table is not partitioned, pass --convert to partition it.')
+            created = partition_steps(options['rows'])
+            self.stdout.write(self.style.SUCCESS('Partitioned the step table'))
+        else:
+            created = ensure_step_partitions(options['rows'], options['ahead'])
+
+        if created:
+            self.stdout.write(f'Created {", ".join(created)}')
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from routing.partitions import drop_empty_step_partitions, is_partitioned
+from routing.retention import count_expired, purge_expired, purge_expired_matrix_cells, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = ('Delete feature collections older than the retention period that no recent route uses, with their '
+            'routes, steps and the rest, in bounded batches. Also drops expired matrix cells and emptied step '
+            'partitions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Retention in days, defaults to ROUTE_RETENTION_DAYS.')
+        parser.add_argument('--batch-size', type=int,
+                            help='Collections per transaction, defaults to ROUTE_PURGE_BATCH_SIZE.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired collections.')
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['days'])
+        if options['dry_run']:
+            self.stdout.write(f'{count_expired(cutoff)} feature collections planned before {cutoff:%Y-%m-%d %H:%M} '
+                              f'have expired')
+            return
+
+        def progress(batch, deleted):
+            self.stdout.write(f'Batch {batch}: {deleted["routing_featurecollection"]} collections, '
+                              f'{deleted["routing_route"]} routes, {deleted["routing_step"]} steps')
+
+        totals = purge_expired(cutoff, batch_size=options['batch_size'], max_batches=options['max_batches'],
+                               pause=options['pause'], progress=progress)
+        cells = purge_expired_matrix_cells(pause=options['pause'])
+        dropped = drop_empty_step_partitions() if is_partitioned() else []
+
+        summary = ', '.join(f'{count} from {table}' for table, count in totals.items() if count)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {summary or "no routes"}, {cells} matrix cells'
+            + (f', dropped partitions {", ".join(dropped)}' if dropped else '')))
@@ -0,0 +1,29 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from routing.jobs import RouteJobWorker
+
+
+class Command(BaseCommand):
+    help = 'Run queued route jobs until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help='Jobs run at once, defaults to ROUTE_JOB_CONCURRENCY.')
+        parser.add_argument('--poll-interval', type=float,
+                            help='Seconds between checks of an empty queue, defaults to ROUTE_JOB_POLL_INTERVAL.')
+
+    def handle(self, *args, **options):
+        worker = RouteJobWorker.from_settings(concurrency=options['concurrency'],
+                                              poll_interval=options['poll_interval'])
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the running jobs finish')
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f'Route worker {worker.name} running {worker.concurrency} jobs at a time')
+        worker.run()
+        self.stdout.write(self.style.SUCCESS(f'Stopped after {worker.processed} jobs'))
@@ -0,0 +1,181 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .backends import get_routing_backend
+from .models import MatrixCell
+
+LOOKUP_SQL = '''
+SELECT source, destination, duration, distance
+FROM routing_matrixcell
+WHERE profile = %s AND source = ANY(%s) AND destination = ANY(%s) AND created_at > %s
+'''
+
+# Marks a cell not in the cache yet, None is a cached pair without a route.
+MISSING = object()
+
+
+def point_key(lon_lat, grid):
+    # Snap a point to the grid and pack it into one integer.
+    x, y = round(lon_lat[0] / grid), round(lon_lat[1] / grid)
+    return (x + (1 << 30)) << 31 | (y + (1 << 30))
+
+
+def unique(keys):
+    # Distinct keys in first seen order, the position of each key among
+    # them and where each distinct key first appears.
+    positions = {}
+    first = []
+    for index, key in enumerate(keys):
+        if key not in positions:
+            positions[key] = len(positions)
+            first.append(index)
+    return list(positions), [positions[key] for key in keys], first
+
+
+class MatrixResult:
+    def __init__(self, durations, distances, cached, fetched):
+        # Rows per source, seconds and metres, None where there is no route.
+        self.durations = durations
+        self.distances = distances
+        # Distinct pairs read from the cache and fetched from the backend.
+        self.cached = cached
+        self.fetched = fetched
+
+
+class MatrixCache:
+    """
+    Durations and distances between points, cached pair by pair in the
+    MatrixCell table so any matrix over points seen before is answered
+    without the routing backend.
+
+    Only missing pairs are fetched. Sources missing the same destinations
+    are fetched together as one block, which covers the common cases of a
+    few new points against many known ones in a handful of requests.
+    """
+
+    def __init__(self, grid, ttl):
+        self.grid = grid
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.counters = {'cached_cells': 0, 'fetched_cells': 0, 'backend_requests': 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(grid=settings.ROUTE_CACHE_GRID, ttl=settings.MATRIX_CACHE_TTL)
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def lookup(self, profile, sources, destinations):
+        # (duration, distance) rows over the distinct source and
+        # destination keys, MISSING where the cache has nothing. A point to
+        # itself is cached like any other pair, so a cold square matrix is
+        # one block rather than a block per row.
+        columns = {key: column for column, key in enumerate(destinations)}
+        rows = {key: row for row, key in enumerate(sources)}
+        durations = [[MISSING] * len(destinations) for _ in sources]
+        distances = [[MISSING] * len(destinations) for _ in sources]
+
+        expires_before = timezone.now() - timedelta(seconds=self.ttl)
+        with connection.cursor() as cursor:
+            cursor.execute(LOOKUP_SQL, [profile, sources, destinations, expires_before])
+            for source, destination, duration, distance in cursor.fetchall():
+                row, column = rows[source], columns[destination]
+                durations[row][column] = duration
+                distances[row][column] = distance
+        return durations, distances
+
+    def fetch(self, locations, profile, vehicle, sources, destinations, durations, distances):
+        """
+        Fill the MISSING cells of `durations` and `distances` from the
+        routing backend, returning the (row, column) of every cell filled.
+        `sources` and `destinations` are indices into `locations` of the
+        rows and columns.
+        """
+        blocks = {}
+        for row, cells in enumerate(durations):
+            missing = tuple(column for column, value in enumerate(cells) if value is MISSING)
+            if missing:
+                blocks.setdefault(missing, []).append(row)
+
+        backend = get_routing_backend()
+        fetched = []
+        for columns, rows in blocks.items():
+            block_durations, block_distances = backend.matrix(
+                locations, profile, vehicle=vehicle, sources=[sources[row] for row in rows],
+                destinations=[destinations[column] for column in columns])
+            self._count('backend_requests')
+            for i, row in enumerate(rows):
+                for j, column in enumerate(columns):
+                    durations[row][column] = block_durations[i][j]
+                    distances[row][column] = block_distances[i][j]
+                    fetched.append((row, column))
+        return fetched
+
+    def store(self, profile, source_keys, destination_keys, durations, distances, cells):
+        # Expired copies of these pairs would block the insert.
+        expires_before = timezone.now() - timedelta(seconds=self.ttl)
+        MatrixCell.objects.filter(profile=profile, source__in={source_keys[row] for row, _ in cells},
+                                  created_at__lte=expires_before).delete()
+        MatrixCell.objects.bulk_create(
+            (MatrixCell(profile=profile, source=source_keys[row], destination=destination_keys[column],
+                        duration=durations[row][column], distance=distances[row][column])
+             for row, column in cells),
+            batch_size=5000, ignore_conflicts=True)
+
+    def get(self, locations, vehicle, sources=None, destinations=None):
+        """
+        MatrixResult from each source to each destination, indices into
+        `locations` (all of them by default). Points snapping to the same
+        grid cell share their cells.
+        """
+        sources = list(range(len(locations)) if sources is None else sources)
+        destinations = list(range(len(locations)) if destinations is None else destinations)
+        profile = vehicle.cache_profile
+        source_keys, source_rows, first_sources = unique(
+            [point_key(locations[index], self.grid) for index in sources])
+        destination_keys, destination_columns, first_destinations = unique(
+            [point_key(locations[index], self.grid) for index in destinations])
+
+        durations, distances = self.lookup(profile, source_keys, destination_keys)
+        fetched = self.fetch(locations, vehicle.profile, vehicle, [sources[index] for index in first_sources],
+                             [destinations[index] for index in first_destinations], durations, distances)
+        if fetched:
+            self.store(profile, source_keys, destination_keys, durations, distances, fetched)
+
+        cached = len(source_keys) * len(destination_keys) - len(fetched)
+        self._count('cached_cells', cached)
+        self._count('fetched_cells', len(fetched))
+
+        # Expand back to the requested rows and columns when points repeat.
+        if len(source_keys) != len(sources) or len(destination_keys) != len(destinations):
+            durations = [[durations[row][column] for column in destination_columns] for row in source_rows]
+            distances = [[distances[row][column] for column in destination_columns] for row in source_rows]
+        return MatrixResult(durations, distances, cached=cached, fetched=len(fetched))
+
+    def clear(self):
+        MatrixCell.objects.all().delete()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        cells = stats['cached_cells'] + stats['fetched_cells']
+        stats['hit_ratio'] = stats['cached_cells'] / cells if cells else 0.0
+        return stats
+
+
+matrix_cache = MatrixCache.from_settings()
+
+
+def duration_matrix(locations, vehicle):
+    """
+    (durations, distances) between all `locations` for `vehicle`, through
+    the matrix cache.
+    """
+    result = matrix_cache.get(locations, vehicle)
+    return result.durations, result.distances
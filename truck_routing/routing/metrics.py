@@ -0,0 +1,353 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+
+slow_request_logger = logging.getLogger('routing.slow_requests')
+
+# Seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def format_value(value):
+    return repr(float(value)) if not isinstance(value, int) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (the last one +Inf), sum]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.values.items())
+        names = self.labels + ('le',)
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                bound = bound if bound == '+Inf' else format_value(bound)
+                lines.append(f'{self.name}_bucket{format_labels(names, labels + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """
+    Metrics of this process in the Prometheus text format. Each worker
+    process keeps its own, scrape them one by one.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, gauges=()):
+        """
+        The exposition document, with `gauges` ((name, help, labels dict,
+        value) read at scrape time, like cache stats) after the metrics.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        described = set()
+        for name, help, labels, value in gauges:
+            if name not in described:
+                lines.extend([f'# HELP {name} {help}', f'# TYPE {name} gauge'])
+                described.add(name)
+            lines.append(f'{name}{format_labels(list(labels), list(labels.values()))} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'routing_http_request_duration_seconds', 'Time to answer a request, until the last byte for streamed ones.',
+    ['method', 'view', 'status'])
+REQUEST_QUERIES = registry.histogram(
+    'routing_http_request_queries', 'Database queries run by a request.', ['view'], buckets=QUERY_BUCKETS)
+REQUEST_DB_SECONDS = registry.histogram(
+    'routing_http_request_db_seconds', 'Time a request spent in database queries.', ['view'])
+SLOW_REQUESTS = registry.counter(
+    'routing_http_slow_requests_total', 'Requests over SLOW_REQUEST_THRESHOLD.', ['view'])
+PHASE_SECONDS = registry.histogram(
+    'routing_phase_duration_seconds', 'Time spent in each phase of request handling.', ['phase'])
+UPSTREAM_SECONDS = registry.histogram(
+    'routing_upstream_request_duration_seconds', 'OpenRouteService calls by endpoint and status, '
+    'each retry counted on its own. Status is "error" when no response came back.', ['endpoint', 'status'])
+
+_current = ContextVar('routing_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Timings of one request: phases (phase() blocks, nested ones counted in
+    their parents too), database queries, attributed to the innermost open
+    phase as well, and upstream calls.
+
+    Queries are counted on every connection of every thread running in the
+    request's context, sync_to_async ones included, not those of worker
+    threads a request fans out to without it.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        # name -> [seconds, queries, query seconds]
+        self.phases = {}
+        self.open_phases = []
+        self.upstream = []
+
+    def add_phase(self, name, seconds):
+        self.phases.setdefault(name, [0.0, 0, 0.0])[0] += seconds
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.query_seconds += elapsed
+            if self.open_phases:
+                phase = self.phases.setdefault(self.open_phases[-1], [0.0, 0, 0.0])
+                phase[1] += 1
+                phase[2] += elapsed
+
+    def breakdown(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.query_seconds * 1000, 1),
+            'phases': {name: {'ms': round(seconds * 1000, 1), 'queries': queries,
+                              'db_ms': round(query_seconds * 1000, 1)}
+                       for name, (seconds, queries, query_seconds) in self.phases.items()},
+            'upstream': [{'endpoint': endpoint, 'status': status, 'ms': round(seconds * 1000, 1)}
+                         for endpoint, status, seconds in self.upstream],
+        }
+
+
+@contextmanager
+def phase(name):
+    """
+    Time the block as `name`, in the phase histogram and in the breakdown
+    of the request being handled, if any.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.open_phases.append(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        PHASE_SECONDS.observe(elapsed, name)
+        if metrics is not None:
+            metrics.open_phases.pop()
+            metrics.add_phase(name, elapsed)
+
+
+def timed_chunks(name, chunks):
+    """
+    Pass `chunks` through, timing the work of producing them as one `name`
+    phase, for generators the response streams after the view returned.
+    """
+    metrics = _current.get()
+    iterator = iter(chunks)
+    elapsed = 0.0
+    try:
+        while True:
+            if metrics is not None:
+                metrics.open_phases.append(name)
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+                if metrics is not None:
+                    metrics.open_phases.pop()
+            yield chunk
+    finally:
+        PHASE_SECONDS.observe(elapsed, name)
+        if metrics is not None:
+            metrics.add_phase(name, elapsed)
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection as it opens, counting the
+    query in the request whose context it runs in, if any. Under ASGI
+    requests in flight share connections, each counts only its own.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.execute(execute, sql, params, many, context)
+
+
+def observe_upstream(endpoint, status, seconds):
+    UPSTREAM_SECONDS.observe(seconds, endpoint, status)
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.upstream.append((endpoint, status, seconds))
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, query count and database time of every request by
+    view name, and logs requests slower than SLOW_REQUEST_THRESHOLD
+    milliseconds to the "routing.slow_requests" logger with the breakdown
+    by phase.
+
+    Streamed responses are measured until their last chunk is sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django's handler to await it.
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        _current.set(metrics)
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self.finish(request, None, metrics)
+            raise
+        return self.measure(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        _current.set(metrics)
+
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self.finish(request, None, metrics)
+            raise
+        return self.measure(request, response, metrics)
+
+    def measure(self, request, response, metrics):
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, request, response, metrics)
+        else:
+            self.finish(request, response, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returned, time that as
+        # "serialize".
+        metrics = _current.get()
+        started = time.perf_counter()
+
+        def rendered(response):
+            elapsed = time.perf_counter() - started
+            PHASE_SECONDS.observe(elapsed, 'serialize')
+            if metrics is not None:
+                metrics.add_phase('serialize', elapsed)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def stream(self, chunks, request, response, metrics):
+        try:
+            yield from chunks
+        finally:
+            self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        elapsed = time.perf_counter() - metrics.started
+        _current.set(None)
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        status = response.status_code if response is not None else 500
+        REQUEST_SECONDS.observe(elapsed, request.method, view, status)
+        REQUEST_QUERIES.observe(metrics.queries, view)
+        REQUEST_DB_SECONDS.observe(metrics.query_seconds, view)
+
+        if elapsed * 1000 >= settings.SLOW_REQUEST_THRESHOLD:
+            SLOW_REQUESTS.inc(view)
+            breakdown = metrics.breakdown()
+            slow_request_logger.warning(
+                'Slow request %s %s (%s) %s in %.0f ms: %s', request.method, request.get_full_path(), view, status,
+                elapsed * 1000, json.dumps(breakdown),
+                extra={'view': view, 'status': status, 'duration_ms': round(elapsed * 1000, 1),
+                       'breakdown': breakdown})
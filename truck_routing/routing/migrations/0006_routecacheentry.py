@@ -0,0 +1,27 @@
+# Generated by Django 3.2.23 on 2026-10-18 15:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0005_truckstop'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('profile', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_hit_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('feature_collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='routing.featurecollection')),
+            ],
+        ),
+    ]
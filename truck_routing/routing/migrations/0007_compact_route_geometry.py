@@ -0,0 +1,31 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:05
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0006_routecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feature',
+            name='way_point_indices',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='step',
+            name='way_point_end',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='step',
+            name='way_point_start',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:06
+
+from django.contrib.gis.geos import Point
+from django.db import migrations
+
+
+def vertex_index(coords, base_id, way_point):
+    # WayPoints were bulk created in LineString order, so ids are contiguous
+    # per feature. Fall back to a coordinate lookup if that doesn't hold.
+    index = way_point.id - base_id
+    if 0 <= index < len(coords) and coords[index] == way_point.coordinate.coords:
+        return index
+    return coords.index(way_point.coordinate.coords)
+
+
+def forwards(apps, schema_editor):
+    Feature = apps.get_model('routing', 'Feature')
+    Step = apps.get_model('routing', 'Step')
+
+    for feature in Feature.objects.iterator(chunk_size=100):
+        markers = sorted(feature.way_points.all(), key=lambda way_point: way_point.id)
+        if not markers:
+            continue
+
+        coords = feature.geometry.coords
+        base_id = markers[0].id
+        feature.way_point_indices = [vertex_index(coords, base_id, way_point) for way_point in markers]
+        feature.save(update_fields=['way_point_indices'])
+
+        steps = list(Step.objects.filter(segment__feature=feature).prefetch_related('way_points'))
+        for step in steps:
+            indices = sorted(vertex_index(coords, base_id, way_point) for way_point in step.way_points.all())
+            if indices:
+                step.way_point_start, step.way_point_end = indices[0], indices[-1]
+        Step.objects.bulk_update(steps, ['way_point_start', 'way_point_end'], batch_size=1000)
+
+
+def backwards(apps, schema_editor):
+    Feature = apps.get_model('routing', 'Feature')
+    Step = apps.get_model('routing', 'Step')
+    WayPoint = apps.get_model('routing', 'WayPoint')
+
+    for feature in Feature.objects.iterator(chunk_size=100):
+        points = WayPoint.objects.bulk_create(
+            [WayPoint(coordinate=Point(coords, srid=4326)) for coords in feature.geometry.coords])
+        feature.way_points.set([points[index] for index in feature.way_point_indices])
+
+        StepWayPoint = Step.way_points.through
+        StepWayPoint.objects.bulk_create(
+            [StepWayPoint(step_id=step.id, waypoint_id=points[index].id)
+             for step in Step.objects.filter(segment__feature=feature)
+             for index in dict.fromkeys((step.way_point_start, step.way_point_end))],
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0007_compact_route_geometry'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
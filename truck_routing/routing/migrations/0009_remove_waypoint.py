@@ -0,0 +1,24 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0008_populate_way_point_indices'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='feature',
+            name='way_points',
+        ),
+        migrations.RemoveField(
+            model_name='step',
+            name='way_points',
+        ),
+        migrations.DeleteModel(
+            name='WayPoint',
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.23 on 2026-10-18 15:46
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def remove_duplicate_opis_ids(apps, schema_editor):
+    # Keep the newest row for each opis_id so the unique constraint applies.
+    TruckStop = apps.get_model('routing', 'TruckStop')
+    duplicates = (TruckStop.objects.values('opis_id')
+                  .annotate(count=models.Count('id'), newest=models.Max('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        (TruckStop.objects.filter(opis_id=duplicate['opis_id'])
+         .exclude(id=duplicate['newest']).delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0009_remove_waypoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('query', models.TextField()),
+                ('coordinate', django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(remove_duplicate_opis_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='truckstop',
+            name='opis_id',
+            field=models.IntegerField(unique=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0010_geocodecacheentry_unique_opis_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='hazmat_class',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, 'Explosives'), (2, 'Gases'), (3, 'Flammable liquids'), (4, 'Flammable solids'), (5, 'Oxidizers and organic peroxides'), (6, 'Toxic and infectious substances'), (7, 'Radioactive material'), (8, 'Corrosives'), (9, 'Miscellaneous')], null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='vehicle_height',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='vehicle_length',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='vehicle_weight',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='vehicle_width',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0011_route_vehicle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('request', models.JSONField()),
+                ('error', models.TextField(blank=True)),
+                ('error_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('route', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='routing.route')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='routejob',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['id'], name='routing_routejob_queued'),
+        ),
+    ]
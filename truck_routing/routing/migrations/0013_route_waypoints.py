@@ -0,0 +1,19 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:08
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0012_routejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='waypoints',
+            field=django.contrib.gis.db.models.fields.MultiPointField(blank=True, null=True, srid=4326),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0013_route_waypoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatrixCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile', models.CharField(max_length=255)),
+                ('source', models.BigIntegerField()),
+                ('destination', models.BigIntegerField()),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('distance', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='matrixcell',
+            constraint=models.UniqueConstraint(fields=('profile', 'source', 'destination'), name='routing_matrixcell_pair'),
+        ),
+    ]
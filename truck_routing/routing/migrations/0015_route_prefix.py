@@ -0,0 +1,24 @@
+# Generated by Django 3.2.23 on 2026-10-18 17:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0014_matrixcell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='prefix_end_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='prefix_route',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reroutes', to='routing.route'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 3.2.23 on 2026-10-18 17:30
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The backfill as routing.simplify did it when this migration was written,
+# with the default GEOMETRY_LOD_* settings of the time.
+ZOOMS = (5, 8, 11, 14)
+PIXELS = 0.5
+MAX_RATIO = 0.7
+
+
+def linestring(coordinates):
+    return GEOSGeometry('SRID=4326;LINESTRING(%s)' % ','.join(f'{vertex[0]!r} {vertex[1]!r}'
+                                                                for vertex in coordinates))
+
+
+def kept_vertices(coordinates, simplified):
+    kept = []
+    position = 0
+    for x, y in simplified:
+        while coordinates[position][0] != x or coordinates[position][1] != y:
+            position += 1
+        kept.append(position)
+        position += 1
+    return kept
+
+
+def simplify(legs, tolerance):
+    simplified_legs = []
+    for indices, coordinates, geometry in legs:
+        if geometry is None:
+            simplified_legs.append((indices, coordinates, geometry))
+            continue
+        simplified = geometry.simplify(tolerance, preserve_topology=True)
+        vertices = [tuple(vertex) for vertex in simplified.coords]
+        kept = kept_vertices(coordinates, vertices)
+        simplified_legs.append(([indices[position] for position in kept], vertices,
+                                simplified if len(kept) > 2 else None))
+    return simplified_legs
+
+
+def levels_of_detail(coordinates, way_points):
+    legs = []
+    for first, last in zip(way_points, way_points[1:]):
+        leg = coordinates[first:last + 1]
+        legs.append((list(range(first, last + 1)), leg, linestring(leg) if len(leg) > 2 else None))
+
+    levels = []
+    finer = len(coordinates)
+    for zoom in sorted(ZOOMS, reverse=True):
+        tolerance = 360.0 / (256 * 2 ** zoom) * PIXELS
+        legs = simplify(legs, tolerance)
+        kept = [0] + [index for indices, _, _ in legs for index in indices[1:]]
+        if len(kept) <= finer * MAX_RATIO:
+            levels.append((zoom, tolerance, kept))
+            finer = len(kept)
+    return levels[::-1]
+
+
+def forwards(apps, schema_editor):
+    Feature = apps.get_model('routing', 'Feature')
+    SimplifiedGeometry = apps.get_model('routing', 'SimplifiedGeometry')
+
+    for feature in Feature.objects.iterator(chunk_size=100):
+        coordinates = feature.geometry.coords
+        way_points = feature.way_point_indices or [0, len(coordinates) - 1]
+        SimplifiedGeometry.objects.bulk_create(
+            [SimplifiedGeometry(feature=feature, zoom=zoom, tolerance=tolerance,
+                                geometry=linestring([coordinates[index] for index in kept]),
+                                vertex_indices=kept)
+             for zoom, tolerance, kept in levels_of_detail(coordinates, way_points)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0015_route_prefix'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimplifiedGeometry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('tolerance', models.FloatField()),
+                ('geometry', django.contrib.gis.db.models.fields.LineStringField(srid=4326)),
+                ('vertex_indices', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), size=None)),
+                ('feature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simplified_geometries', to='routing.feature')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='simplifiedgeometry',
+            constraint=models.UniqueConstraint(fields=('feature', 'zoom'), name='routing_simplifiedgeometry_zoom'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
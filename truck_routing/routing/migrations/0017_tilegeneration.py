@@ -0,0 +1,20 @@
+# Generated by Django 3.2.23 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0016_simplifiedgeometry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TileGeneration',
+            fields=[
+                ('layer', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
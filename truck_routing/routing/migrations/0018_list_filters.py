@@ -0,0 +1,38 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:31
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so route and metadata writes aren't
+    # blocked while they are, which can't happen in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('routing', '0017_tilegeneration'),
+    ]
+
+    operations = [
+        # Added without a default first, so existing routes are left null
+        # rather than all stamped with the time of the migration.
+        migrations.AddField(
+            model_name='route',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='route',
+            name='created_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='metadata',
+            index=models.Index(fields=['timestamp'], name='routing_metadata_timestamp'),
+        ),
+        AddIndexConcurrently(
+            model_name='route',
+            index=models.Index(fields=['created_at'], name='routing_route_created_at'),
+        ),
+    ]
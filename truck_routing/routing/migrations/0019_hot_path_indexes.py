@@ -0,0 +1,60 @@
+# Generated by Django 3.2.23 on 2026-10-18 16:33
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def drop_step_segment_index(apps, schema_editor):
+    # The single column index Django made for the foreign key, its name has
+    # a hash in it. routing_step_order leads with segment_id and replaces it.
+    Step = apps.get_model('routing', 'Step')
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, Step._meta.db_table)
+    for name, constraint in constraints.items():
+        if (constraint['index'] and constraint['columns'] == ['segment_id']
+                and not constraint['primary_key'] and not constraint['unique']):
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(name)}')
+
+
+def create_step_segment_index(apps, schema_editor):
+    Step = apps.get_model('routing', 'Step')
+    table = Step._meta.db_table
+    schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS routing_step_segment_id '
+                          f'ON {schema_editor.quote_name(table)} (segment_id)')
+
+
+class Migration(migrations.Migration):
+    # Indexes are built and dropped concurrently so ingest isn't blocked on
+    # the step table, which can't happen in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('routing', '0018_list_filters'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='step',
+            index=models.Index(fields=['segment', 'way_point_start', 'id'], name='routing_step_order'),
+        ),
+        AddIndexConcurrently(
+            model_name='truckstop',
+            index=models.Index(fields=['state', 'fuel_retail_price'], name='routing_truckstop_state_price'),
+        ),
+        # AlterField would also drop and re-add the foreign key, checking
+        # every step again. Only the index goes.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='step',
+                    name='segment',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                            to='routing.segment'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_step_segment_index, create_step_segment_index),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.23 on 2026-10-18 17:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0019_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feature',
+            name='corridor_miles',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FeatureTruckStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_along', models.FloatField()),
+                ('detour', models.FloatField()),
+                ('feature', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='corridor_stops', to='routing.feature')),
+                ('truck_stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='corridor_features', to='routing.truckstop')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='featuretruckstop',
+            index=models.Index(fields=['feature', 'distance_along'], name='routing_featuretruckstop_along'),
+        ),
+        migrations.AddConstraint(
+            model_name='featuretruckstop',
+            constraint=models.UniqueConstraint(fields=('feature', 'truck_stop'), name='routing_featuretruckstop_pair'),
+        ),
+    ]
@@ -1,4 +1,9 @@
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import Point
+from django.contrib.postgres.fields import ArrayField
+from django.utils import timezone
+
+from .vehicles import HAZMAT_CLASS_CHOICES
 
 
 # Storing bounding box to be used by multiple models
@@ -9,15 +14,6 @@ class BoundingBox(models.Model):
         # Should be no more and no less than 4 coordinates since its a bounding box
         return f'[{self.coordinates}]'
 
-# Storing waypoint so we can access on other models
-
-
-class WayPoint(models.Model):
-    coordinate = models.PointField()
-
-    def __str__(self) -> str:
-        return f'({self.coordinate.x, self.coordinate.y})'
-
 
 class Metadata(models.Model):
     attribution = models.CharField(max_length=255)
@@ -26,6 +22,12 @@ class Metadata(models.Model):
     query = models.JSONField()
     engine = models.JSONField()
 
+    class Meta:
+        indexes = [
+            # Feature collection lists filter on when ORS planned them.
+            models.Index(fields=['timestamp'], name='routing_metadata_timestamp'),
+        ]
+
 
 class FeatureCollection(models.Model):
     bbox = models.ForeignKey(BoundingBox, on_delete=models.CASCADE)
@@ -42,8 +44,39 @@ class Feature(models.Model):
         FeatureCollection, on_delete=models.CASCADE)
     summary = models.OneToOneField(FeatureSummary, on_delete=models.CASCADE)
     geometry = models.LineStringField()  # Stores the LineString of the route
-    way_points = models.ManyToManyField(WayPoint)
+    # Vertex indices into geometry of the start, via and end points.
+    way_point_indices = ArrayField(models.PositiveIntegerField(), default=list)
     bbox = models.ForeignKey(BoundingBox, on_delete=models.CASCADE)
+    # Miles either side of the route its FeatureTruckStops cover, null until
+    # they are built.
+    corridor_miles = models.FloatField(null=True, blank=True)
+
+    @property
+    def way_point_coordinates(self):
+        return [Point(self.geometry[index], srid=self.geometry.srid) for index in self.way_point_indices]
+
+    def vertices(self, start=0, end=None):
+        # Coordinates of the route between two vertex indices, inclusive.
+        coords = self.geometry.coords
+        return coords[start:] if end is None else coords[start:end + 1]
+
+
+class SimplifiedGeometry(models.Model):
+    # Feature.geometry simplified for drawing at `zoom` and below, stored at
+    # ingest (see routing.simplify). `vertex_indices` are the indices into
+    # Feature.geometry of the vertices kept, so step and way point indices
+    # can be mapped onto it.
+    feature = models.ForeignKey(Feature, on_delete=models.CASCADE, related_name='simplified_geometries')
+    zoom = models.PositiveSmallIntegerField()
+    # Degrees
+    tolerance = models.FloatField()
+    geometry = models.LineStringField()
+    vertex_indices = ArrayField(models.PositiveIntegerField())
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['feature', 'zoom'], name='routing_simplifiedgeometry_zoom'),
+        ]
 
 
 class Segment(models.Model):
@@ -76,8 +109,27 @@ class Step(models.Model):
     instruction = models.CharField(max_length=255)
     type = models.SmallIntegerField(choices=INSTRUCTION_TYPE_CHOICES)
     name = models.CharField(max_length=255)
-    way_points = models.ManyToManyField(WayPoint)
-    segment = models.ForeignKey(Segment, on_delete=models.CASCADE)
+    # [start, end] vertex range of the step within Feature.geometry
+    way_point_start = models.PositiveIntegerField()
+    way_point_end = models.PositiveIntegerField()
+    # Indexed by routing_step_order below.
+    segment = models.ForeignKey(Segment, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        indexes = [
+            # Steps are always read a segment at a time in this order, the
+            # index serves the filter and the sort.
+            models.Index(fields=['segment', 'way_point_start', 'id'], name='routing_step_order'),
+        ]
+
+    @property
+    def way_points(self):
+        return [self.way_point_start, self.way_point_end]
+
+    def coordinates(self, feature=None):
+        # Pass the feature when iterating many steps to avoid a query per step.
+        feature = feature or self.segment.feature
+        return feature.vertices(self.way_point_start, self.way_point_end)
 
 
 class Route(models.Model):
@@ -87,6 +139,30 @@ class Route(models.Model):
     end_location = models.PointField()
     feature_collection = models.ForeignKey(
         FeatureCollection, on_delete=models.CASCADE)
+    # Stops between start and end in visiting order, for optimised
+    # multi-stop routes.
+    waypoints = models.MultiPointField(null=True, blank=True)
+    # Truck the route was planned for, in metres and tonnes. Routes without
+    # any of these were planned for a car.
+    vehicle_height = models.FloatField(null=True, blank=True)
+    vehicle_weight = models.FloatField(null=True, blank=True)
+    vehicle_width = models.FloatField(null=True, blank=True)
+    vehicle_length = models.FloatField(null=True, blank=True)
+    hazmat_class = models.PositiveSmallIntegerField(choices=HAZMAT_CLASS_CHOICES, null=True, blank=True)
+    # Re-planned from a vehicle off `prefix_route`: this route's own
+    # collection only covers the way on from where the driver left it, the
+    # way there is vertices 0..prefix_end_index of the prefix route's
+    # geometry, shared rather than copied.
+    prefix_route = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL,
+                                     related_name='reroutes')
+    prefix_end_index = models.PositiveIntegerField(null=True, blank=True)
+    # Null for routes created before this was recorded.
+    created_at = models.DateTimeField(null=True, blank=True, default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='routing_route_created_at'),
+        ]
 
 
 class TruckStop(models.Model):
@@ -104,7 +180,7 @@ class TruckStop(models.Model):
         (46, 'VA'), (47, 'WA'), (48, 'WV'), (49, 'WI'), (50, 'WY')
     )
 
-    opis_id = models.IntegerField()
+    opis_id = models.IntegerField(unique=True)
     name = models.CharField(max_length=1023)
     address = models.CharField(max_length=1023)
     city = models.CharField(max_length=1023)
@@ -114,5 +190,139 @@ class TruckStop(models.Model):
     #  always want to use coordinates in our system.
     coordinate = models.PointField()
 
+    class Meta:
+        indexes = [
+            # Cheapest stops in a state.
+            models.Index(fields=['state', 'fuel_retail_price'], name='routing_truckstop_state_price'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.name}, {self.address}, {self.city}, {self.state}'
+
+
+class FeatureTruckStop(models.Model):
+    # A truck stop within Feature.corridor_miles of the route, stored at
+    # ingest and refreshed as stops change (see routing.corridor) so stops
+    # along a route are read without a spatial query.
+    # Indexed by the constraint and index below.
+    feature = models.ForeignKey(Feature, on_delete=models.CASCADE, related_name='corridor_stops', db_index=False)
+    truck_stop = models.ForeignKey(TruckStop, on_delete=models.CASCADE, related_name='corridor_features')
+    # Miles along the route to the point nearest the stop.
+    distance_along = models.FloatField()
+    # Miles from that point to the stop, one way.
+    detour = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['feature', 'truck_stop'], name='routing_featuretruckstop_pair'),
+        ]
+        indexes = [
+            # Stops along a route in order.
+            models.Index(fields=['feature', 'distance_along'], name='routing_featuretruckstop_along'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.feature_id}:{self.truck_stop_id}'
+
+
+class RouteCacheEntry(models.Model):
+    # Shared tier of the route cache, keyed on snapped start/end + profile so
+    # every worker can reuse a FeatureCollection another worker fetched.
+    key = models.CharField(max_length=255, unique=True)
+    profile = models.CharField(max_length=64)
+    feature_collection = models.ForeignKey(
+        FeatureCollection, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_hit_at = models.DateTimeField(default=timezone.now, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return self.key
+
+
+class MatrixCell(models.Model):
+    # One source/destination pair of the distance matrix cache. Points are
+    # snapped to the route cache grid and packed into an integer each (see
+    # routing.matrix.point_key) so a row stays small. Pairs without a route
+    # are kept too, with null duration and distance.
+    profile = models.CharField(max_length=255)
+    source = models.BigIntegerField()
+    destination = models.BigIntegerField()
+    # Seconds and metres
+    duration = models.FloatField(null=True, blank=True)
+    distance = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'source', 'destination'], name='routing_matrixcell_pair'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.profile}:{self.source}:{self.destination}'
+
+
+class GeocodeCacheEntry(models.Model):
+    # Keyed on a hash of the normalised address so a stop is only geocoded
+    # once. Failed lookups are kept too (null coordinate) so they aren't
+    # retried on every import.
+    key = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    coordinate = models.PointField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return self.query
+
+
+class RouteJob(models.Model):
+    # Route creation queued by POST /routes/ in async mode and picked up by
+    # `manage.py route_worker`.
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    # Client supplied Idempotency-Key, repeated submits return the same job.
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    # Validated RouteSerializer input.
+    request = models.JSONField()
+    route = models.ForeignKey(Route, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True)
+    error_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job, only queued rows are indexed.
+            models.Index(fields=['id'], name='routing_routejob_queued', condition=models.Q(status='queued')),
+        ]
+
+    @property
+    def finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def __str__(self) -> str:
+        return f'{self.pk} {self.status}'
+
+
+class TileGeneration(models.Model):
+    # Bumped whenever what a vector tile layer draws changes, rendered tiles
+    # are cached under the current generation of every layer. Routes have
+    # one per tile down to TILE_GENERATION_ZOOM, `routes/<z>/<x>/<y>`.
+    layer = models.CharField(max_length=32, primary_key=True)
+    generation = models.PositiveBigIntegerField(default=0)
+
     def __str__(self) -> str:
-        return f'{self.name}, {self.address}, {self.city}, {self.state}'
\ No newline at end of file
+        return f'{self.layer} {self.generation}'
@@ -0,0 +1,173 @@
+import csv
+import time
+
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+from .corridor import refresh_truck_stops
+from .geocode import GeocodeCache
+from .models import TruckStop
+from .tiles import TRUCK_STOPS, bump
+
+# Column headers of the OPIS truck stop price file.
+OPIS_COLUMNS = {
+    'opis_id': 'OPIS Truckstop ID',
+    'name': 'Truckstop Name',
+    'address': 'Address',
+    'city': 'City',
+    'state': 'State',
+    'price': 'Retail Price',
+}
+
+STATE_NAMES = dict(TruckStop.STATE_CHOICES)
+STATE_CODES = {code: value for value, code in TruckStop.STATE_CHOICES}
+
+UPSERT_SQL = '''
+INSERT INTO routing_truckstop (opis_id, name, address, city, state, fuel_retail_price, coordinate)
+VALUES %s
+ON CONFLICT (opis_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    address = EXCLUDED.address,
+    city = EXCLUDED.city,
+    state = EXCLUDED.state,
+    fuel_retail_price = EXCLUDED.fuel_retail_price,
+    coordinate = EXCLUDED.coordinate
+RETURNING id, opis_id
+'''
+UPSERT_TEMPLATE = '(%s, %s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326))'
+
+
+def parse_row(row, columns=OPIS_COLUMNS):
+    """
+    OPIS row -> dict of TruckStop values, or None if it can't be used.
+    """
+    try:
+        opis_id = int(row[columns['opis_id']])
+        price = round(float(row[columns['price']]) * 100)
+    except (TypeError, ValueError):
+        return None
+
+    state = STATE_CODES.get((row[columns['state']] or '').strip().upper())
+    if state is None:
+        # Canadian provinces and bad codes have no TruckStop state.
+        return None
+
+    return {
+        'opis_id': opis_id,
+        'name': row[columns['name']].strip(),
+        'address': row[columns['address']].strip(),
+        'city': row[columns['city']].strip(),
+        'state': state,
+        'fuel_retail_price': price,
+    }
+
+
+class OpisImporter:
+    """
+    Streams an OPIS price file into TruckStop, upserting on opis_id in
+    batches. Stops whose address is unchanged keep their coordinate, new or
+    moved stops are geocoded through the persistent GeocodeCache and their
+    route corridors refreshed.
+
+    The file lists a stop once per supply rack, the cheapest price wins.
+    """
+
+    def __init__(self, batch_size=1000, geocode=True, geocode_cache=None):
+        self.batch_size = batch_size
+        self.geocode = geocode
+        self.geocode_cache = geocode_cache or GeocodeCache()
+        self.stats = {'rows': 0, 'skipped': 0, 'ungeocoded': 0, 'upserted': 0, 'seconds': 0.0}
+        self.upserted_ids = []
+        # Of those, stops that are new or were geocoded again.
+        self.moved_ids = []
+        # Cheapest price written so far per opis_id, later duplicate rows are
+        # only written again when they lower it.
+        self._prices = {}
+        self._started = time.perf_counter()
+
+    def run(self, stream, progress=None):
+        self._started = time.perf_counter()
+        batch = {}
+
+        for row in csv.DictReader(stream):
+            self.stats['rows'] += 1
+            stop = parse_row(row)
+            if stop is None:
+                self.stats['skipped'] += 1
+                continue
+
+            opis_id = stop['opis_id']
+            cheapest = self._prices.get(opis_id)
+            if cheapest is not None and cheapest <= stop['fuel_retail_price']:
+                continue
+            self._prices[opis_id] = stop['fuel_retail_price']
+            batch[opis_id] = stop
+
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = {}
+                if progress:
+                    progress(self.progress())
+
+        if batch:
+            self.flush(batch)
+        if self.stats['upserted']:
+            # Upserts skip model signals, redraw the stop layer once.
+            bump(TRUCK_STOPS)
+        for start in range(0, len(self.moved_ids), self.batch_size):
+            refresh_truck_stops(self.moved_ids[start:start + self.batch_size])
+
+        return self.progress()
+
+    def progress(self):
+        self.stats['seconds'] = time.perf_counter() - self._started
+        seconds = self.stats['seconds']
+        return dict(self.stats, rows_per_second=self.stats['rows'] / seconds if seconds else 0.0)
+
+    def resolve_coordinates(self, batch):
+        existing = {
+            opis_id: (address, city, state, coordinate)
+            for opis_id, address, city, state, coordinate in TruckStop.objects
+            .filter(opis_id__in=batch.keys())
+            .values_list('opis_id', 'address', 'city', 'state', 'coordinate')
+        }
+
+        coordinates = {}
+        to_geocode = {}
+        for opis_id, stop in batch.items():
+            current = existing.get(opis_id)
+            if current and current[:3] == (stop['address'], stop['city'], stop['state']):
+                coordinates[opis_id] = current[3]
+            else:
+                to_geocode[opis_id] = (stop['address'], stop['city'], STATE_NAMES[stop['state']])
+
+        found = self.geocode_cache.lookup_many(set(to_geocode.values()), geocode=self.geocode)
+        for opis_id, address in to_geocode.items():
+            coordinates[opis_id] = found.get(address)
+
+        # New stops and stops whose address changed may have moved.
+        return coordinates, set(to_geocode)
+
+    def flush(self, batch):
+        # Geocoding waits on the rate limited geocoder, outside the write.
+        coordinates, moved = self.resolve_coordinates(batch)
+
+        values = []
+        for opis_id, stop in batch.items():
+            coordinate = coordinates.get(opis_id)
+            if coordinate is None:
+                self.stats['ungeocoded'] += 1
+                continue
+            values.append((opis_id, stop['name'], stop['address'], stop['city'], stop['state'],
+                           stop['fuel_retail_price'], coordinate.x, coordinate.y))
+
+        if not values:
+            return
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            ids = execute_values(cursor.cursor, UPSERT_SQL, values,
+                                 template=UPSERT_TEMPLATE, page_size=len(values), fetch=True)
+
+        self.upserted_ids.extend(row[0] for row in ids)
+        self.moved_ids.extend(row[0] for row in ids if row[1] in moved)
+        self.stats['upserted'] += len(values)
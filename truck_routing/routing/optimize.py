@@ -0,0 +1,208 @@
+import random
+import time
+from collections import deque
+from itertools import permutations
+
+# Up to this many stops every order is tried.
+EXACT_MAX_STOPS = 6
+
+
+class Solution:
+    def __init__(self, order, cost, initial_cost, iterations, seconds):
+        # Stops in visiting order, as indices into the matrix without the
+        # depot (0).
+        self.order = order
+        self.cost = cost
+        # Nearest neighbour cost, before any improvement.
+        self.initial_cost = initial_cost
+        self.iterations = iterations
+        self.seconds = seconds
+
+
+def path_cost(matrix, path):
+    return sum(matrix[a][b] for a, b in zip(path, path[1:]))
+
+
+def neighbours(matrix, count):
+    # Closest other nodes in either direction, candidates for new edges.
+    size = len(matrix)
+    return [sorted((other for other in range(size) if other != node),
+                   key=lambda other: matrix[node][other] + matrix[other][node])[:count]
+            for node in range(size)]
+
+
+def nearest_neighbour(matrix):
+    size = len(matrix)
+    path = [0]
+    unvisited = set(range(1, size))
+    while unvisited:
+        row = matrix[path[-1]]
+        node = min(unvisited, key=row.__getitem__)
+        unvisited.remove(node)
+        path.append(node)
+    path.append(0)
+    return path
+
+
+class LocalSearch:
+    """
+    2-opt and Or-opt moves on a closed path [0, ..., 0] over an asymmetric
+    matrix, restricted to moves creating an edge to one of a node's nearest
+    neighbours.
+
+    Only nodes next to a recent change are examined (don't look bits), so
+    improving a tour after a small kick costs far less than a full pass.
+
+    2-opt reverses part of the path, which changes the cost of every edge
+    inside it when the matrix isn't symmetric. Prefix sums of the forward
+    and backward edge costs give that change in constant time.
+    """
+
+    def __init__(self, matrix, candidates, deadline):
+        self.matrix = matrix
+        self.candidates = candidates
+        self.deadline = deadline
+        self.moves = 0
+
+    def expired(self):
+        return time.perf_counter() >= self.deadline
+
+    def index(self, path):
+        matrix = self.matrix
+        forward, backward = [0.0], [0.0]
+        for a, b in zip(path, path[1:]):
+            forward.append(forward[-1] + matrix[a][b])
+            backward.append(backward[-1] + matrix[b][a])
+        self.forward, self.backward = forward, backward
+        self.position = {node: index for index, node in enumerate(path[:-1])}
+
+    def two_opt(self, path, i):
+        # Reverse path[i..j] for a j making path[i - 1] -> path[j] a
+        # candidate edge. Returns the nodes whose edges changed.
+        matrix, forward, backward = self.matrix, self.forward, self.backward
+        last = len(path) - 1
+        if not 1 <= i < last - 1:
+            return None
+        before = path[i - 1]
+        for neighbour in self.candidates[before]:
+            j = self.position[neighbour]
+            if j <= i or j >= last:
+                continue
+            old = matrix[before][path[i]] + forward[j] - forward[i] + matrix[path[j]][path[j + 1]]
+            new = matrix[before][path[j]] + backward[j] - backward[i] + matrix[path[i]][path[j + 1]]
+            if new < old - 1e-9:
+                touched = (before, path[i], path[j], path[j + 1])
+                path[i:j + 1] = path[i:j + 1][::-1]
+                return touched
+        return None
+
+    def or_opt(self, path, i):
+        # Move path[i..i + length - 1] between two nodes, next to one of
+        # the first node's candidates.
+        matrix, position = self.matrix, self.position
+        last = len(path) - 1
+        for length in (1, 2, 3):
+            if not 1 <= i or i + length > last:
+                break
+            first, end = path[i], path[i + length - 1]
+            before, after = path[i - 1], path[i + length]
+            removed = matrix[before][first] + matrix[end][after] - matrix[before][after]
+
+            best, best_at = -1e-9, None
+            for neighbour in self.candidates[first]:
+                for k in (position[neighbour], position[neighbour] - 1):
+                    if i - 1 <= k < i + length or k < 0 or k >= last:
+                        continue
+                    added = matrix[path[k]][first] + matrix[end][path[k + 1]] - matrix[path[k]][path[k + 1]]
+                    if added - removed < best:
+                        best, best_at = added - removed, k
+
+            if best_at is not None:
+                touched = (before, after, first, end, path[best_at], path[best_at + 1])
+                segment = path[i:i + length]
+                rest = path[:i] + path[i + length:]
+                k = best_at if best_at < i else best_at - length
+                path[:] = rest[:k + 1] + segment + rest[k + 1:]
+                return touched
+        return None
+
+    def run(self, path, active=None):
+        """
+        Improve `path` in place until no move helps any active node (all
+        nodes by default) or the deadline passes.
+        """
+        self.index(path)
+        queue = deque(path[:-1] if active is None else active)
+        queued = set(queue)
+        while queue and not self.expired():
+            node = queue.popleft()
+            queued.discard(node)
+            i = self.position[node]
+            touched = (self.two_opt(path, i) or self.two_opt(path, i + 1) or self.or_opt(path, i))
+            if touched:
+                self.moves += 1
+                self.index(path)
+                for changed in touched:
+                    if changed not in queued:
+                        queue.append(changed)
+                        queued.add(changed)
+        return path
+
+
+def double_bridge(path, rng):
+    """
+    Reconnect three cut segments in another order, a kick 2-opt can't undo.
+    Returns the new path and the nodes at the cuts.
+    """
+    inner = path[1:-1]
+    a, b, c = sorted(rng.sample(range(1, len(inner)), 3))
+    kicked = [0] + inner[:a] + inner[b:c] + inner[a:b] + inner[c:] + [0]
+    cuts = {inner[index] for cut in (a, b, c) for index in (cut - 1, cut)}
+    return kicked, cuts
+
+
+def solve(matrix, closed=True, time_budget=1.0, candidates=12, seed=0):
+    """
+    Order stops 1..n of a square duration matrix starting from the depot at
+    0, returning to it if `closed`.
+
+    Starts from the nearest neighbour tour, improves it with 2-opt and
+    Or-opt, then keeps kicking the best tour found with double bridge moves
+    and improving it again until `time_budget` seconds have passed or it
+    stops finding better tours. Up to
+    EXACT_MAX_STOPS stops the best order is found by trying them all.
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    size = len(matrix)
+    if not closed:
+        # Returning to the depot is free on an open tour.
+        matrix = [list(row) if index == 0 else [0.0] + list(row[1:]) for index, row in enumerate(matrix)]
+
+    path = nearest_neighbour(matrix)
+    initial_cost = path_cost(matrix, path)
+    iterations = 0
+
+    if size - 1 <= EXACT_MAX_STOPS:
+        path = min(([0, *order, 0] for order in permutations(range(1, size))),
+                   key=lambda candidate: path_cost(matrix, candidate))
+    else:
+        search = LocalSearch(matrix, neighbours(matrix, min(candidates, size - 1)), deadline)
+        best = search.run(path)
+        best_cost = path_cost(matrix, best)
+
+        rng = random.Random(seed)
+        # Small tours converge long before the budget runs out.
+        stale, patience = 0, 20 * size
+        while stale < patience and not search.expired():
+            kicked, cuts = double_bridge(best, rng)
+            candidate = search.run(kicked, active=cuts | {0})
+            cost = path_cost(matrix, candidate)
+            iterations += 1
+            stale += 1
+            if cost < best_cost - 1e-9:
+                best, best_cost, stale = candidate, cost, 0
+        path = best
+
+    return Solution(order=path[1:-1], cost=path_cost(matrix, path), initial_cost=initial_cost,
+                    iterations=iterations, seconds=time.perf_counter() - started)
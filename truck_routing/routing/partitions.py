@@ -0,0 +1,155 @@
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+
+STEP_TABLE = 'routing_step'
+LEGACY_PARTITION = 'routing_step_legacy'
+DEFAULT_PARTITION = 'routing_step_default'
+
+BOUND_RE = re.compile(r"FROM \((MINVALUE|'?-?\d+'?)\) TO \((MAXVALUE|'?-?\d+'?)\)")
+
+
+def is_partitioned(table=STEP_TABLE):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def parse_bound(value):
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return int(value.strip("'"))
+
+
+def step_partitions():
+    """
+    (name, lower id, upper id) of each range partition of the step table,
+    lowest first, None for an unbounded end. The default partition isn't
+    included.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+        ''', [STEP_TABLE])
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_RE.search(bound)
+        if match is not None:
+            partitions.append((name, parse_bound(match.group(1)), parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda partition: -1 if partition[1] is None else partition[1])
+
+
+def max_step_id(cursor):
+    cursor.execute(f'SELECT COALESCE(max(id), 0) FROM {STEP_TABLE}')
+    return cursor.fetchone()[0]
+
+
+def partition_steps(rows=None):
+    """
+    Turn the step table into one partitioned by ranges of `rows` ids
+    (STEP_PARTITION_ROWS by default). Step ids only grow, so each partition
+    holds the steps of the routes planned over a stretch of time and can be
+    dropped in one go once the purge has emptied it.
+
+    The existing table is attached whole as the first partition. Its range
+    is proven by a CHECK constraint validated before taking any lock that
+    blocks ingest, so the switch itself only renames and attaches.
+
+    Indexes can't be built CONCURRENTLY on a partitioned table, later
+    migrations adding one to Step have to build it partition by partition.
+    """
+    rows = rows or settings.STEP_PARTITION_ROWS
+    with connection.cursor() as cursor:
+        # Room for the steps written while the constraint is validated.
+        bound = max_step_id(cursor) + rows
+        cursor.execute(f'ALTER TABLE {STEP_TABLE} ADD CONSTRAINT routing_step_legacy_range '
+                       f'CHECK (id < {bound}) NOT VALID')
+        cursor.execute(f'ALTER TABLE {STEP_TABLE} VALIDATE CONSTRAINT routing_step_legacy_range')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {STEP_TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute('''
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND contype = 'f'
+        ''', [STEP_TABLE])
+        foreign_keys = cursor.fetchall()
+
+        # Index and constraint names are per schema, the new table gets the
+        # names Django knows.
+        cursor.execute(f'ALTER TABLE {STEP_TABLE} RENAME TO {LEGACY_PARTITION}')
+        cursor.execute(f'ALTER INDEX routing_step_pkey RENAME TO {LEGACY_PARTITION}_pkey')
+        cursor.execute(f'ALTER INDEX routing_step_order RENAME TO {LEGACY_PARTITION}_order')
+
+        # The id default still draws from routing_step_id_seq.
+        cursor.execute(f'CREATE TABLE {STEP_TABLE} (LIKE {LEGACY_PARTITION} INCLUDING DEFAULTS) '
+                       f'PARTITION BY RANGE (id)')
+        cursor.execute(f'ALTER TABLE {STEP_TABLE} ADD CONSTRAINT routing_step_pkey PRIMARY KEY (id)')
+        cursor.execute(f'CREATE INDEX routing_step_order ON {STEP_TABLE} (segment_id, way_point_start, id)')
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {STEP_TABLE} ADD CONSTRAINT {name} {definition}')
+        cursor.execute('ALTER SEQUENCE routing_step_id_seq OWNED BY routing_step.id')
+
+        # Matching indexes and foreign keys of the old table are attached
+        # rather than built again, the CHECK constraint spares the scan.
+        cursor.execute(f'ALTER TABLE {STEP_TABLE} ATTACH PARTITION {LEGACY_PARTITION} '
+                       f'FOR VALUES FROM (MINVALUE) TO ({bound})')
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {STEP_TABLE} DEFAULT')
+
+    return ensure_step_partitions(rows)
+
+
+def ensure_step_partitions(rows=None, ahead=None):
+    """
+    Create partitions so there are `ahead` (STEP_PARTITIONS_AHEAD) empty
+    ones past the highest step id, run it regularly. Steps past the last
+    one go to the default partition rather than fail. Returns the names
+    of the partitions created.
+    """
+    rows = rows or settings.STEP_PARTITION_ROWS
+    ahead = settings.STEP_PARTITIONS_AHEAD if ahead is None else ahead
+    partitions = step_partitions()
+    if not partitions:
+        return []
+
+    created = []
+    with connection.cursor() as cursor:
+        upper = partitions[-1][2]
+        target = max_step_id(cursor) + ahead * rows
+        while upper < target:
+            name = f'routing_step_p{upper}'
+            cursor.execute(f'CREATE TABLE {name} PARTITION OF {STEP_TABLE} '
+                           f'FOR VALUES FROM ({upper}) TO ({upper + rows})')
+            created.append(name)
+            upper += rows
+    return created
+
+
+def drop_empty_step_partitions():
+    """
+    Drop partitions below the newest step that the purge has emptied,
+    which hands their space back at once instead of leaving it to vacuum.
+    Returns the names of the partitions dropped.
+    """
+    dropped = []
+    with connection.cursor() as cursor:
+        newest = max_step_id(cursor)
+        for name, _, upper in step_partitions():
+            if upper is None or upper > newest:
+                continue
+            with transaction.atomic():
+                # Waits out ingest still writing ids from this range.
+                cursor.execute(f'LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE')
+                cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name})')
+                if cursor.fetchone()[0]:
+                    continue
+                cursor.execute(f'ALTER TABLE {STEP_TABLE} DETACH PARTITION {name}')
+                cursor.execute(f'DROP TABLE {name}')
+            dropped.append(name)
+    return dropped
@@ -0,0 +1,154 @@
+import gzip
+import threading
+
+from django.conf import settings
+from django.utils.http import http_date
+
+from .lru import LRUCache
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are optional.
+    brotli = None
+
+COMPRESSORS = {
+    'gzip': lambda payload: gzip.compress(payload, compresslevel=6),
+}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda payload: brotli.compress(payload, quality=5)
+
+# Preferred first when the client accepts several.
+ENCODING_PREFERENCE = ('br', 'gzip')
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def feature_collection_validators(feature_collection, variant=''):
+    """
+    ETag and Last-Modified for a stored FeatureCollection. Stored routes are
+    never modified, so the ORS timestamp identifies the document, `variant`
+    tells renderings of it apart.
+    """
+    timestamp = feature_collection.metadata.timestamp
+    etag = f'"fc-{feature_collection.pk}-{timestamp}{variant}"'
+    return etag, timestamp // 1000
+
+
+def coded_etag(etag, encoding=None):
+    # Compressed bytes differ from the identity ones, so a strong ETag has
+    # to tell each content coding apart.
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+class PayloadCache:
+    """
+    Rendered documents kept in memory up to `max_bytes` in total, least
+    recently used first out. Each document can be kept pre-compressed in
+    `encodings` next to the identity payload.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes, encodings=()):
+        self.max_entry_bytes = max_entry_bytes
+        self.encodings = [encoding for encoding in encodings if encoding in COMPRESSORS]
+        self.cache = LRUCache(max_entries=100000, max_bytes=max_bytes)
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0, 'too_large': 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_bytes=settings.FEATURE_COLLECTION_CACHE_MAX_BYTES,
+            max_entry_bytes=settings.FEATURE_COLLECTION_CACHE_MAX_ENTRY_BYTES,
+            encodings=settings.FEATURE_COLLECTION_CACHE_ENCODINGS,
+        )
+
+    def encoding(self, key, accepted=()):
+        # Content coding get() would return now, None for identity or
+        # nothing cached.
+        for encoding in ENCODING_PREFERENCE:
+            if encoding in accepted and self.cache.get((key, encoding)) is not None:
+                return encoding
+        return None
+
+    def get(self, key, accepted=()):
+        """
+        Returns (payload, encoding) using the best cached encoding the
+        client accepts, or (None, None).
+        """
+        for encoding in ENCODING_PREFERENCE:
+            if encoding in accepted:
+                payload = self.cache.get((key, encoding))
+                if payload is not None:
+                    self._count('hits')
+                    return payload, encoding
+
+        payload = self.cache.get((key, None))
+        self._count('hits' if payload is not None else 'misses')
+        return (payload, None) if payload is not None else (None, None)
+
+    def store(self, key, payload):
+        if len(payload) > self.max_entry_bytes:
+            self._count('too_large')
+            return
+        self._count('stores')
+        self.cache.set((key, None), payload)
+        for encoding in self.encodings:
+            self.cache.set((key, encoding), COMPRESSORS[encoding](payload))
+
+    def tee(self, key, chunks):
+        """
+        Pass rendered chunks through and cache the document once it has
+        been sent completely.
+        """
+        parts = []
+        size = 0
+        for chunk in chunks:
+            data = chunk.encode()
+            size += len(data)
+            if parts is not None and size <= self.max_entry_bytes:
+                parts.append(data)
+            else:
+                # Too big to cache, stop collecting.
+                if parts is not None:
+                    self._count('too_large')
+                parts = None
+            yield data
+
+        if parts is not None:
+            self.store(key, b''.join(parts))
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        # Each encoding of a document is an entry of its own.
+        stats['entries'] = len(self.cache)
+        stats['bytes'] = self.cache.size
+        return stats
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f'public, max-age={settings.FEATURE_COLLECTION_MAX_AGE}, immutable'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+feature_collection_payloads = PayloadCache.from_settings()
@@ -0,0 +1,184 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asgiref.sync import sync_to_async
+from django.contrib.gis.geos import MultiPoint
+from django.db import close_old_connections, connection
+
+from .cache import route_cache
+from .backends import get_routing_backend
+from .directions import DirectionsError
+from .geo import to_point
+from .ingest import persist_directions
+from .matrix import duration_matrix
+from .metrics import phase
+from .models import Route
+from .optimize import solve
+from .vehicles import Vehicle, get_restriction_index
+
+logger = logging.getLogger(__name__)
+
+
+def check_restrictions(geojson, vehicle):
+    """
+    Raise DirectionsError if a route runs along roads the vehicle exceeds the
+    limits of, according to the local restriction index.
+    """
+    index = get_restriction_index()
+    if index is None or not vehicle.is_truck:
+        return
+    for feature in geojson['features']:
+        violations = index.violations(feature['geometry']['coordinates'], vehicle)
+        if violations:
+            raise DirectionsError(f'Route passes {len(violations)} restriction(s) the vehicle exceeds, '
+                                  f'first at {violations[0]["coordinate"]}', status=422)
+
+
+def feature_collection_for_lane(start, end, vehicle=None):
+    """
+    Stored FeatureCollection for a lane, from the route cache or computed by
+    the routing backend and persisted. Raises DirectionsError if the backend
+    can't route it.
+    """
+    vehicle = vehicle or Vehicle()
+    # Dispatchers re-plan the same lanes all day, reuse the stored
+    # collection instead of calling ORS and persisting it again.
+    with phase('route_cache'):
+        feature_collection = route_cache.get(start, end, vehicle.cache_profile)
+    if feature_collection is None:
+        backend = get_routing_backend()
+        with phase('directions'):
+            geojson = backend.directions(start, end, vehicle.profile, vehicle=vehicle)
+            if not backend.enforces_restrictions:
+                check_restrictions(geojson, vehicle)
+        with phase('persist'):
+            feature_collection = persist_directions(geojson)
+        with phase('route_cache'):
+            route_cache.set(start, end, vehicle.cache_profile, feature_collection)
+    return feature_collection
+
+
+async def afeature_collection_for_lane(start, end, vehicle=None):
+    """
+    feature_collection_for_lane awaiting the routing backend, the cache and
+    the database are used through sync_to_async.
+    """
+    vehicle = vehicle or Vehicle()
+    with phase('route_cache'):
+        feature_collection = await sync_to_async(route_cache.get)(start, end, vehicle.cache_profile)
+    if feature_collection is None:
+        backend = await sync_to_async(get_routing_backend)()
+        with phase('directions'):
+            geojson = await backend.adirections(start, end, vehicle.profile, vehicle=vehicle)
+            if not backend.enforces_restrictions:
+                await sync_to_async(check_restrictions)(geojson, vehicle)
+        with phase('persist'):
+            feature_collection = await sync_to_async(persist_directions)(geojson)
+        with phase('route_cache'):
+            await sync_to_async(route_cache.set)(start, end, vehicle.cache_profile, feature_collection)
+    return feature_collection
+
+
+def new_route(start, end, feature_collection, vehicle):
+    return Route.objects.create(start_location=to_point(start), end_location=to_point(end),
+                                feature_collection=feature_collection, **vehicle.route_fields())
+
+
+def create_route(start, end, vehicle=None):
+    vehicle = vehicle or Vehicle()
+    feature_collection = feature_collection_for_lane(start, end, vehicle)
+    with phase('persist'):
+        return new_route(start, end, feature_collection, vehicle)
+
+
+async def acreate_route(start, end, vehicle=None):
+    vehicle = vehicle or Vehicle()
+    feature_collection = await afeature_collection_for_lane(start, end, vehicle)
+    with phase('persist'):
+        return await sync_to_async(new_route)(start, end, feature_collection, vehicle)
+
+
+def optimize_route(depot, stops, vehicle=None, closed=True, time_budget=1.0):
+    """
+    Visit `stops` from `depot` in the fastest order found within
+    `time_budget` seconds, coming back to the depot if `closed`. The trip is
+    stored as one FeatureCollection with a segment per leg.
+
+    Returns (route, order, solution), `order` being indices into `stops`.
+    """
+    vehicle = vehicle or Vehicle()
+    locations = [depot, *stops]
+    durations, _ = duration_matrix(locations, vehicle)
+    unreachable = [index for index, row in enumerate(durations)
+                   if any(duration is None for duration in row)]
+    if unreachable:
+        raise DirectionsError(f'No route between some stops, first at {locations[unreachable[0]]}', status=404)
+
+    solution = solve(durations, closed=closed, time_budget=time_budget)
+    order = [index - 1 for index in solution.order]
+    trip = [depot, *(stops[index] for index in order)] + ([depot] if closed else [])
+
+    backend = get_routing_backend()
+    geojson = backend.directions_via(trip, vehicle.profile, vehicle=vehicle)
+    if not backend.enforces_restrictions:
+        check_restrictions(geojson, vehicle)
+    feature_collection = persist_directions(geojson)
+
+    waypoints = MultiPoint([to_point(stop) for stop in trip[1:-1]], srid=4326) if len(trip) > 2 else None
+    route = Route.objects.create(start_location=to_point(trip[0]), end_location=to_point(trip[-1]),
+                                 waypoints=waypoints, feature_collection=feature_collection,
+                                 **vehicle.route_fields())
+    return route, order, solution
+
+
+def _plan_lane(start, end, indices, vehicle):
+    close_old_connections()
+    try:
+        feature_collection = feature_collection_for_lane(start, end, vehicle)
+        vehicle_fields = vehicle.route_fields()
+        return Route.objects.bulk_create(
+            [Route(start_location=to_point(start), end_location=to_point(end),
+                   feature_collection=feature_collection, **vehicle_fields) for _ in indices])
+    finally:
+        # Worker threads each hold their own connection.
+        connection.close()
+
+
+def plan_batch(lanes, concurrency, vehicle=None):
+    """
+    Plan many (start, end) lanes concurrently, yielding (index, route, error)
+    for every lane as soon as its result is ready.
+
+    Identical lanes (after snapping to the route cache grid) are fetched
+    once. At most `concurrency` lanes are fetched and persisted at a time,
+    the directions client's rate limiter still applies on top of that.
+    Every lane is planned for the same `vehicle`.
+    """
+    vehicle = vehicle or Vehicle()
+    unique = {}
+    for index, (start, end) in enumerate(lanes):
+        key = route_cache.key(start, end, vehicle.cache_profile)
+        unique.setdefault(key, (start, end, []))[2].append(index)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='route-batch')
+    try:
+        futures = {executor.submit(_plan_lane, start, end, indices, vehicle): indices
+                   for start, end, indices in unique.values()}
+
+        for future in as_completed(futures):
+            indices = futures[future]
+            try:
+                routes = future.result()
+            except Exception as e:
+                # Report the lane as failed rather than the whole batch.
+                if not isinstance(e, DirectionsError):
+                    logger.exception('Planning lane %s failed', indices[0])
+                for index in indices:
+                    yield index, None, e
+                continue
+
+            for index, route in zip(indices, routes):
+                yield index, route, None
+    finally:
+        # Stop fetching if the client went away before the batch finished.
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,142 @@
+import math
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .backends import get_routing_backend
+from .geo import haversine_miles
+from .ingest import persist_directions
+from .models import Route, Step
+from .planner import check_restrictions, feature_collection_for_lane
+from .vehicles import Vehicle
+
+METERS_PER_DEGREE = 111320.0
+
+STEP_FIELDS = ('segment_id', 'distance', 'duration', 'type', 'instruction', 'name',
+               'way_point_start', 'way_point_end')
+
+
+def locate(coordinates, lon_lat):
+    """
+    Nearest point of a route ([lon, lat] vertices) to `lon_lat`, as
+    (index, fraction, metres, [lon, lat]) with `index` the vertex the
+    nearest segment starts at and `fraction` how far along it the point is.
+    """
+    lon, lat = lon_lat
+    scale = math.cos(math.radians(lat))
+    if len(coordinates) < 2:
+        x, y = (lon - coordinates[0][0]) * scale, lat - coordinates[0][1]
+        return 0, 0.0, math.hypot(x, y) * METERS_PER_DEGREE, list(coordinates[0][:2])
+
+    best, best_index, best_fraction = math.inf, 0, 0.0
+    # Degrees on a local flat projection, scaled to metres once at the end.
+    for index in range(len(coordinates) - 1):
+        lon1, lat1 = coordinates[index][0], coordinates[index][1]
+        dx, dy = (coordinates[index + 1][0] - lon1) * scale, coordinates[index + 1][1] - lat1
+        x, y = (lon - lon1) * scale, lat - lat1
+        squared = dx * dx + dy * dy
+        fraction = 0.0 if not squared else max(0.0, min(1.0, (x * dx + y * dy) / squared))
+        ex, ey = x - fraction * dx, y - fraction * dy
+        distance = ex * ex + ey * ey
+        if distance < best:
+            best, best_index, best_fraction = distance, index, fraction
+
+    (lon1, lat1), (lon2, lat2) = coordinates[best_index][:2], coordinates[best_index + 1][:2]
+    snapped = [round(lon1 + (lon2 - lon1) * best_fraction, 6), round(lat1 + (lat2 - lat1) * best_fraction, 6)]
+    return best_index, best_fraction, math.sqrt(best) * METERS_PER_DEGREE, snapped
+
+
+def path_length(coordinates):
+    return sum(haversine_miles(a, b) for a, b in zip(coordinates, coordinates[1:]))
+
+
+def remaining(feature, index, position, now=None):
+    """
+    What is left of `feature` from `position`, which lies on the segment
+    starting at vertex `index`: the steps still ahead with an ETA for the
+    end of each, grouped by segment, and the remaining totals.
+
+    The step the vehicle is on is prorated on the length of route left in
+    it. Only steps ending past `index` are read.
+    """
+    now = now or timezone.now()
+    coordinates = feature.geometry.coords
+    steps = (Step.objects
+             .filter(segment__feature=feature, way_point_end__gt=index)
+             .order_by('segment_id', 'way_point_start', 'id')
+             .values_list(*STEP_FIELDS))
+
+    segments = []
+    elapsed = distance_left = 0.0
+    for segment_id, distance, duration, step_type, instruction, name, start, end in steps:
+        if start <= index:
+            step_length = path_length(coordinates[start:end + 1])
+            ratio = (path_length([position, *coordinates[index + 1:end + 1]]) / step_length
+                     if step_length else 0.0)
+            distance, duration = distance * ratio, duration * ratio
+            start = index
+
+        if not segments or segments[-1]['id'] != segment_id:
+            segments.append({'id': segment_id, 'distance': 0.0, 'duration': 0.0, 'steps': []})
+        segment = segments[-1]
+        elapsed += duration
+        distance_left += distance
+        segment['distance'] += distance
+        segment['duration'] += duration
+        segment['steps'].append({'distance': round(distance, 1), 'duration': round(duration, 1),
+                                 'type': step_type, 'instruction': instruction, 'name': name,
+                                 'way_points': [start, end], 'eta': now + timedelta(seconds=elapsed)})
+
+    return {
+        'distance': round(distance_left, 1),
+        'duration': round(elapsed, 1),
+        'eta': now + timedelta(seconds=elapsed),
+        'segments': [{'distance': round(segment['distance'], 1), 'duration': round(segment['duration'], 1),
+                      'steps': segment['steps']} for segment in segments],
+    }
+
+
+def reroute_from(route, position, tolerance):
+    """
+    Progress of a vehicle at `position` (lon, lat) along `route`.
+
+    Within `tolerance` metres of the route this only reads what's stored.
+    Further off, the way on from `position` to the end, through any stops
+    not reached yet, is planned as a new Route sharing the way so far with
+    `route` (see Route.prefix_route).
+
+    Returns (new route or None, progress) with progress as from remaining()
+    plus where the position was matched.
+    """
+    feature = route.feature_collection.feature_set.order_by('id').first()
+    coordinates = feature.geometry.coords
+    index, _, off_route, snapped = locate(coordinates, position)
+
+    if off_route <= tolerance:
+        progress = remaining(feature, index, snapped)
+        return None, dict(progress, on_route=True, way_point=index, position=snapped,
+                          off_route=round(off_route, 1))
+
+    vehicle = Vehicle.from_route(route)
+    end = route.end_location.coords
+    # Stops ahead of where the vehicle left the route.
+    stops = [coordinates[way_point] for way_point in feature.way_point_indices[1:-1] if way_point > index]
+    if stops:
+        backend = get_routing_backend()
+        geojson = backend.directions_via([position, *stops, end], vehicle.profile, vehicle=vehicle)
+        if not backend.enforces_restrictions:
+            check_restrictions(geojson, vehicle)
+        feature_collection = persist_directions(geojson)
+    else:
+        # Drivers keep pinging from about the same place until they turn
+        # back, the route cache makes those one fetch.
+        feature_collection = feature_collection_for_lane(position, end, vehicle)
+
+    new_route = Route.objects.create(start_location=route.start_location, end_location=route.end_location,
+                                     waypoints=route.waypoints, feature_collection=feature_collection,
+                                     prefix_route=route, prefix_end_index=index, **vehicle.route_fields())
+
+    tail = feature_collection.feature_set.order_by('id').first()
+    progress = remaining(tail, 0, tail.geometry.coords[0])
+    return new_route, dict(progress, on_route=False, way_point=0, position=list(tail.geometry.coords[0]),
+                           off_route=round(off_route, 1))
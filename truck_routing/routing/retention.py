@@ -0,0 +1,156 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .tiles import bump_routes
+
+# Collections planned before the cutoff that no route created since uses
+# and no route cache entry hit since points at. Locked so a worker reusing
+# one from the cache right now keeps it.
+EXPIRED_FROM = '''
+FROM routing_featurecollection collection
+JOIN routing_metadata metadata ON metadata.id = collection.metadata_id
+WHERE metadata.timestamp < %(cutoff_ms)s
+  AND NOT EXISTS (SELECT 1 FROM routing_route route
+                  WHERE route.feature_collection_id = collection.id AND route.created_at >= %(cutoff)s)
+  AND NOT EXISTS (SELECT 1 FROM routing_routecacheentry entry
+                  WHERE entry.feature_collection_id = collection.id AND entry.last_hit_at >= %(cutoff)s)
+'''
+
+EXPIRED_SQL = f'''
+SELECT collection.id, collection.bbox_id, collection.metadata_id
+{EXPIRED_FROM}
+ORDER BY collection.id
+LIMIT %(limit)s
+FOR UPDATE OF collection SKIP LOCKED
+'''
+
+# Children first, each one statement over the whole batch instead of the
+# ORM collecting and deleting object by object.
+DELETE_SQL = (
+    ('routing_step', 'DELETE FROM routing_step WHERE segment_id IN '
+                     '(SELECT id FROM routing_segment WHERE feature_id = ANY(%(features)s))'),
+    ('routing_segment', 'DELETE FROM routing_segment WHERE feature_id = ANY(%(features)s)'),
+    ('routing_simplifiedgeometry', 'DELETE FROM routing_simplifiedgeometry WHERE feature_id = ANY(%(features)s)'),
+    ('routing_featuretruckstop', 'DELETE FROM routing_featuretruckstop WHERE feature_id = ANY(%(features)s)'),
+    ('routing_feature', 'DELETE FROM routing_feature WHERE id = ANY(%(features)s)'),
+    ('routing_featuresummary', 'DELETE FROM routing_featuresummary WHERE id = ANY(%(summaries)s)'),
+    ('routing_routecacheentry',
+     'DELETE FROM routing_routecacheentry WHERE feature_collection_id = ANY(%(collections)s)'),
+    ('routing_route', 'DELETE FROM routing_route WHERE id = ANY(%(routes)s)'),
+    ('routing_featurecollection', 'DELETE FROM routing_featurecollection WHERE id = ANY(%(collections)s)'),
+    ('routing_metadata', 'DELETE FROM routing_metadata WHERE id = ANY(%(metadata)s)'),
+    ('routing_boundingbox', 'DELETE FROM routing_boundingbox WHERE id = ANY(%(bboxes)s)'),
+)
+
+# What on_delete=SET_NULL would do for the routes deleted.
+DETACH_SQL = (
+    'UPDATE routing_route SET prefix_route_id = NULL, prefix_end_index = NULL '
+    'WHERE prefix_route_id = ANY(%(routes)s) AND NOT id = ANY(%(routes)s)',
+    'UPDATE routing_routejob SET route_id = NULL WHERE route_id = ANY(%(routes)s)',
+)
+
+
+def retention_cutoff(days=None):
+    days = settings.ROUTE_RETENTION_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def cutoff_params(cutoff, **params):
+    return dict(params, cutoff=cutoff, cutoff_ms=int(cutoff.timestamp() * 1000))
+
+
+def count_expired(cutoff):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT count(*) ' + EXPIRED_FROM, cutoff_params(cutoff))
+        return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def purge_batch(cutoff, batch_size):
+    """
+    Delete up to `batch_size` expired feature collections with everything
+    hanging off them, routes included, in one transaction. Returns rows
+    deleted per table, empty when nothing had expired.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(EXPIRED_SQL, cutoff_params(cutoff, limit=batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return {}
+
+        collections = [row[0] for row in rows]
+        bboxes = {row[1] for row in rows}
+        cursor.execute('SELECT id, summary_id, bbox_id, ST_XMin(geometry), ST_YMin(geometry), '
+                       'ST_XMax(geometry), ST_YMax(geometry) '
+                       'FROM routing_feature WHERE feature_collection_id = ANY(%s)', [collections])
+        features = cursor.fetchall()
+        bboxes.update(row[2] for row in features)
+        cursor.execute('SELECT id FROM routing_route WHERE feature_collection_id = ANY(%s)', [collections])
+
+        ids = {
+            'collections': collections,
+            'metadata': [row[2] for row in rows],
+            'bboxes': sorted(bboxes),
+            'features': [row[0] for row in features],
+            'summaries': [row[1] for row in features],
+            'routes': [row[0] for row in cursor.fetchall()],
+        }
+        for sql in DETACH_SQL:
+            cursor.execute(sql, ids)
+
+        deleted = {}
+        for table, sql in DELETE_SQL:
+            cursor.execute(sql, ids)
+            deleted[table] = cursor.rowcount
+
+    # The raw deletes don't send signals, drop the cached tiles that drew
+    # these routes here.
+    bump_routes([row[3:] for row in features])
+    return deleted
+
+
+def purge_expired(cutoff, batch_size=None, max_batches=None, pause=0.0, progress=None):
+    """
+    Purge expired feature collections batch by batch until none are left
+    or `max_batches` ran, sleeping `pause` seconds between batches to go
+    easy on replication and I/O. Returns rows deleted per table.
+    """
+    batch_size = batch_size or settings.ROUTE_PURGE_BATCH_SIZE
+    totals = {}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        deleted = purge_batch(cutoff, batch_size)
+        if not deleted:
+            break
+        batches += 1
+        for table, count in deleted.items():
+            totals[table] = totals.get(table, 0) + count
+        if progress is not None:
+            progress(batches, deleted)
+        if pause:
+            time.sleep(pause)
+
+    return totals
+
+
+def purge_expired_matrix_cells(batch_size=10000, pause=0.0):
+    """
+    Delete matrix cells past MATRIX_CACHE_TTL, `batch_size` at a time.
+    Lookups already ignore them, this only takes back the space.
+    """
+    expires_before = timezone.now() - timedelta(seconds=settings.MATRIX_CACHE_TTL)
+    deleted = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute('DELETE FROM routing_matrixcell WHERE id IN '
+                           '(SELECT id FROM routing_matrixcell WHERE created_at <= %s LIMIT %s)',
+                           [expires_before, batch_size])
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+            if pause:
+                time.sleep(pause)
@@ -1,10 +1,14 @@
-from django.contrib.gis.geos import Polygon, Point, LineString
-
+from django.conf import settings
 from rest_framework import serializers
-from .models import Route, FeatureCollection, BoundingBox, Feature, FeatureSummary, Metadata, Segment, Step, WayPoint, TruckStop
-
-import os
-import requests
+from .models import (Route, FeatureCollection, BoundingBox, Feature, FeatureSummary, Metadata, Segment, Step, TruckStop,
+                     RouteJob)
+from .directions import DirectionsError
+from .exceptions import upstream_exception
+from .geo import parse_lon_lat
+from .geojson import GEOMETRY_FORMATS
+from .planner import acreate_route, create_route
+from .simplify import zoom_tolerance
+from .vehicles import HAZMAT_CLASS_CHOICES, Vehicle
 
 
 class BoundingBoxSerializer(serializers.ModelSerializer):
@@ -43,94 +47,257 @@ class StepSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class WayPointSerializer(serializers.ModelSerializer):
+class FeatureCollectionSerializer(serializers.ModelSerializer):
     class Meta:
-        model = WayPoint
+        model = FeatureCollection
         fields = '__all__'
 
 
-class FeatureCollectionSerializer(serializers.ModelSerializer):
+class SelectableFieldsMixin:
+    # Serializes only `fields` of the serializer's fields when given.
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class LonLatField(serializers.Field):
+    def to_representation(self, value):
+        return [value.x, value.y]
+
+
+class RouteListSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    # Lists answer with this instead of RouteSerializer, summary distance
+    # (metres) and duration (seconds) are annotated by the view.
+    start_location = LonLatField()
+    end_location = LonLatField()
+    distance = serializers.FloatField()
+    duration = serializers.FloatField()
+
+    class Meta:
+        model = Route
+        fields = ['id', 'start_location', 'end_location', 'feature_collection', 'distance', 'duration',
+                  'created_at', 'prefix_route']
+
+
+class FeatureCollectionListSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    # [min_lng, min_lat, max_lng, max_lat]
+    bbox = serializers.ListField(source='bbox.coordinates.extent', child=serializers.FloatField())
+    # Milliseconds since the epoch ORS planned the route at.
+    timestamp = serializers.IntegerField(source='metadata.timestamp')
+    distance = serializers.FloatField()
+    duration = serializers.FloatField()
+
     class Meta:
         model = FeatureCollection
-        fields = '__all__'
+        fields = ['id', 'bbox', 'timestamp', 'distance', 'duration']
 
 
 class RouteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Route
         fields = '__all__'
-        read_only_fields = ['feature_collection']
+        read_only_fields = ['feature_collection', 'waypoints', 'prefix_route', 'prefix_end_index', 'created_at']
+        extra_kwargs = {
+            'vehicle_height': {'min_value': 0},
+            'vehicle_weight': {'min_value': 0},
+            'vehicle_width': {'min_value': 0},
+            'vehicle_length': {'min_value': 0},
+        }
+
+    def lane(self, validated_data):
+        # (start, end, vehicle) to plan.
+        return (parse_lon_lat(validated_data['start_location']), parse_lon_lat(validated_data['end_location']),
+                Vehicle.from_data(validated_data))
 
     def create(self, validated_data):
-        api_key = os.environ.get('OPENROUTE_API_KEY')
-        route_response = requests.get(f"https://api.openrouteservice.org/v2/directions/driving-car?api_key={api_key}&start={validated_data['start_location']}&end={validated_data['end_location']}")
+        try:
+            return create_route(*self.lane(validated_data))
+        except DirectionsError as e:
+            raise upstream_exception(e)
 
-        geojson = route_response.json()
+    async def acreate(self, validated_data):
+        try:
+            return await acreate_route(*self.lane(validated_data))
+        except DirectionsError as e:
+            raise upstream_exception(e)
 
-        print(validated_data['start_location'])
 
-        bbox = geojson['bbox']
-        metadata = geojson['metadata']
-        summary = geojson['features'][0]['properties']['summary']
+class RouteJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RouteJob
+        exclude = ['worker']
 
-        segments = geojson['features'][0]['properties']['segments']
 
-        routing_waypoints = geojson['features'][0]['properties']['way_points']
-        waypoints = geojson['features'][0]['geometry']['coordinates']
+class RouteJobQuerySerializer(serializers.Serializer):
+    # Seconds to hold the request open until the job finishes.
+    wait = serializers.FloatField(default=0, min_value=0, max_value=settings.ROUTE_JOB_MAX_WAIT)
 
-        bbox_poly = Polygon.from_bbox(bbox)
-        bounding_box = BoundingBox(coordinates=bbox_poly)
-        bounding_box.save()
 
-        metadata_obj = Metadata(**metadata)
-        metadata_obj.save()
+class FeatureCollectionQuerySerializer(serializers.Serializer):
+    # Simplify the geometry for a map at `zoom`, or to within `tolerance`
+    # degrees. Full resolution without either.
+    zoom = serializers.IntegerField(required=False, min_value=0, max_value=22)
+    tolerance = serializers.FloatField(required=False, min_value=0)
+    geometry_format = serializers.ChoiceField(choices=list(GEOMETRY_FORMATS), default='geojson')
 
-        feature_collection = FeatureCollection(
-            bbox=bounding_box, metadata=metadata_obj)
-        feature_collection.save()
+    def validate(self, attrs):
+        if 'zoom' in attrs and 'tolerance' in attrs:
+            raise serializers.ValidationError('Pass zoom or tolerance, not both.')
+        if 'zoom' in attrs:
+            attrs['tolerance'] = zoom_tolerance(attrs['zoom'])
+        return attrs
 
-        feature_summary = FeatureSummary(**summary)
-        feature_summary.save()
 
-        points = [WayPoint(coordinate=Point(lng, lat))
-                  for lng, lat in waypoints]
-        WayPoint.objects.bulk_create(points)
+class TruckStopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TruckStop
+        fields = '__all__'
 
-        # Create a LineString instance and associate it with the points
-        line_points = [
-            selected_waypoint.coordinate for selected_waypoint in points]
-        geometry = LineString(line_points)
 
-        feature_waypoint_markers = [points[x] for x in routing_waypoints]
+class LaneSerializer(serializers.Serializer):
+    start_location = serializers.CharField()
+    end_location = serializers.CharField()
 
-        feature = Feature(feature_collection=feature_collection,
-                          summary=feature_summary, geometry=geometry, bbox=bounding_box)
-        feature.save()
-        feature.way_points.set(feature_waypoint_markers)
-    
-        for segment in segments:
-            steps = segment['steps']
+    def validate(self, attrs):
+        try:
+            return {key: parse_lon_lat(value) for key, value in attrs.items()}
+        except ValueError:
+            raise serializers.ValidationError('Locations must be "lng,lat".')
 
-            segment_obj = Segment(distance=segment['distance'], duration=segment['duration'], feature=feature)
-            segment_obj.save()
 
-            for step in steps:
-                step_obj = Step(distance=step['distance'], duration=step['duration'], type=step['type'], instruction=step['instruction'], name=step['name'], segment=segment_obj)
-                step_obj.save()
-                step_obj.way_points.set([points[x] for x in step['way_points']])
+class VehicleSerializer(serializers.Serializer):
+    # The truck to plan for, same fields as Route.
+    vehicle_height = serializers.FloatField(required=False, min_value=0)
+    vehicle_weight = serializers.FloatField(required=False, min_value=0)
+    vehicle_width = serializers.FloatField(required=False, min_value=0)
+    vehicle_length = serializers.FloatField(required=False, min_value=0)
+    hazmat_class = serializers.ChoiceField(choices=HAZMAT_CLASS_CHOICES, required=False)
 
-        start_lon, start_lat = validated_data['start_location'].split(',')
-        end_lon, end_lat = validated_data['end_location'].split(',')
 
-        start_point = Point(float(start_lon), float(start_lat))
-        end_point = Point(float(end_lon), float(end_lat))
+class RouteBatchSerializer(VehicleSerializer):
+    lanes = serializers.ListField(child=LaneSerializer(), allow_empty=False,
+                                  max_length=settings.ROUTE_BATCH_MAX_LANES)
+    concurrency = serializers.IntegerField(required=False, min_value=1,
+                                           max_value=settings.ROUTE_BATCH_MAX_CONCURRENCY)
 
-        route = Route(start_location=start_point, end_location=end_point,
-        feature_collection = feature_collection)
-        return route
 
+class LocationField(serializers.CharField):
+    def to_internal_value(self, data):
+        try:
+            return parse_lon_lat(super().to_internal_value(data))
+        except ValueError:
+            raise serializers.ValidationError('Locations must be "lng,lat".')
 
-class TruckStopSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = TruckStop
-        fields = '__all__'
+
+class BBoxField(serializers.CharField):
+    def to_internal_value(self, data):
+        try:
+            min_lon, min_lat, max_lon, max_lat = map(float, super().to_internal_value(data).split(','))
+        except ValueError:
+            raise serializers.ValidationError('bbox must be "min_lng,min_lat,max_lng,max_lat".')
+        if min_lon >= max_lon or min_lat >= max_lat:
+            raise serializers.ValidationError('bbox min must be below max.')
+        return min_lon, min_lat, max_lon, max_lat
+
+
+class ListQuerySerializer(serializers.Serializer):
+    # Comma separated fields of the list serializer to answer with.
+    fields = serializers.CharField(required=False)
+    bbox = BBoxField(required=False, help_text='min_lng,min_lat,max_lng,max_lat')
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    list_serializer = None
+
+    def validate_fields(self, value):
+        fields = [field for field in value.split(',') if field]
+        unknown = set(fields) - set(self.list_serializer.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError(f'Unknown fields {", ".join(sorted(unknown))}, expected some of '
+                                              f'{", ".join(self.list_serializer.Meta.fields)}.')
+        return fields
+
+
+class RouteListQuerySerializer(ListQuerySerializer):
+    list_serializer = RouteListSerializer
+
+    # Routes from and to these points, within `radius` metres.
+    start = LocationField(required=False)
+    end = LocationField(required=False)
+    radius = serializers.FloatField(default=100, min_value=0, max_value=10000)
+
+
+class FeatureCollectionListQuerySerializer(ListQuerySerializer):
+    list_serializer = FeatureCollectionListSerializer
+
+
+class RouteOptimizeSerializer(VehicleSerializer):
+    depot = LocationField()
+    stops = serializers.ListField(child=LocationField(), allow_empty=False,
+                                  max_length=settings.ROUTE_OPTIMIZE_MAX_STOPS)
+    return_to_depot = serializers.BooleanField(default=True)
+    # Seconds the solver may spend ordering the stops.
+    time_budget = serializers.FloatField(default=settings.ROUTE_OPTIMIZE_TIME_BUDGET, min_value=0,
+                                         max_value=settings.ROUTE_OPTIMIZE_MAX_TIME_BUDGET)
+
+
+class RerouteSerializer(serializers.Serializer):
+    position = LocationField()
+    # Metres the position may be off the route and still be on it.
+    tolerance = serializers.FloatField(default=settings.REROUTE_TOLERANCE, min_value=0,
+                                       max_value=settings.REROUTE_MAX_TOLERANCE)
+
+
+class MatrixSerializer(VehicleSerializer):
+    METRICS = ('duration', 'distance')
+
+    locations = serializers.ListField(child=LocationField(), allow_empty=False,
+                                      max_length=settings.MATRIX_MAX_LOCATIONS)
+    # Indices into locations, all of them by default.
+    sources = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False, allow_empty=False)
+    destinations = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False,
+                                         allow_empty=False)
+    metrics = serializers.MultipleChoiceField(choices=METRICS, default=METRICS)
+
+    def validate(self, attrs):
+        count = len(attrs['locations'])
+        for name in ('sources', 'destinations'):
+            if any(index >= count for index in attrs.get(name, ())):
+                raise serializers.ValidationError({name: f'Indices must be below the {count} locations.'})
+        return attrs
+
+
+class CorridorQuerySerializer(serializers.Serializer):
+    # Miles either side of the route.
+    corridor = serializers.FloatField(default=5, min_value=0, max_value=50)
+
+
+class FuelPlanQuerySerializer(CorridorQuerySerializer):
+    # Tank range in miles.
+    range = serializers.FloatField(default=500, min_value=1)
+    mpg = serializers.FloatField(default=10, min_value=0.1)
+    start_range = serializers.FloatField(required=False, min_value=0)
+
+    def validate(self, attrs):
+        if attrs.get('start_range', 0) > attrs['range']:
+            raise serializers.ValidationError({'start_range': 'Must not be more than the tank range.'})
+        return attrs
+
+
+class TruckStopQuerySerializer(serializers.Serializer):
+    state = serializers.ChoiceField(choices=[code for _, code in TruckStop.STATE_CHOICES], required=False)
+    # Cents, like TruckStop.fuel_retail_price
+    max_price = serializers.IntegerField(required=False, min_value=0)
+    limit = serializers.IntegerField(default=20, min_value=1, max_value=settings.TRUCK_STOP_MAX_PAGE_SIZE)
+    offset = serializers.IntegerField(default=0, min_value=0)
+
+
+class NearestTruckStopQuerySerializer(TruckStopQuerySerializer):
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+
+
+class BBoxTruckStopQuerySerializer(TruckStopQuerySerializer):
+    bbox = BBoxField(help_text='min_lng,min_lat,max_lng,max_lat')
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .corridor import refresh_truck_stops
+from .metrics import count_query
+from .models import Feature, TruckStop
+from .tiles import TRUCK_STOPS, bump, bump_routes
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # One wrapper for the connection's lifetime, rather than one added and
+    # removed per request. Reconnecting reuses the connection object.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@receiver(post_save, sender=Feature)
+@receiver(post_delete, sender=Feature)
+def feature_changed(sender, instance, **kwargs):
+    # Only the tiles the route crosses draw it.
+    bump_routes([instance.geometry.extent])
+
+
+@receiver(post_save, sender=TruckStop)
+@receiver(post_delete, sender=TruckStop)
+def truck_stop_changed(sender, **kwargs):
+    bump(TRUCK_STOPS)
+
+
+@receiver(post_save, sender=TruckStop)
+def truck_stop_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Deleted stops take their FeatureTruckStops with them, saved ones may
+    # have moved. Bulk writes send no signal, OpisImporter refreshes itself.
+    if created or update_fields is None or 'coordinate' in update_fields:
+        transaction.on_commit(lambda: refresh_truck_stops([instance.pk]))
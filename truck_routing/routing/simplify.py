@@ -0,0 +1,121 @@
+import struct
+from bisect import bisect_right
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+
+# Web mercator tiles are 256 pixels across 360 degrees at zoom 0.
+TILE_SIZE = 256
+
+
+def zoom_tolerance(zoom, pixels=None):
+    """
+    Degrees a vertex may move for a route drawn at `zoom` to look the same,
+    GEOMETRY_LOD_PIXELS pixels at the equator.
+    """
+    pixels = settings.GEOMETRY_LOD_PIXELS if pixels is None else pixels
+    return 360.0 / (TILE_SIZE * 2 ** zoom) * pixels
+
+
+def wkb_coordinates(geometry):
+    # [x, y] vertices of a 2D LineString, read from its WKB in one call
+    # rather than a GEOS call per ordinate.
+    wkb = bytes(geometry.wkb)
+    order = '<' if wkb[0] == 1 else '>'
+    count, = struct.unpack_from(order + 'I', wkb, 5)
+    values = struct.unpack_from(f'{order}{2 * count}d', wkb, 9)
+    return list(zip(values[0::2], values[1::2]))
+
+
+def kept_vertices(coordinates, simplified):
+    # Indices into `coordinates` of the vertices `simplified` kept, GEOS only
+    # drops vertices and keeps the rest in order.
+    kept = []
+    position = 0
+    for x, y in simplified:
+        while coordinates[position][0] != x or coordinates[position][1] != y:
+            position += 1
+        kept.append(position)
+        position += 1
+    return kept
+
+
+def linestring(coordinates):
+    # GEOS parses WKT in one call, building a long LineString from Python
+    # point by point costs far more.
+    return GEOSGeometry('SRID=4326;LINESTRING(%s)' % ','.join(f'{vertex[0]!r} {vertex[1]!r}'
+                                                                for vertex in coordinates))
+
+
+def simplify(legs, tolerance):
+    """
+    Simplify each leg of a route by `tolerance` degrees. Legs are
+    (vertex indices, coordinates, geometry) as from split_legs(), returns
+    the simplified legs.
+    """
+    simplified_legs = []
+    for indices, coordinates, geometry in legs:
+        if geometry is None:
+            simplified_legs.append((indices, coordinates, geometry))
+            continue
+        simplified = geometry.simplify(tolerance, preserve_topology=True)
+        vertices = wkb_coordinates(simplified)
+        kept = kept_vertices(coordinates, vertices)
+        simplified_legs.append(([indices[position] for position in kept], vertices,
+                                simplified if len(kept) > 2 else None))
+    return simplified_legs
+
+
+def split_legs(coordinates, way_points):
+    # Legs between way points, geometry is None when there is nothing left
+    # to simplify.
+    legs = []
+    for first, last in zip(way_points, way_points[1:]):
+        leg = coordinates[first:last + 1]
+        legs.append((list(range(first, last + 1)), leg, linestring(leg) if len(leg) > 2 else None))
+    return legs
+
+
+def levels_of_detail(coordinates, way_points, zooms=None):
+    """
+    (zoom, tolerance, kept vertex indices) for each of `zooms`
+    (GEOMETRY_LOD_ZOOMS by default), coarsest first. Levels that would keep
+    more than GEOMETRY_LOD_MAX_RATIO of the next finer level's vertices are
+    left out, the finer one serves them just as well.
+
+    Each leg between `way_points` is simplified on its own with
+    Douglas-Peucker that won't let the line cross itself, so the start,
+    end and every stop stay exact vertices at every level. Each level is
+    simplified from the next finer one, which is much faster on long routes
+    and, with the default zooms three apart, stays within about 15% of the
+    tolerance.
+    """
+    zooms = settings.GEOMETRY_LOD_ZOOMS if zooms is None else zooms
+    legs = split_legs(coordinates, way_points or [0, len(coordinates) - 1])
+    levels = []
+    finer = len(coordinates)
+    for zoom in sorted(zooms, reverse=True):
+        tolerance = zoom_tolerance(zoom)
+        legs = simplify(legs, tolerance)
+        kept = [0] + [index for indices, _, _ in legs for index in indices[1:]]
+        if len(kept) <= finer * settings.GEOMETRY_LOD_MAX_RATIO:
+            levels.append((zoom, tolerance, kept))
+            finer = len(kept)
+    return levels[::-1]
+
+
+def rendered_zoom(tolerance, zooms=None):
+    """
+    Zoom of the stored level a rendering within `tolerance` degrees draws
+    on, the coarsest of GEOMETRY_LOD_ZOOMS within it, or None for the full
+    geometry. Tolerances with the same zoom render the same document.
+    """
+    zooms = settings.GEOMETRY_LOD_ZOOMS if zooms is None else zooms
+    within = [zoom for zoom in zooms if zoom_tolerance(zoom) <= tolerance]
+    return min(within) if within else None
+
+
+def remap(index, kept):
+    # Position in the simplified route of the vertex at or before `index`.
+    return bisect_right(kept, index) - 1
+
@@ -1,3 +1,398 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import io
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarks import plans
+from .benchmarks.fixtures import synthetic_directions
+from .cache import RouteCache
+from .corridor import refresh_truck_stops
+from .geocode import GeocodeCache
+from .ingest import persist_directions
+from .jobs import IdempotencyConflict, RouteJobWorker, claim_job, enqueue_route, finish_job, requeue_stale_jobs
+from .metrics import RequestMetrics, RequestMetricsMiddleware, _current
+from .models import FeatureTruckStop, RouteCacheEntry, RouteJob, TruckStop
+from .opis import OpisImporter
+from .payloads import feature_collection_payloads
+from .simplify import zoom_tolerance
+from .tiles import route_cell, route_cells
+
+
+class FeatureCollectionRetrieveTests(TestCase):
+    def setUp(self):
+        feature_collection_payloads.clear()
+
+    def retrieve(self, feature_collection, **params):
+        return self.client.get(reverse('feature-collections-detail', args=[feature_collection.pk]), params)
+
+    def test_queries_do_not_grow_with_the_route(self):
+        # The collection, then its features, segments and steps.
+        for steps in (5, 50):
+            feature_collection = persist_directions(synthetic_directions(steps=steps, points_per_step=2))
+            with self.assertNumQueries(4):
+                response = self.retrieve(feature_collection)
+
+            self.assertEqual(response.status_code, 200)
+            document = json.loads(response.content)
+            segments = document['features'][0]['properties']['segments']
+            self.assertEqual(sum(len(segment['steps']) for segment in segments), steps + 1)
+
+    def test_simplified_geometry_costs_one_more_query(self):
+        feature_collection = persist_directions(synthetic_directions(steps=50, points_per_step=2))
+        with self.assertNumQueries(5):
+            response = self.retrieve(feature_collection, zoom=8)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_payload_only_fetches_the_collection(self):
+        feature_collection = persist_directions(synthetic_directions(steps=50, points_per_step=2))
+        self.retrieve(feature_collection)
+        with self.assertNumQueries(1):
+            response = self.retrieve(feature_collection)
+        self.assertEqual(response.status_code, 200)
+
+    def test_tolerances_rendering_one_level_share_a_payload(self):
+        feature_collection = persist_directions(synthetic_directions(steps=50, points_per_step=2))
+        first = self.retrieve(feature_collection, zoom=8)
+        with self.assertNumQueries(1):
+            response = self.retrieve(feature_collection, tolerance=zoom_tolerance(8) * 1.5)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_scan_their_indexes(self):
+        # Truck stop lookups, steps in order and stops along a route among
+        # them, with sequential scans off as the tables are empty.
+        for result in plans.run():
+            with self.subTest(result['query']):
+                self.assertTrue(result['expected'], f'No index on {result["table"]}({", ".join(result["columns"])})')
+                self.assertTrue(result['ok'], f'Expected one of {result["expected"]}, used {result["used"]}')
+
+
+class RouteCacheTests(TestCase):
+    START, END, PROFILE = (-90.05, 35.15), (-89.95, 35.25), 'driving-hgv'
+
+    def setUp(self):
+        self.now = 0.0
+        self.feature_collection = persist_directions(synthetic_directions(steps=2, points_per_step=2))
+
+    def cache(self):
+        return RouteCache(grid=0.001, ttl=1000, max_entries=16, db_max_entries=100, touch_fraction=0.1,
+                          evict_probability=0, clock=lambda: self.now)
+
+    def get(self, cache):
+        return cache.get(self.START, self.END, self.PROFILE)
+
+    def entry(self):
+        return RouteCacheEntry.objects.get()
+
+    def test_local_hit_fetches_only_the_collection(self):
+        cache = self.cache()
+        cache.set(self.START, self.END, self.PROFILE, self.feature_collection)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(cache), self.feature_collection)
+        self.assertEqual(cache.counters['local_hits'], 1)
+
+    def test_db_hit_is_promoted_to_the_local_tier(self):
+        self.cache().set(self.START, self.END, self.PROFILE, self.feature_collection)
+        cache = self.cache()
+
+        self.assertEqual(self.get(cache), self.feature_collection)
+        self.assertEqual(self.get(cache), self.feature_collection)
+        self.assertEqual((cache.counters['db_hits'], cache.counters['local_hits']), (1, 1))
+        self.assertEqual(self.entry().hits, 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = self.cache()
+        cache.set(self.START, self.END, self.PROFILE, self.feature_collection)
+        self.now += 1001
+        RouteCacheEntry.objects.update(created_at=timezone.now() - timedelta(seconds=1001))
+
+        self.assertIsNone(self.get(cache))
+        self.assertIsNone(self.get(self.cache()))
+        self.assertEqual(cache.counters['misses'], 1)
+
+    def test_local_hits_touch_the_entry_once_a_fraction_of_the_ttl_passed(self):
+        cache = self.cache()
+        cache.set(self.START, self.END, self.PROFILE, self.feature_collection)
+        stale = timezone.now() - timedelta(hours=1)
+        RouteCacheEntry.objects.update(last_hit_at=stale)
+
+        self.now += 50
+        self.get(cache)
+        self.assertEqual(self.entry().last_hit_at, stale)
+
+        self.now += 50
+        with self.assertNumQueries(2):
+            self.get(cache)
+        self.assertGreater(self.entry().last_hit_at, stale)
+        with self.assertNumQueries(1):
+            self.get(cache)
+
+
+class OpisImporterTests(TestCase):
+    HEADER = 'OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n'
+
+    def setUp(self):
+        self.lookups = []
+
+    def geocoder(self, address, city, state):
+        self.lookups.append(address)
+        return Point(-90.0 + len(self.lookups) / 100, 35.0, srid=4326)
+
+    def run_import(self, *rows):
+        importer = OpisImporter(batch_size=2, geocode_cache=GeocodeCache(geocoder=self.geocoder))
+        stream = io.StringIO(self.HEADER + ''.join(','.join(map(str, row)) + '\n' for row in rows))
+        return importer, importer.run(stream)
+
+    def test_new_stops_are_upserted_at_their_cheapest_price(self):
+        importer, stats = self.run_import(
+            (7, 'PILOT #7', 'I-40 EXIT 12', 'MEMPHIS', 'TN', 101, '3.459'),
+            (7, 'PILOT #7', 'I-40 EXIT 12', 'MEMPHIS', 'TN', 102, '3.399'),
+            (8, 'LOVES #8', 'I-55 EXIT 3', 'MEMPHIS', 'TN', 101, '3.519'),
+            (9, 'PETRO #9', 'HWY 1', 'TORONTO', 'ON', 101, '3.000'),
+        )
+
+        self.assertEqual(stats['upserted'], 2)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(dict(TruckStop.objects.values_list('opis_id', 'fuel_retail_price')), {7: 340, 8: 352})
+        self.assertEqual(sorted(importer.moved_ids), sorted(TruckStop.objects.values_list('id', flat=True)))
+
+    def test_price_updates_keep_the_coordinate(self):
+        self.run_import((7, 'PILOT #7', 'I-40 EXIT 12', 'MEMPHIS', 'TN', 101, '3.459'))
+        coordinate = TruckStop.objects.get(opis_id=7).coordinate
+
+        importer, stats = self.run_import((7, 'PILOT #7', 'I-40 EXIT 12', 'MEMPHIS', 'TN', 101, '3.199'))
+
+        stop = TruckStop.objects.get(opis_id=7)
+        self.assertEqual((stats['upserted'], stop.fuel_retail_price), (1, 320))
+        self.assertEqual(stop.coordinate, coordinate)
+        self.assertEqual(self.lookups, ['I-40 EXIT 12'])
+        self.assertEqual(importer.moved_ids, [])
+
+    def test_moved_stops_are_geocoded_again(self):
+        self.run_import((7, 'PILOT #7', 'I-40 EXIT 12', 'MEMPHIS', 'TN', 101, '3.459'))
+        coordinate = TruckStop.objects.get(opis_id=7).coordinate
+
+        importer, _ = self.run_import((7, 'PILOT #7', 'I-40 EXIT 14', 'MEMPHIS', 'TN', 101, '3.459'))
+
+        stop = TruckStop.objects.get(opis_id=7)
+        self.assertEqual(self.lookups, ['I-40 EXIT 12', 'I-40 EXIT 14'])
+        self.assertNotEqual(stop.coordinate, coordinate)
+        self.assertEqual(importer.moved_ids, [stop.pk])
+
+
+LANE = {'start_location': '-90.05,35.15', 'end_location': '-89.95,35.25'}
+
+
+class RouteJobQueueTests(TestCase):
+    def test_idempotent_enqueue_returns_the_first_job(self):
+        job, created = enqueue_route(LANE, 'key-1')
+        again, created_again = enqueue_route(LANE, 'key-1')
+
+        self.assertEqual((again.pk, created, created_again), (job.pk, True, False))
+        with self.assertRaises(IdempotencyConflict):
+            enqueue_route(dict(LANE, end_location='-89.9,35.3'), 'key-1')
+
+    def test_claim_takes_the_oldest_queued_job(self):
+        first, _ = enqueue_route(LANE)
+        enqueue_route(LANE)
+
+        job = claim_job('worker:0')
+        self.assertEqual((job.pk, job.status, job.worker, job.attempts), (first.pk, RouteJob.RUNNING, 'worker:0', 1))
+        self.assertNotEqual(claim_job('worker:1').pk, first.pk)
+        self.assertIsNone(claim_job('worker:2'))
+
+    def test_stale_jobs_are_requeued_until_the_attempt_limit(self):
+        retried, _ = enqueue_route(LANE)
+        exhausted, _ = enqueue_route(LANE)
+        claim_job('worker:0')
+        claim_job('worker:0')
+        RouteJob.objects.update(started_at=timezone.now() - timedelta(seconds=600))
+        RouteJob.objects.filter(pk=exhausted.pk).update(attempts=3)
+
+        self.assertEqual(requeue_stale_jobs(timeout=300, max_attempts=3), (1, 1))
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual((retried.status, retried.worker), (RouteJob.QUEUED, ''))
+        self.assertEqual(exhausted.status, RouteJob.FAILED)
+
+    def test_a_requeued_job_is_not_finished_by_its_old_worker(self):
+        enqueue_route(LANE)
+        job = claim_job('worker:0')
+        RouteJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=600))
+        requeue_stale_jobs(timeout=300, max_attempts=3)
+
+        self.assertEqual(finish_job(job, RouteJob.SUCCEEDED), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, RouteJob.QUEUED)
+
+
+class RouteJobWorkerTests(TransactionTestCase):
+    def worker(self):
+        return RouteJobWorker(concurrency=1, poll_interval=0.01, job_timeout=60, max_attempts=3, name='test')
+
+    def test_locked_jobs_are_skipped(self):
+        locked, _ = enqueue_route(LANE)
+        free, _ = enqueue_route(LANE)
+        holding, release = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with transaction.atomic():
+                    RouteJob.objects.select_for_update().get(pk=locked.pk)
+                    holding.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        try:
+            self.assertTrue(holding.wait(10))
+            self.assertEqual(claim_job('worker:0').pk, free.pk)
+        finally:
+            release.set()
+            thread.join()
+
+    def test_threads_carry_on_after_errors(self):
+        worker = self.worker()
+        calls = []
+
+        def claim(thread_name):
+            calls.append(thread_name)
+            if len(calls) == 1:
+                raise OperationalError('server closed the connection unexpectedly')
+            worker.stop()
+            return None
+
+        with mock.patch('routing.jobs.claim_job', side_effect=claim):
+            thread = threading.Thread(target=worker._work, args=('test:0',))
+            thread.start()
+            thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(calls), 2)
+
+    def test_dead_threads_are_restarted(self):
+        worker = self.worker()
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        worker.threads = [dead]
+
+        self.assertEqual(worker.restart_dead_threads(), 1)
+        self.assertTrue(worker.threads[0].is_alive())
+        worker.stop()
+        worker.threads[0].join(10)
+
+
+@override_settings(TILE_GENERATION_ZOOM=6)
+class RouteCellTests(SimpleTestCase):
+    # A few miles around downtown Nashville.
+    extent = (-86.82, 36.13, -86.74, 36.19)
+
+    def test_cells_of_the_tiles_crossed(self):
+        cells = route_cells(self.extent)
+
+        # One cell per zoom, the tile with Nashville, its ancestors and every
+        # deeper tile under them.
+        self.assertEqual(len(cells), 7)
+        self.assertIn(route_cell(0, 0, 0), cells)
+        self.assertIn(route_cell(6, 16, 25), cells)
+        self.assertIn(route_cell(12, 1060, 1606), cells)
+
+    def test_other_tiles_keep_their_generation(self):
+        cells = route_cells(self.extent)
+
+        self.assertNotIn(route_cell(6, 10, 24), cells)
+        self.assertNotIn(route_cell(12, 1100, 1606), cells)
+
+    def test_tiles_drawing_past_their_edge(self):
+        # Just west of the tile boundary at 90W, within the buffer of the
+        # tiles east of it.
+        cells = route_cells((-90.001, 35.12, -90.0005, 35.18))
+
+        self.assertIn(route_cell(6, 15, 25), cells)
+        self.assertIn(route_cell(6, 16, 25), cells)
+
+
+class RequestMetricsTests(TransactionTestCase):
+    def count(self, query):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            query()
+        finally:
+            _current.reset(token)
+        return metrics.queries
+
+    def test_queries_count_in_the_current_request_only(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        list(TruckStop.objects.all())
+        _current.reset(token)
+        list(TruckStop.objects.all())
+
+        self.assertEqual(metrics.queries, 1)
+
+    def test_queries_on_other_threads_count(self):
+        def query():
+            thread = threading.Thread(target=contextvars.copy_context().run,
+                                      args=(lambda: (list(TruckStop.objects.all()), connection.close()),))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(self.count(query), 1)
+
+    def test_one_wrapper_per_connection(self):
+        connection.close()
+        list(TruckStop.objects.all())
+        connection.close()
+        list(TruckStop.objects.all())
+
+        self.assertEqual(len(connection.execute_wrappers), 1)
+
+    def test_async_middleware_is_awaited(self):
+        async def get_response(request):
+            pass
+
+        self.assertTrue(asyncio.iscoroutinefunction(RequestMetricsMiddleware(get_response)))
+        self.assertFalse(asyncio.iscoroutinefunction(RequestMetricsMiddleware(lambda request: None)))
+
+
+class CorridorTests(TestCase):
+    def persist(self):
+        directions = synthetic_directions(steps=20, points_per_step=2)
+        lon, lat = directions['features'][0]['geometry']['coordinates'][10]
+        stop = TruckStop.objects.create(opis_id=1, name='Stop', address='1 Interstate Rd', city='Reno', state=28,
+                                        fuel_retail_price=350, coordinate=Point(lon, lat + 0.001, srid=4326))
+        return persist_directions(directions).feature_set.get(), stop
+
+    def test_corridor_is_built_once_the_route_is_committed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            feature, stop = self.persist()
+            self.assertIsNone(feature.corridor_miles)
+            self.assertFalse(FeatureTruckStop.objects.exists())
+
+        feature.refresh_from_db()
+        self.assertEqual(feature.corridor_miles, settings.TRUCK_STOP_CORRIDOR_MILES)
+        self.assertEqual(list(feature.corridor_stops.values_list('truck_stop', flat=True)), [stop.pk])
+
+    def test_refresh_builds_missing_corridors(self):
+        # As if the build after commit had failed.
+        feature, stop = self.persist()
+
+        self.assertEqual(refresh_truck_stops([stop.pk]), 1)
+        feature.refresh_from_db()
+        self.assertEqual(feature.corridor_miles, settings.TRUCK_STOP_CORRIDOR_MILES)
+        self.assertEqual(list(feature.corridor_stops.values_list('truck_stop', flat=True)), [stop.pk])
@@ -0,0 +1,159 @@
+import math
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import TileGeneration
+from .payloads import PayloadCache
+from .simplify import zoom_tolerance
+
+ROUTES = 'routes'
+TRUCK_STOPS = 'truck_stops'
+
+# Web mercator metres across the world at zoom 0.
+WORLD_SIZE = 40075016.68557849
+# Web mercator stops short of the poles.
+MAX_LATITUDE = 85.0511287798
+
+# Features are selected on the tile grown by the MVT buffer, in 4326 so the
+# GiST indexes on the stored geometries are used. Routes are drawn from the
+# coarsest simplified geometry within the zoom's tolerance and capped per
+# tile, newest first, so a tile costs the same however many are stored.
+TILE_SQL = '''
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+           ST_Transform(ST_Expand(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), %(margin)s), 4326) AS area
+), routes AS (
+    SELECT feature.id, feature.feature_collection_id AS feature_collection,
+           summary.distance, summary.duration,
+           ST_AsMVTGeom(ST_Transform(COALESCE(simplified.geometry, feature.geometry), 3857),
+                        bounds.tile, %(extent)s, %(buffer)s) AS geom
+    FROM routing_feature feature
+    CROSS JOIN bounds
+    JOIN routing_featuresummary summary ON summary.id = feature.summary_id
+    LEFT JOIN LATERAL (
+        SELECT geometry FROM routing_simplifiedgeometry
+        WHERE feature_id = feature.id AND tolerance <= %(tolerance)s
+        ORDER BY tolerance DESC
+        LIMIT 1
+    ) simplified ON true
+    WHERE feature.geometry && bounds.area
+    ORDER BY feature.id DESC
+    LIMIT %(max_routes)s
+), stops AS (
+    SELECT stop.id, stop.opis_id, stop.name, stop.city, stop.state, stop.fuel_retail_price,
+           ST_AsMVTGeom(ST_Transform(stop.coordinate, 3857), bounds.tile, %(extent)s, %(buffer)s) AS geom
+    FROM routing_truckstop stop
+    CROSS JOIN bounds
+    WHERE stop.coordinate && bounds.area
+)
+SELECT COALESCE((SELECT ST_AsMVT(routes, 'routes', %(extent)s, 'geom') FROM routes WHERE geom IS NOT NULL),
+                ''::bytea)
+    || COALESCE((SELECT ST_AsMVT(stops, 'truck_stops', %(extent)s, 'geom') FROM stops WHERE geom IS NOT NULL),
+                ''::bytea)
+'''
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= settings.TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def render_tile(z, x, y):
+    """
+    Mapbox Vector Tile with a `routes` layer (stored features) and a
+    `truck_stops` layer, rendered by PostGIS.
+    """
+    extent, buffer = settings.TILE_EXTENT, settings.TILE_BUFFER
+    params = {
+        'z': z, 'x': x, 'y': y,
+        'extent': extent,
+        'buffer': buffer,
+        'margin': WORLD_SIZE / 2 ** z * buffer / extent,
+        'tolerance': zoom_tolerance(z),
+        'max_routes': settings.TILE_MAX_ROUTES,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(TILE_SQL, params)
+        return bytes(cursor.fetchone()[0])
+
+
+def route_cell(z, x, y):
+    # The generation a tile's routes are cached under, its own up to
+    # TILE_GENERATION_ZOOM and its ancestor's at that zoom below.
+    zoom = min(z, settings.TILE_GENERATION_ZOOM)
+    shift = z - zoom
+    return f'{ROUTES}/{zoom}/{x >> shift}/{y >> shift}'
+
+
+def mercator(lon, lat):
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    return (lon / 360 * WORLD_SIZE,
+            math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) / (2 * math.pi) * WORLD_SIZE)
+
+
+def route_cells(extent):
+    """
+    The route generations of every tile that draws something within
+    `extent` (lon/lat xmin, ymin, xmax, ymax), tiles drawing a little past
+    their edges included.
+    """
+    xmin, ymin = mercator(*extent[:2])
+    xmax, ymax = mercator(*extent[2:])
+    cells = set()
+    for zoom in range(settings.TILE_GENERATION_ZOOM + 1):
+        size = WORLD_SIZE / 2 ** zoom
+        # The MVT buffer at this zoom is the widest of any tile sharing its
+        # generations.
+        margin = size * settings.TILE_BUFFER / settings.TILE_EXTENT
+
+        def index(metres):
+            return min(max(int((metres + WORLD_SIZE / 2) // size), 0), 2 ** zoom - 1)
+
+        # Tile rows count down from the north.
+        cells.update(f'{ROUTES}/{zoom}/{x}/{y}'
+                     for x in range(index(xmin - margin), index(xmax + margin) + 1)
+                     for y in range(index(-ymax - margin), index(-ymin + margin) + 1))
+    return cells
+
+
+def generations(z, x, y):
+    layers = (route_cell(z, x, y), TRUCK_STOPS)
+    current = dict(TileGeneration.objects.filter(layer__in=layers).values_list('layer', 'generation'))
+    return tuple(current.get(layer, 0) for layer in layers)
+
+
+# Sorted so concurrent bumps lock the rows in the same order.
+BUMP_SQL = '''
+INSERT INTO routing_tilegeneration (layer, generation)
+SELECT layer, 1 FROM unnest(%s::varchar[]) layer ORDER BY layer
+ON CONFLICT (layer) DO UPDATE SET generation = routing_tilegeneration.generation + 1
+'''
+
+
+def bump(*layers):
+    """
+    Move `layers` to a new generation once the current transaction commits,
+    so every worker stops serving tiles drawn before the change.
+    """
+    layers = sorted(set(layers))
+    if not layers:
+        return
+
+    def increment():
+        with connection.cursor() as cursor:
+            cursor.execute(BUMP_SQL, [layers])
+
+    # After commit the row locks are only held for the update itself, not
+    # for the whole ingest.
+    transaction.on_commit(increment)
+
+
+def bump_routes(extents):
+    # New generations for the tiles drawing routes within any of `extents`
+    # only, the rest stay cached.
+    bump(*{cell for extent in extents for cell in route_cells(extent)})
+
+
+tile_payloads = PayloadCache(max_bytes=settings.TILE_CACHE_MAX_BYTES,
+                             max_entry_bytes=settings.TILE_CACHE_MAX_BYTES // 16,
+                             encodings=['gzip'])
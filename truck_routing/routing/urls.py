@@ -8,7 +8,15 @@ router.register(r'routes', views.RouteViewSet,
                 basename='routes')
 router.register(r'feature-collections', views.FeatureCollectionViewSet,
                 basename='feature-collections')
+router.register(r'truck-stops', views.TruckStopViewSet,
+                basename='truck-stops')
+router.register(r'route-jobs', views.RouteJobViewSet,
+                basename='route-jobs')
+router.register(r'matrix', views.MatrixViewSet,
+                basename='matrix')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', views.tile, name='tile'),
+    path('metrics', views.metrics, name='metrics'),
 ]
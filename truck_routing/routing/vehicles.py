@@ -0,0 +1,99 @@
+import threading
+
+from django.conf import settings
+
+from .engine.restrictions import RestrictionIndex
+
+CAR_PROFILE = 'driving-car'
+TRUCK_PROFILE = 'driving-hgv'
+
+# US DOT hazardous materials classes.
+HAZMAT_CLASS_CHOICES = (
+    (1, 'Explosives'), (2, 'Gases'), (3, 'Flammable liquids'), (4, 'Flammable solids'),
+    (5, 'Oxidizers and organic peroxides'), (6, 'Toxic and infectious substances'),
+    (7, 'Radioactive material'), (8, 'Corrosives'), (9, 'Miscellaneous'),
+)
+
+# Route fields describing the vehicle, metres and tonnes.
+VEHICLE_FIELDS = ('vehicle_height', 'vehicle_weight', 'vehicle_width', 'vehicle_length', 'hazmat_class')
+
+
+class Vehicle:
+    """
+    Dimensions (metres), gross weight (tonnes) and hazmat class of the
+    vehicle a route is planned for. A vehicle with none of them set is
+    routed as a car, like every route before trucks were supported.
+    """
+
+    def __init__(self, height=None, weight=None, width=None, length=None, hazmat_class=None):
+        self.height = height
+        self.weight = weight
+        self.width = width
+        self.length = length
+        self.hazmat_class = hazmat_class
+
+    @classmethod
+    def from_data(cls, data):
+        # From validated Route data or anything else keyed by VEHICLE_FIELDS.
+        return cls(height=data.get('vehicle_height'), weight=data.get('vehicle_weight'),
+                   width=data.get('vehicle_width'), length=data.get('vehicle_length'),
+                   hazmat_class=data.get('hazmat_class'))
+
+    @classmethod
+    def from_route(cls, route):
+        return cls.from_data({field: getattr(route, field) for field in VEHICLE_FIELDS})
+
+    def route_fields(self):
+        return dict(zip(VEHICLE_FIELDS, (self.height, self.weight, self.width, self.length, self.hazmat_class)))
+
+    @property
+    def hazmat(self):
+        return self.hazmat_class is not None
+
+    @property
+    def is_truck(self):
+        return any(value is not None for value in (self.height, self.weight, self.width, self.length,
+                                                   self.hazmat_class))
+
+    @property
+    def profile(self):
+        return TRUCK_PROFILE if self.is_truck else CAR_PROFILE
+
+    @property
+    def cache_profile(self):
+        # Route cache namespace, routes are only shared between identical vehicles.
+        if not self.is_truck:
+            return self.profile
+        return (f'{self.profile};h={self.height};w={self.weight};wd={self.width};'
+                f'l={self.length};hz={self.hazmat_class}')
+
+    def ors_options(self):
+        """
+        `options` for an ORS driving-hgv directions request.
+        """
+        restrictions = {name: value for name, value in (
+            ('height', self.height), ('weight', self.weight), ('width', self.width), ('length', self.length),
+        ) if value is not None}
+        if self.hazmat:
+            restrictions['hazmat'] = True
+        options = {'vehicle_type': 'hgv'}
+        if restrictions:
+            options['profile_params'] = {'restrictions': restrictions}
+        return options
+
+
+_restriction_index = None
+_restriction_index_lock = threading.Lock()
+
+
+def get_restriction_index():
+    """
+    The RestrictionIndex at ROAD_RESTRICTIONS_PATH, or None if there is none.
+    """
+    global _restriction_index
+    if not settings.ROAD_RESTRICTIONS_PATH:
+        return None
+    with _restriction_index_lock:
+        if _restriction_index is None:
+            _restriction_index = RestrictionIndex.load(settings.ROAD_RESTRICTIONS_PATH)
+        return _restriction_index
@@ -1,38 +1,486 @@
-from django.shortcuts import render
+import asyncio
+
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets
-from django.core.serializers import serialize
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.contrib.gis.db.models.functions import GeometryDistance
+from django.contrib.gis.geos import Point, Polygon
+from django.contrib.gis.measure import D
+from django.db.models import OuterRef, Q, Subquery
 
-from .models import Route, FeatureCollection
-from .serializers import RouteSerializer, FeatureCollectionSerializer
+from .models import Route, FeatureCollection, Feature, TruckStop, RouteJob
+from .serializers import (RouteSerializer, FeatureCollectionSerializer, FuelPlanQuerySerializer, RouteBatchSerializer,
+                          TruckStopSerializer, NearestTruckStopQuerySerializer, BBoxTruckStopQuerySerializer,
+                          RouteJobSerializer, RouteJobQuerySerializer, RouteOptimizeSerializer, MatrixSerializer,
+                          RerouteSerializer, FeatureCollectionQuerySerializer, RouteListSerializer,
+                          RouteListQuerySerializer, FeatureCollectionListSerializer,
+                          FeatureCollectionListQuerySerializer, CorridorQuerySerializer)
+from .asyncviews import AsyncViewSetMixin, blocking
+from .exceptions import IdempotencyKeyConflict, upstream_exception
+from .jobs import IdempotencyConflict, enqueue_route, queue_stats
+from .fuel import FuelPlanError, corridor_degrees, corridor_stops, plan_route_fuel
+from .planner import optimize_route, plan_batch
+from .matrix import matrix_cache
+from .metrics import phase, registry, timed_chunks
+from .cache import route_cache
+from . import directions
+from .reroute import reroute_from
+from .tiles import generations, render_tile, tile_payloads, valid_tile
+from .directions import DirectionsError
+from .vehicles import Vehicle
+from .geojson import stream_feature_collection
+from .geo import haversine_miles
+from .opis import STATE_CODES, STATE_NAMES
+from .payloads import accepted_encodings, coded_etag, feature_collection_payloads, feature_collection_validators, \
+    set_validators
+from .simplify import rendered_zoom
 
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 import json
+import time
+
+
+class IdCursorPagination(CursorPagination):
+    # Newest first, keyed on the primary key so any page is one index range
+    # scan however deep into the table it is.
+    ordering = '-id'
+    page_size = settings.LIST_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = settings.LIST_MAX_PAGE_SIZE
+
+
+def list_area(params):
+    if 'bbox' not in params:
+        return None
+    area = Polygon.from_bbox(params['bbox'])
+    area.srid = 4326
+    return area
 
-class RouteViewSet(viewsets.ModelViewSet):
+
+def with_summary(queryset, fields, feature_collection='feature_collection'):
+    # Distance and duration of the first feature of each row's collection,
+    # only looked up when asked for.
+    features = Feature.objects.filter(feature_collection=OuterRef(feature_collection)).order_by('id')
+    for name in ('distance', 'duration'):
+        if not fields or name in fields:
+            queryset = queryset.annotate(**{name: Subquery(features.values(f'summary__{name}')[:1])})
+    return queryset
+
+
+class RouteViewSet(AsyncViewSetMixin, viewsets.ModelViewSet):
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
-    
+    pagination_class = IdCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        """
+        Routes newest first a page at a time, as RouteListSerializer.
+        `bbox` keeps routes starting or ending in it, `start` and `end` those
+        from and to a point within `radius` metres, `created_after` and
+        `created_before` bound Route.created_at.
+        """
+        params = RouteListQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        fields = params.get('fields')
+
+        routes = Route.objects.only('id', 'start_location', 'end_location', 'feature_collection',
+                                    'created_at', 'prefix_route')
+        area = list_area(params)
+        if area is not None:
+            routes = routes.filter(Q(start_location__contained=area) | Q(end_location__contained=area))
+        for param, field in (('start', 'start_location'), ('end', 'end_location')):
+            if param in params:
+                # ST_DWithin in degrees uses the GiST index, the distance in
+                # metres makes it exact.
+                point = Point(*params[param], srid=4326)
+                routes = routes.filter(**{f'{field}__dwithin': (point, corridor_degrees(point, params['radius'])),
+                                          f'{field}__distance_lte': (point, D(m=params['radius']))})
+        if 'created_after' in params:
+            routes = routes.filter(created_at__gte=params['created_after'])
+        if 'created_before' in params:
+            routes = routes.filter(created_at__lt=params['created_before'])
+
+        page = self.paginate_queryset(with_summary(routes, fields))
+        return self.get_paginated_response(RouteListSerializer(page, many=True, fields=fields).data)
+
+    async def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        # Queue the route instead of planning it in the request when the
+        # server is configured to, or the client asks with
+        # "Prefer: respond-async".
+        if settings.ROUTE_JOBS_ASYNC or 'respond-async' in request.headers.get('Prefer', ''):
+            return await sync_to_async(self.enqueue)(request, serializer)
+
+        serializer.instance = await serializer.acreate(serializer.validated_data)
+        data = await sync_to_async(lambda: serializer.data)()
+        return Response(data, status=201, headers=self.get_success_headers(data))
+
+    def enqueue(self, request, serializer):
+        try:
+            job, _ = enqueue_route(serializer.validated_data, request.headers.get('Idempotency-Key'))
+        except IdempotencyConflict:
+            raise IdempotencyKeyConflict()
+
+        location = reverse('route-jobs-detail', args=[job.pk], request=request)
+        return Response(RouteJobSerializer(job).data, status=202, headers={'Location': location})
+
+    @action(detail=True, methods=['get'], url_path='fuel-plan')
+    @blocking
+    def fuel_plan(self, request, pk=None):
+        route = self.get_object()
+
+        params = FuelPlanQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        feature = (route.feature_collection.feature_set
+                   .select_related('summary').order_by('id').first())
+
+        try:
+            plan = plan_route_fuel(feature,
+                                   tank_range=params.validated_data['range'],
+                                   mpg=params.validated_data['mpg'],
+                                   corridor=params.validated_data['corridor'],
+                                   start_range=params.validated_data.get('start_range'))
+        except FuelPlanError as e:
+            raise ValidationError({'detail': str(e)})
+
+        return Response(dict(plan, route=route.pk))
+
+    @action(detail=True, methods=['get'], url_path='truck-stops')
+    @blocking
+    def truck_stops(self, request, pk=None):
+        # Stops within ?corridor= miles of the route in order along it, as
+        # stored at ingest when the corridor is within what was stored.
+        route = self.get_object()
+
+        params = CorridorQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        corridor = params.validated_data['corridor']
+
+        feature = (route.feature_collection.feature_set
+                   .select_related('summary').order_by('id').first())
+        stops = [dict(stop, distance_along=round(stop['distance_along'], 2), detour=round(stop['detour'], 2))
+                 for stop in corridor_stops(feature, corridor)]
+        return Response({'route': route.pk, 'corridor': corridor, 'stops': stops})
+
+    @action(detail=True, methods=['post'])
+    @blocking
+    def reroute(self, request, pk=None):
+        route = self.get_object()
+
+        params = RerouteSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        # On the route nothing is fetched or written, off it the rest of
+        # the trip is planned as a new route.
+        try:
+            new_route, progress = reroute_from(route, params.validated_data['position'],
+                                               params.validated_data['tolerance'])
+        except DirectionsError as e:
+            raise upstream_exception(e)
+
+        if new_route is None:
+            return Response(dict(progress, route=route.pk))
+        return Response(dict(progress, route=new_route.pk, rerouted=RouteSerializer(new_route).data), status=201)
+
+    @action(detail=False, methods=['post'])
+    @blocking
+    def batch(self, request):
+        batch = RouteBatchSerializer(data=request.data)
+        batch.is_valid(raise_exception=True)
+
+        lanes = [(lane['start_location'], lane['end_location']) for lane in batch.validated_data['lanes']]
+        concurrency = batch.validated_data.get('concurrency', settings.ROUTE_BATCH_CONCURRENCY)
+
+        # One JSON document per lane, in completion order. Django 3.2 would
+        # stream a response from the event loop under ASGI, blocking the
+        # worker until the last lane, so the batch is planned here off the
+        # loop and sent whole.
+        lines = []
+        for index, route, error in plan_batch(lanes, concurrency, Vehicle.from_data(batch.validated_data)):
+            if error is None:
+                result = {'index': index, 'route': RouteSerializer(route).data}
+            else:
+                result = {'index': index, 'error': str(error), 'status': getattr(error, 'status', None)}
+            lines.append(json.dumps(result) + '\n')
+
+        return HttpResponse(''.join(lines), content_type='application/x-ndjson')
+
+    @action(detail=False, methods=['post'])
+    @blocking
+    def optimize(self, request):
+        params = RouteOptimizeSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        try:
+            route, order, solution = optimize_route(data['depot'], data['stops'], Vehicle.from_data(data),
+                                                    closed=data['return_to_depot'],
+                                                    time_budget=data['time_budget'])
+        except DirectionsError as e:
+            raise upstream_exception(e)
+
+        return Response({
+            'route': RouteSerializer(route).data,
+            # Indices into the submitted stops, in visiting order.
+            'order': order,
+            'duration': solution.cost,
+            'nearest_neighbour_duration': solution.initial_cost,
+            'solve_seconds': solution.seconds,
+        }, status=201)
+
+
+class MatrixViewSet(AsyncViewSetMixin, viewsets.ViewSet):
+    @blocking
+    def create(self, request):
+        params = MatrixSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        try:
+            result = matrix_cache.get(data['locations'], Vehicle.from_data(data),
+                                      sources=data.get('sources'), destinations=data.get('destinations'))
+        except DirectionsError as e:
+            raise upstream_exception(e)
 
+        # Rows per source, seconds and metres, null where there is no route.
+        response = {'cached': result.cached, 'fetched': result.fetched}
+        if 'duration' in data['metrics']:
+            response['durations'] = result.durations
+        if 'distance' in data['metrics']:
+            response['distances'] = result.distances
+        return Response(response)
 
-class FeatureCollectionViewSet(viewsets.ModelViewSet):
-    queryset = FeatureCollection.objects.all()
+
+class FeatureCollectionViewSet(AsyncViewSetMixin, viewsets.ModelViewSet):
+    queryset = FeatureCollection.objects.select_related('bbox', 'metadata')
     serializer_class = FeatureCollectionSerializer
+    pagination_class = IdCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        """
+        Feature collections newest first a page at a time, as
+        FeatureCollectionListSerializer. `bbox` keeps collections whose
+        bounding box overlaps it, `created_after` and `created_before` bound
+        the ORS timestamp.
+        """
+        params = FeatureCollectionListQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        fields = params.get('fields')
+
+        # Not the ORS query and engine documents, lists don't show them.
+        collections = (FeatureCollection.objects.select_related('bbox', 'metadata')
+                       .only('id', 'bbox', 'bbox__coordinates', 'metadata', 'metadata__timestamp'))
+        area = list_area(params)
+        if area is not None:
+            collections = collections.filter(bbox__coordinates__bboverlaps=area)
+        if 'created_after' in params:
+            collections = collections.filter(metadata__timestamp__gte=int(params['created_after'].timestamp() * 1000))
+        if 'created_before' in params:
+            collections = collections.filter(metadata__timestamp__lt=int(params['created_before'].timestamp() * 1000))
+
+        page = self.paginate_queryset(with_summary(collections, fields, feature_collection='pk'))
+        return self.get_paginated_response(FeatureCollectionListSerializer(page, many=True, fields=fields).data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        collection = await sync_to_async(self.get_object)()
+
+        params = FeatureCollectionQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        tolerance = params.validated_data.get('tolerance')
+        geometry_format = params.validated_data['geometry_format']
+        # Keyed on the stored level drawn on, finer than the finest is the
+        # full geometry.
+        zoom = rendered_zoom(tolerance) if tolerance is not None else None
+        if zoom is None:
+            tolerance = None
+        variant = ((f'-z{zoom}' if zoom is not None else '')
+                   + (f'-{geometry_format}' if geometry_format != 'geojson' else ''))
+
+        # Stored collections never change, so most polls end here. Each
+        # content coding has an ETag of its own.
+        etag, last_modified = feature_collection_validators(collection, variant)
+        cache_key = (collection.pk, etag)
+        accepted = accepted_encodings(request)
+        coded = coded_etag(etag, feature_collection_payloads.encoding(cache_key, accepted))
+        not_modified = get_conditional_response(
+            request, etag=coded, last_modified=last_modified,
+            response=set_validators(HttpResponse(), coded, last_modified))
+        if not_modified is not None:
+            return not_modified
+
+        payload, encoding = feature_collection_payloads.get(cache_key, accepted)
+        if payload is not None:
+            response = HttpResponse(payload, content_type='application/geo+json')
+            if encoding:
+                response['Content-Encoding'] = encoding
+                etag = coded_etag(etag, encoding)
+        else:
+            # Django 3.2 sends a streamed response from the event loop under
+            # ASGI, where the steps can't be queried. Rendered on the ORM
+            # thread instead, which caches it the same way.
+            def render_payload():
+                return b''.join(feature_collection_payloads.tee(cache_key, timed_chunks(
+                    'render', stream_feature_collection(collection, tolerance=tolerance,
+                                                        geometry_format=geometry_format))))
+
+            response = HttpResponse(await sync_to_async(render_payload)(), content_type='application/geo+json')
+
+        return set_validators(response, etag, last_modified)
+
+
+class RouteJobViewSet(AsyncViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = RouteJob.objects.order_by('-id')
+    serializer_class = RouteJobSerializer
+
+    async def retrieve(self, request, *args, **kwargs):
+        params = RouteJobQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        # Long-poll: check again with growing gaps until the job finishes or
+        # the client's wait runs out, sleeping without holding a thread.
+        job = await sync_to_async(self.get_object)()
+        deadline = time.monotonic() + params.validated_data['wait']
+        interval = 0.1
+        while not job.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, 1.0)
+            await sync_to_async(job.refresh_from_db)()
+
+        return Response(await sync_to_async(lambda: self.get_serializer(job).data)())
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        return Response(queue_stats(settings.ROUTE_JOB_METRICS_WINDOW))
+
+
+class TruckStopViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = TruckStop.objects.all()
+    serializer_class = TruckStopSerializer
+    # Pages of LIST_PAGE_SIZE, never the whole table in one response.
+    pagination_class = IdCursorPagination
+
+    # nearest/bbox answer with rows in this order instead of objects.
+    COMPACT_FIELDS = ['id', 'opis_id', 'name', 'city', 'state', 'fuel_retail_price', 'lon', 'lat']
+
+    def filter_stops(self, params):
+        stops = TruckStop.objects.all()
+        if 'state' in params:
+            stops = stops.filter(state=STATE_CODES[params['state']])
+        if 'max_price' in params:
+            stops = stops.filter(fuel_retail_price__lte=params['max_price'])
+        return stops
+
+    def compact_page(self, request, stops, params, origin=None):
+        limit, offset = params['limit'], params['offset']
+        rows = list(stops.values_list('id', 'opis_id', 'name', 'city', 'state', 'fuel_retail_price',
+                                      'coordinate')[offset:offset + limit + 1])
+
+        fields = self.COMPACT_FIELDS + (['distance'] if origin else [])
+        results = []
+        for stop_id, opis_id, name, city, state, price, coordinate in rows[:limit]:
+            row = [stop_id, opis_id, name, city, STATE_NAMES[state], price, coordinate.x, coordinate.y]
+            if origin:
+                # Miles
+                row.append(round(haversine_miles(origin, coordinate.coords), 2))
+            results.append(row)
+
+        next_url = None
+        if len(rows) > limit:
+            next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+
+        return Response({'fields': fields, 'results': results, 'next': next_url})
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        params = NearestTruckStopQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        # KNN ordering (<->) walks the GiST index on coordinate.
+        origin = Point(params['lon'], params['lat'], srid=4326)
+        stops = self.filter_stops(params).order_by(GeometryDistance('coordinate', origin))
+
+        return self.compact_page(request, stops, params, origin=origin.coords)
+
+    @action(detail=False, methods=['get'])
+    def bbox(self, request):
+        params = BBoxTruckStopQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        area = Polygon.from_bbox(params['bbox'])
+        area.srid = 4326
+        stops = (self.filter_stops(params)
+                 .filter(coordinate__contained=area)
+                 .order_by('fuel_retail_price', 'id'))
+
+        return self.compact_page(request, stops, params)
+
+
+def tile(request, z, x, y):
+    if not valid_tile(z, x, y):
+        raise Http404('No such tile.')
+
+    # Routes and stops change all the time, revalidate after TILE_MAX_AGE.
+    current = generations(z, x, y)
+    key = (current, z, x, y)
+    accepted = accepted_encodings(request)
+    etag = f'"tile-{z}-{x}-{y}-{"-".join(map(str, current))}"'
+    headers = {'ETag': coded_etag(etag, tile_payloads.encoding(key, accepted)),
+               'Cache-Control': f'public, max-age={settings.TILE_MAX_AGE}', 'Vary': 'Accept-Encoding'}
+    not_modified = get_conditional_response(request, etag=headers['ETag'], response=HttpResponse(headers=headers))
+    if not_modified is not None:
+        return not_modified
+
+    payload, encoding = tile_payloads.get(key, accepted)
+    if payload is None:
+        with phase('render'):
+            payload = render_tile(z, x, y)
+        tile_payloads.store(key, payload)
+
+    headers['ETag'] = coded_etag(etag, encoding)
+    response = HttpResponse(payload, content_type='application/vnd.mapbox-vector-tile', headers=headers)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+# Cache stats exported as gauges, per process like the caches themselves.
+CACHES = {
+    'route': route_cache,
+    'matrix': matrix_cache,
+    'feature_collection_payload': feature_collection_payloads,
+    'tile_payload': tile_payloads,
+}
 
-    def retrieve(self, request, *args, **kwargs):
-        collection = self.get_object()
-        features = collection.feature_set.prefetch_related('segment_set').all()
-        
-        for feature in features:
-            segments = feature.segment_set.prefetch_related('step_set').all()
 
-            for segment in segments:
-                print(segment.step_set.all())
+def metrics(request):
+    gauges = []
+    for cache, instance in CACHES.items():
+        for stat, value in instance.stats().items():
+            help = f'{cache.replace("_", " ").capitalize()} cache {stat.replace("_", " ")}.'
+            gauges.append((f'routing_{cache}_cache_{stat}', help, {}, value))
 
-        geojson_features = serialize(
-            'geojson', features,
-            geometry_field='geometry',
-            fields=('segment_set', 'summary', 'way_points')
-        )
-        geojson_data = json.loads(geojson_features)
+    client = directions._client
+    if client is not None:
+        gauges.append(('routing_upstream_circuit_open', 'Whether calls to OpenRouteService are being rejected.',
+                       {}, int(client.breaker.state != client.breaker.CLOSED)))
+        gauges.append(('routing_upstream_retry_budget', 'Retries OpenRouteService calls may still spend.',
+                       {}, client.budget.balance))
 
-        return Response(geojson_data)
+    return HttpResponse(registry.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -24,9 +24,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.environ.get("SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DEBUG=true for local development only.
+DEBUG = os.environ.get('DEBUG', 'false').lower() in ('1', 'true', 'yes')
 
-ALLOWED_HOSTS = []
+# Comma separated host names the API is served on.
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+                 if host.strip()]
 
 AUTH_USER_MODEL = "user.User" 
 
@@ -47,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times everything below it.
+    'routing.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,9 +93,22 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD"),
         "HOST": os.environ.get("SQL_HOST"),
         "PORT": os.environ.get("SQL_PORT"),
+        # Seconds a connection is kept for the next request. Under ASGI each
+        # worker runs ORM work on one thread and so reuses one connection.
+        # Set it to 0 behind a transaction pooler such as PgBouncer, along
+        # with SQL_DISABLE_SERVER_SIDE_CURSORS.
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", 60)),
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("SQL_DISABLE_SERVER_SIDE_CURSORS", "false").lower()
+        in ("1", "true", "yes"),
     }
 }
 
+# Actions blocking on the routing backend or slow queries (optimize,
+# matrix, reroute, batch, fuel plans, truck stops along a route) run under
+# ASGI on up to BLOCKING_VIEW_THREADS threads per worker, each with its own
+# connection, beside the one shared by the rest.
+BLOCKING_VIEW_THREADS = int(os.environ.get('BLOCKING_VIEW_THREADS', 16))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -132,3 +150,186 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Route cache
+# Start/end coordinates are snapped to a grid of ROUTE_CACHE_GRID degrees
+# (0.001 is roughly 100m) before being used as a cache key.
+
+ROUTE_CACHE_GRID = float(os.environ.get('ROUTE_CACHE_GRID', 0.001))
+ROUTE_CACHE_TTL = int(os.environ.get('ROUTE_CACHE_TTL', 60 * 60 * 24))
+ROUTE_CACHE_MAX_ENTRIES = int(os.environ.get('ROUTE_CACHE_MAX_ENTRIES', 1024))
+ROUTE_CACHE_DB_MAX_ENTRIES = int(os.environ.get('ROUTE_CACHE_DB_MAX_ENTRIES', 100000))
+# Share of the TTL between marking an entry used on hits from a worker's own
+# tier, and the share of cache misses that also trim the table.
+ROUTE_CACHE_TOUCH_FRACTION = float(os.environ.get('ROUTE_CACHE_TOUCH_FRACTION', 0.1))
+ROUTE_CACHE_EVICT_PROBABILITY = float(os.environ.get('ROUTE_CACHE_EVICT_PROBABILITY', 0.01))
+
+
+# OpenRouteService client
+# OPENROUTE_RATE_LIMIT is in requests per minute, match it to the ORS plan.
+
+OPENROUTE_BASE_URL = os.environ.get('OPENROUTE_BASE_URL', 'https://api.openrouteservice.org')
+OPENROUTE_API_KEY = os.environ.get('OPENROUTE_API_KEY')
+OPENROUTE_CONNECT_TIMEOUT = float(os.environ.get('OPENROUTE_CONNECT_TIMEOUT', 3.05))
+OPENROUTE_READ_TIMEOUT = float(os.environ.get('OPENROUTE_READ_TIMEOUT', 30))
+OPENROUTE_MAX_RETRIES = int(os.environ.get('OPENROUTE_MAX_RETRIES', 3))
+OPENROUTE_RATE_LIMIT = float(os.environ.get('OPENROUTE_RATE_LIMIT', 40))
+OPENROUTE_RATE_BURST = int(os.environ.get('OPENROUTE_RATE_BURST', 5))
+OPENROUTE_POOL_SIZE = int(os.environ.get('OPENROUTE_POOL_SIZE', 20))
+# The geocoder (OPIS imports) has a quota of its own, also per minute.
+OPENROUTE_GEOCODE_RATE_LIMIT = float(os.environ.get('OPENROUTE_GEOCODE_RATE_LIMIT', 100))
+OPENROUTE_GEOCODE_RATE_BURST = int(os.environ.get('OPENROUTE_GEOCODE_RATE_BURST', 5))
+# Per request limits of the ORS plan: waypoints in one route and
+# sources x destinations in one matrix.
+OPENROUTE_MAX_WAYPOINTS = int(os.environ.get('OPENROUTE_MAX_WAYPOINTS', 50))
+OPENROUTE_MATRIX_MAX_ELEMENTS = int(os.environ.get('OPENROUTE_MATRIX_MAX_ELEMENTS', 3500))
+
+
+# Retention
+# Feature collections planned more than ROUTE_RETENTION_DAYS ago that no
+# route created since uses are purged by `manage.py purge_routes`, with
+# their routes, ROUTE_PURGE_BATCH_SIZE collections per transaction. With
+# the step table partitioned (`manage.py partition_steps`) each partition
+# covers STEP_PARTITION_ROWS step ids.
+
+ROUTE_RETENTION_DAYS = int(os.environ.get('ROUTE_RETENTION_DAYS', 90))
+ROUTE_PURGE_BATCH_SIZE = int(os.environ.get('ROUTE_PURGE_BATCH_SIZE', 200))
+STEP_PARTITION_ROWS = int(os.environ.get('STEP_PARTITION_ROWS', 10000000))
+STEP_PARTITIONS_AHEAD = int(os.environ.get('STEP_PARTITIONS_AHEAD', 2))
+
+
+# Batch route planning
+
+ROUTE_BATCH_CONCURRENCY = int(os.environ.get('ROUTE_BATCH_CONCURRENCY', 8))
+ROUTE_BATCH_MAX_CONCURRENCY = int(os.environ.get('ROUTE_BATCH_MAX_CONCURRENCY', 64))
+ROUTE_BATCH_MAX_LANES = int(os.environ.get('ROUTE_BATCH_MAX_LANES', 10000))
+
+
+# Multi-stop route optimisation
+
+ROUTE_OPTIMIZE_MAX_STOPS = int(os.environ.get('ROUTE_OPTIMIZE_MAX_STOPS', 200))
+ROUTE_OPTIMIZE_TIME_BUDGET = float(os.environ.get('ROUTE_OPTIMIZE_TIME_BUDGET', 1.0))
+ROUTE_OPTIMIZE_MAX_TIME_BUDGET = float(os.environ.get('ROUTE_OPTIMIZE_MAX_TIME_BUDGET', 10.0))
+
+
+# Re-routing
+# A position within REROUTE_TOLERANCE metres of a route is on it and
+# answered from the stored route, further off the rest of the trip is
+# planned again.
+
+REROUTE_TOLERANCE = float(os.environ.get('REROUTE_TOLERANCE', 50))
+REROUTE_MAX_TOLERANCE = float(os.environ.get('REROUTE_MAX_TOLERANCE', 1000))
+
+
+# Distance matrix
+# Pairs are cached in the database on points snapped to ROUTE_CACHE_GRID.
+
+MATRIX_MAX_LOCATIONS = int(os.environ.get('MATRIX_MAX_LOCATIONS', 500))
+MATRIX_CACHE_TTL = int(os.environ.get('MATRIX_CACHE_TTL', 60 * 60 * 24 * 7))
+
+
+# Feature collection HTTP caching
+# Rendered GeoJSON is kept in memory per process, up to
+# FEATURE_COLLECTION_CACHE_MAX_BYTES in total. Brotli variants need the
+# `brotli` package.
+
+FEATURE_COLLECTION_MAX_AGE = int(os.environ.get('FEATURE_COLLECTION_MAX_AGE', 60 * 60 * 24))
+FEATURE_COLLECTION_CACHE_MAX_BYTES = int(os.environ.get('FEATURE_COLLECTION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+FEATURE_COLLECTION_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('FEATURE_COLLECTION_CACHE_MAX_ENTRY_BYTES', 16 * 1024 * 1024))
+FEATURE_COLLECTION_CACHE_ENCODINGS = os.environ.get('FEATURE_COLLECTION_CACHE_ENCODINGS', 'gzip,br').split(',')
+
+
+# Geometry levels of detail
+# Route geometries are also stored simplified for each zoom in
+# GEOMETRY_LOD_ZOOMS, to within GEOMETRY_LOD_PIXELS pixels. A level is only
+# kept if it has at most GEOMETRY_LOD_MAX_RATIO of the vertices of the next
+# finer one.
+
+GEOMETRY_LOD_ZOOMS = [int(zoom) for zoom in os.environ.get('GEOMETRY_LOD_ZOOMS', '5,8,11,14').split(',')]
+GEOMETRY_LOD_PIXELS = float(os.environ.get('GEOMETRY_LOD_PIXELS', 0.5))
+GEOMETRY_LOD_MAX_RATIO = float(os.environ.get('GEOMETRY_LOD_MAX_RATIO', 0.7))
+
+
+# Vector tiles
+# Tiles are cached per process under the current generation of each layer,
+# which moves on whenever routes or truck stops change. Routes have a
+# generation per tile up to TILE_GENERATION_ZOOM, deeper tiles share their
+# ancestor's, so a new route only invalidates the tiles it crosses. At most
+# TILE_MAX_ROUTES routes, the newest, are drawn in one tile.
+
+TILE_MAX_ZOOM = int(os.environ.get('TILE_MAX_ZOOM', 22))
+TILE_EXTENT = int(os.environ.get('TILE_EXTENT', 4096))
+TILE_BUFFER = int(os.environ.get('TILE_BUFFER', 64))
+TILE_MAX_ROUTES = int(os.environ.get('TILE_MAX_ROUTES', 2000))
+TILE_GENERATION_ZOOM = int(os.environ.get('TILE_GENERATION_ZOOM', 6))
+TILE_MAX_AGE = int(os.environ.get('TILE_MAX_AGE', 60))
+TILE_CACHE_MAX_BYTES = int(os.environ.get('TILE_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+
+
+# Lists
+# Routes and feature collections are listed newest first a page at a time,
+# clients pick the page size with ?limit= up to LIST_MAX_PAGE_SIZE.
+
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 50))
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', 500))
+
+
+# Truck stop queries
+
+TRUCK_STOP_MAX_PAGE_SIZE = int(os.environ.get('TRUCK_STOP_MAX_PAGE_SIZE', 200))
+
+
+# Truck stop corridors
+# Stops within TRUCK_STOP_CORRIDOR_MILES of a route are stored with it once
+# it is committed and kept current as stops are added or move. Wider
+# corridors are searched for on every request. Routes stored before are built with
+# `manage.py build_corridors`.
+
+TRUCK_STOP_CORRIDOR_MILES = float(os.environ.get('TRUCK_STOP_CORRIDOR_MILES', 10))
+
+
+# Routing backend
+# "ors" calls OpenRouteService, "local" routes in process on the road graph
+# at ROAD_GRAPH_PATH (see `manage.py build_road_graph`). Truck routes from
+# ORS are checked against the restriction index at ROAD_RESTRICTIONS_PATH
+# when it is set.
+
+ROUTING_BACKEND = os.environ.get('ROUTING_BACKEND', 'ors')
+ROAD_GRAPH_PATH = os.environ.get('ROAD_GRAPH_PATH')
+ROAD_RESTRICTIONS_PATH = os.environ.get('ROAD_RESTRICTIONS_PATH')
+
+
+# Route jobs
+# With ROUTE_JOBS_ASYNC every POST /routes/ is queued and answered with 202,
+# otherwise only requests sent with "Prefer: respond-async" are. Jobs are
+# run by `manage.py route_worker`.
+
+ROUTE_JOBS_ASYNC = os.environ.get('ROUTE_JOBS_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+ROUTE_JOB_CONCURRENCY = int(os.environ.get('ROUTE_JOB_CONCURRENCY', 8))
+ROUTE_JOB_POLL_INTERVAL = float(os.environ.get('ROUTE_JOB_POLL_INTERVAL', 0.5))
+ROUTE_JOB_TIMEOUT = int(os.environ.get('ROUTE_JOB_TIMEOUT', 300))
+ROUTE_JOB_MAX_ATTEMPTS = int(os.environ.get('ROUTE_JOB_MAX_ATTEMPTS', 3))
+ROUTE_JOB_MAX_WAIT = float(os.environ.get('ROUTE_JOB_MAX_WAIT', 20))
+ROUTE_JOB_METRICS_WINDOW = int(os.environ.get('ROUTE_JOB_METRICS_WINDOW', 15 * 60))
+
+
+# Request metrics
+# Prometheus metrics are served per process at /api/routing/metrics.
+# Requests taking SLOW_REQUEST_THRESHOLD milliseconds or more are logged
+# with their breakdown by phase to SLOW_REQUEST_LOG, or stderr without it.
+
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1000))
+SLOW_REQUEST_LOG = os.environ.get('SLOW_REQUEST_LOG')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_requests': ({'class': 'logging.FileHandler', 'filename': SLOW_REQUEST_LOG} if SLOW_REQUEST_LOG
+                          else {'class': 'logging.StreamHandler'}),
+    },
+    'loggers': {
+        'routing.slow_requests': {'handlers': ['slow_requests'], 'level': 'WARNING', 'propagate': False},
+    },
+}